@@ -0,0 +1,147 @@
+"""
+Admission control for player joins.
+
+Each join runs token verification and several storage calls, so after a
+restart, when every client reconnects at once, running them all together
+overloads the server. The controller lets at most max_concurrent joins run at
+once and keeps joined sessions plus running joins under max_players. Other
+clients wait in a FIFO queue (up to max_queue) and are admitted in order as
+joins finish or players leave.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+ADMITTED, QUEUED, FULL, DUPLICATE = 'admitted', 'queued', 'full', 'duplicate'
+
+# Tunables accepted by configure()
+TUNABLES = ('max_concurrent', 'max_players', 'max_queue')
+
+
+class AdmissionController:
+    """Tracks running joins, joined sessions and the join queue by socket ID"""
+
+    def __init__(self, max_concurrent=16, max_players=500, max_queue=5000):
+        """
+        :param max_concurrent: Join pipelines allowed to run at once
+        :param max_players: Joined sessions plus running joins allowed at once
+        :param max_queue: Clients allowed to wait; more are turned away
+        """
+        self.max_concurrent = max_concurrent
+        self.max_players = max_players
+        self.max_queue = max_queue
+        self.in_flight = set()
+        self.sessions = set()
+        self.queue = OrderedDict()  # sid -> (join payload, queued_at)
+        self.sent_positions = {}    # sid -> queue position last reported to the client
+        self.lock = threading.Lock()
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected_full': 0, 'failed': 0, 'max_wait_seconds': 0.0}
+
+    def _has_capacity(self):
+        return (len(self.in_flight) < self.max_concurrent and
+                len(self.in_flight) + len(self.sessions) < self.max_players)
+
+    def request(self, sid, data):
+        """
+        A client asked to join
+
+        :return: (ADMITTED, None) if the join may start now, (QUEUED, position) with a
+                 1-based queue position, (FULL, None) if the queue is full, or
+                 (DUPLICATE, position) if this socket is already joining or queued
+        """
+        with self.lock:
+            if sid in self.in_flight:
+                return DUPLICATE, None
+            if sid in self.queue:
+                # Keep its place but use the latest payload
+                self.queue[sid] = (data, self.queue[sid][1])
+                return DUPLICATE, list(self.queue).index(sid) + 1
+            # Joining again from a joined socket takes a fresh slot
+            self.sessions.discard(sid)
+            if not self.queue and self._has_capacity():
+                self.in_flight.add(sid)
+                self.stats['admitted'] += 1
+                return ADMITTED, None
+            if len(self.queue) >= self.max_queue:
+                self.stats['rejected_full'] += 1
+                return FULL, None
+            self.queue[sid] = (data, time.monotonic())
+            self.sent_positions[sid] = len(self.queue)
+            self.stats['queued'] += 1
+            return QUEUED, len(self.queue)
+
+    def next_admission(self):
+        """
+        Admit the client at the head of the queue if there is capacity
+
+        :return: (sid, join payload) to start, or None
+        """
+        with self.lock:
+            if not self.queue or not self._has_capacity():
+                return None
+            sid, (data, queued_at) = self.queue.popitem(last=False)
+            self.sent_positions.pop(sid, None)
+            self.in_flight.add(sid)
+            self.stats['admitted'] += 1
+            self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], time.monotonic() - queued_at)
+            return sid, data
+
+    def finish(self, sid, joined):
+        """A join pipeline ended; joined is False if it failed or was refused"""
+        with self.lock:
+            if sid not in self.in_flight:
+                return
+            self.in_flight.discard(sid)
+            if joined:
+                self.sessions.add(sid)
+            else:
+                self.stats['failed'] += 1
+
+    def leave(self, sid):
+        """A socket disconnected, wherever it was"""
+        with self.lock:
+            self.in_flight.discard(sid)
+            self.sessions.discard(sid)
+            self.queue.pop(sid, None)
+            self.sent_positions.pop(sid, None)
+
+    def position_updates(self):
+        """
+        Queue positions that changed since they were last reported
+
+        :return: List of (sid, position, queue_length)
+        """
+        with self.lock:
+            length = len(self.queue)
+            updates = []
+            for position, sid in enumerate(self.queue, start=1):
+                if self.sent_positions.get(sid) != position:
+                    self.sent_positions[sid] = position
+                    updates.append((sid, position, length))
+            return updates
+
+    def configure(self, **tunables):
+        """Change tunables at runtime (see TUNABLES); returns the resulting settings"""
+        unknown = set(tunables) - set(TUNABLES)
+        if unknown:
+            raise ValueError(f"Unknown tunables: {', '.join(sorted(unknown))}")
+        for name, value in tunables.items():
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{name} must be a non-negative integer")
+        with self.lock:
+            for name, value in tunables.items():
+                setattr(self, name, value)
+        return self.settings()
+
+    def settings(self):
+        return {name: getattr(self, name) for name in TUNABLES}
+
+    def metrics(self):
+        with self.lock:
+            return {
+                **self.stats,
+                **self.settings(),
+                'in_flight': len(self.in_flight),
+                'sessions': len(self.sessions),
+                'queue_length': len(self.queue)
+            }
@@ -1,16 +1,27 @@
 import os
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask import Flask, request, jsonify, send_from_directory, Response
+from flask_socketio import SocketIO
 import json
 import logging
+import math
 import time
-from datetime import datetime
 import firebase_admin
-from firebase_admin import credentials, firestore, auth as firebase_auth
+from firebase_admin import credentials, firestore
 import firestore_models  # Import our new Firestore models
-from collections import defaultdict
+import game_protocol
+import leaderboards
+import schemas
+from game_protocol import players, islands
 import mimetypes
+import atexit
+import signal
+import sys
+import threading
+from functools import wraps
+from event_recorder import EventRecorder
+from profiler import EventCpuTimer, SamplingProfiler
+from storage_pool import StoragePool, StorageSaturated, StorageTimeout
 
 # Load environment variables from .env file
 load_dotenv()
@@ -49,19 +60,20 @@ firestore_models.init_firestore(db)
 # Set up Socket.IO
 socketio = SocketIO(app, cors_allowed_origins=os.environ.get('SOCKETIO_CORS_ALLOWED_ORIGINS', '*'))
 
-# Keep a session cache for quick access
-players = {}
-islands = {}
-
-# Add this near your other global variables
-last_db_update = defaultdict(float)  # Track last database update time for each player
-DB_UPDATE_INTERVAL = 2  # seconds between database updates
-# Add new distance threshold constant and tracking dictionary
-MIN_POSITION_UPDATE_DISTANCE = 20  # minimum distance in units to trigger a database update
-last_db_positions = {}  # Track last database position for each player
-
-# Add this near your other global variables (at the top of the file)
-socket_to_user_map = {}
+# Blocking Firestore calls made by socket handlers run on this bounded pool so
+# a slow storage call never holds up movement processing. REST endpoints wait
+# for their calls with socketio.sleep so they don't block the eventlet hub.
+storage = StoragePool(
+    max_workers=int(os.environ.get('STORAGE_POOL_SIZE', 8)),
+    max_queue=int(os.environ.get('STORAGE_QUEUE_LIMIT', 256)),
+    timeout=float(os.environ.get('STORAGE_TIMEOUT', 5)),
+    sleep=socketio.sleep
+)
+# Completion callbacks and snapshot listener changes emit and touch the game
+# caches, so they are queued and run on the server's loop (the eventlet hub,
+# which other threads must not emit into) by run_storage_callbacks below
+storage.queue_callbacks()
+STORAGE_CALLBACK_INTERVAL = float(os.environ.get('STORAGE_CALLBACK_INTERVAL', 0.005))
 
 # Add these MIME type registrations after your existing imports
 # Register GLB and GLTF MIME types
@@ -72,556 +84,90 @@ mimetypes.add_type('model/gltf+json', '.gltf')
 STATIC_FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 os.makedirs(STATIC_FILES_DIR, exist_ok=True)
 
-# Load data from Firestore on startup
-def load_data_from_firestore():
-    # Load players
-    db_players = firestore_models.Player.get_all()
-    for player in db_players:
-        # Set all players to inactive on server start
-        if player.get('active', False):
-            firestore_models.Player.update(player['id'], active=False)
-            player['active'] = False
-        players[player['id']] = player
+class FlaskSocketIOTransport:
+    """Delivers protocol messages through Flask-SocketIO"""
     
-    # Load islands
-    db_islands = firestore_models.Island.get_all()
-    for island in db_islands:
-        islands[island['id']] = island
+    def emit(self, event, data, to=None, skip_sid=None):
+        socketio.emit(event, data, to=to, skip_sid=skip_sid)
     
-    logger.info(f"Loaded {len(players)} players and {len(islands)} islands from Firestore")
+    def disconnect(self, sid):
+        socketio.server.disconnect(sid)
 
-# Call the function during app startup
-load_data_from_firestore()
+    def enter_room(self, sid, room):
+        socketio.server.enter_room(sid, room, namespace='/')
 
-# Add this new function for token verification
-def verify_firebase_token(token):
-    """Verify Firebase token and return the UID if valid"""
-    try:
-        if not token:
-            logger.warning("No token provided for verification")
-            return None
-            
-        logger.info("Attempting to verify Firebase token")
-        
-        # Verify the token
-        decoded_token = firebase_auth.verify_id_token(token)
-        
-        # Get user UID from the token
-        uid = decoded_token['uid']
-        logger.info(f"Successfully verified Firebase token for user: {uid}")
-        return uid
-    except Exception as e:
-        logger.error(f"Error verifying Firebase token: {e}")
-        logger.exception("Token verification exception details:")  # This logs the full stack trace
-        return None
-
-# Socket.IO event handlers
+game_protocol.init(FlaskSocketIOTransport(), storage)
+
+# Call the function during app startup
+game_protocol.load_data_from_firestore()
+game_protocol.start_cache_listeners()
+
+# Admin endpoints require this token in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+def require_admin(view):
+    """Reject requests to an admin endpoint without a valid admin token"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# Record inbound events for replay (see replay_events.py)
+SOCKET_RECORD_PATH = os.environ.get('SOCKET_RECORD_PATH')
+event_recorder = None
+if SOCKET_RECORD_PATH:
+    record_events = [e.strip() for e in os.environ.get('SOCKET_RECORD_EVENTS', '').split(',') if e.strip()]
+    event_recorder = EventRecorder(SOCKET_RECORD_PATH, events=record_events or None)
+    game_protocol.event_middlewares.append(event_recorder)
+    atexit.register(event_recorder.close)
+    logger.info(f"Recording socket events to {SOCKET_RECORD_PATH}")
+
+# Socket.IO event handlers live in game_protocol; route every event through it
 @socketio.on('connect')
-def handle_connect():
-    logger.info(f"Client connected: {request.sid}")
+def handle_connect(auth=None):
+    game_protocol.handle_connect(request.sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    logger.error(f"Client disconnected: {request.sid}")
-    
-    # Look up the player ID from our mapping
-    player_id = socket_to_user_map.pop(request.sid, None)
-    logger.error(f'request.sid: {request.sid}')
-    logger.error(f"Socket to user map: {socket_to_user_map}")
+    game_protocol.handle_disconnect(request.sid)
 
-    logger.error(f"Player ID: {player_id}")
-    logger.error(f"Players: {players}")
-    
-    # If this was a player, mark them as inactive
-    if player_id and player_id in players:
-        # Update player in Firestore and cache
-        firestore_models.Player.update(player_id, active=False, last_update=time.time())
-        if player_id in players:
-            players[player_id]['active'] = False
-            
-            # Broadcast that the player disconnected
-            emit('player_disconnected', {'id': player_id}, broadcast=True)
-            logger.error(f"Player {player_id} marked as inactive after disconnect")
-
-@socketio.on('player_join')
-def handle_player_join(data):
-    # Get the Firebase token and UID from the request
-    firebase_token = data.get('firebaseToken')
-    claimed_firebase_uid = data.get('player_id')
-    # ONLY proceed with database storage if Firebase authentication is provided and valid
-    if firebase_token and claimed_firebase_uid:
-        verified_uid = verify_firebase_token(firebase_token)
-        
-        if verified_uid and verified_uid == claimed_firebase_uid:
-            logger.info(f"Authentication successful for Firebase user: {verified_uid}")
-            # Use the Firebase UID directly without the prefix
-            player_id = verified_uid
-            
-            # Store player_id directly on request for simplicity
-            request.player_id = player_id
-            
-            # Store in our socket-to-user mapping
-            logger.info(f"Mapped socket {request.sid} to user {player_id}")
-            
-            # Now proceed with database operations
-            docid = "firebase_" + player_id
-
-            socket_to_user_map[request.sid] = docid
-
-            existing_player = firestore_models.Player.get(docid)
-            
-            if existing_player:
-                # Update the existing player in database
-                player_data = {
-                    'active': True,
-                    'last_update': time.time(),
-                }
-                
-                # Update in Firestore
-                firestore_models.Player.update(docid, **player_data)
-                
-                # Update cache
-                players[docid] = {**existing_player, **player_data}
-            else:
-                # Create new player entry with stats
-                player_data = {
-                    'name': data.get('name', f'Sailor {player_id[:4]}'),
-                    'color': data.get('color', {'r': 0.3, 'g': 0.6, 'b': 0.8}),
-                    'position': data.get('position', {'x': 0, 'y': 0, 'z': 0}),
-                    'rotation': data.get('rotation', 0),
-                    'mode': data.get('mode', 'boat'),
-                    'last_update': time.time(),
-                    'fishCount': 0,
-                    'monsterKills': 0,
-                    'money': 0,
-                    'active': True,  # Mark as active when they join
-                    'firebase_uid': verified_uid
-                }
-                
-                # Create player in Firestore and cache the result
-                player = firestore_models.Player.create(docid, **player_data)
-                players[docid] = player
-
-
-             # Get existing player from Firestore before sending connection response
-            
-            auth_player_data = existing_player if existing_player else player_data
-            
-            emit('connection_response', auth_player_data)
-
-            # Broadcast to all clients that a new player joined
-            emit('player_joined', players[docid], broadcast=True)
-        else:
-            logger.warning(f"Firebase token verification failed. No data will be stored.")
-            emit('auth_error', {'message': 'Authentication failed'})
-            return
-    else:
-        logger.warning(f"No Firebase authentication provided. No data will be stored.")
-        emit('auth_required', {'message': 'Firebase authentication required'})
-        return
-    
-    # Send game data regardless of auth status (read-only operations)
-    # Send existing ACTIVE players to the new player
-    active_players = [p for p in players.values() if p.get('active', False)]
-    emit('all_players', active_players)
-    
-    # Send all islands to the new player
-    emit('all_islands', list(islands.values()))
-    
-    # Send recent messages to the new player
-    recent_messages = firestore_models.Message.get_recent_messages(limit=20)
-    emit('chat_history', recent_messages)
-    
-    # Send leaderboard data to the new player
-    emit('leaderboard_update', firestore_models.Player.get_combined_leaderboard())
-
-@socketio.on('update_position')
-def handle_position_update(data):
-    """
-    Handle frequent position updates from client.
-    Expects: { x, y, z, rotation, mode, player_id }
-    """
-    player_id = data.get('player_id')
-    if not player_id:
-        # Also check request if not explicitly provided
-        player_id = data.get('player_id', None)
-        if not player_id:
-            logger.warning("Missing player ID in position update. Ignoring.")
-            return
-    
+def register_game_events():
+    """Register every game_protocol event handler with Flask-SocketIO"""
+    for event in game_protocol.EVENT_HANDLERS:
+        def handler(*args, event=event):
+            return game_protocol.dispatch(event, request.sid, *args)
+        socketio.on_event(event, handler)
 
-    # Extract individual position components
-    x = data.get('x')
-    y = data.get('y')
-    z = data.get('z')
-    rotation = data.get('rotation')
-    mode = data.get('mode')
-    
-    # Validate required fields
-    if x is None or z is None:  # y can be 0, so check None specifically
-        logger.warning("Missing position data in update. Ignoring.")
-        return
-    
-    # Ensure player exists in cache
-    if player_id not in players:
-        logger.warning(f"Player ID {player_id} not found in cache. Ignoring position update.")
-        return
-    
-    current_time = time.time()
-    
-    # Construct position object for storage
-    position = {
-        'x': x,
-        'y': y,
-        'z': z
-    }
-    
-    # Always update in-memory cache immediately for responsive gameplay
-    players[player_id]['position'] = position
-    if rotation is not None:
-        players[player_id]['rotation'] = rotation
-    if mode is not None:
-        players[player_id]['mode'] = mode
-    players[player_id]['last_update'] = current_time
-    
-    # Calculate distance from last stored database position (if available)
-    should_update_db = False
-    if player_id not in last_db_positions:
-        # First time seeing this player, always update
-        should_update_db = True
-    else:
-        # Calculate distance between current and last stored position
-        last_pos = last_db_positions[player_id]
-        dx = x - last_pos['x']
-        dy = y - last_pos['y']
-        dz = z - last_pos['z']
-        distance = (dx*dx + dy*dy + dz*dz) ** 0.5  # Euclidean distance
-
-        # logger.info(f"Distance between current and last stored position: {distance}")
-        
-        # Update if moved more than threshold distance
-        if distance > MIN_POSITION_UPDATE_DISTANCE:
-            should_update_db = True
-    
-    # Throttle database updates to reduce Firestore writes
-    if current_time - last_db_update.get(player_id, 0) > DB_UPDATE_INTERVAL and should_update_db:
-        last_db_update[player_id] = current_time
-        last_db_positions[player_id] = position  # Update the last known DB position
-        
-        # Build update data with only necessary fields
-        update_data = {
-            'position': position,
-            'last_update': current_time
-        }
-        if rotation is not None:
-            update_data['rotation'] = rotation
-        if mode is not None:
-            update_data['mode'] = mode
-        
-        # Update in Firestore
-        firestore_models.Player.update(player_id, **update_data)
-        logger.debug(f"Updated player {player_id} position in Firestore (distance threshold)")
-    
-    # Broadcast to all other clients (not back to sender)
-    emit_data = {
-        'id': player_id,
-        'position': position
-    }
-    if rotation is not None:
-        emit_data['rotation'] = rotation
-    if mode is not None:
-        emit_data['mode'] = mode
-        
-    emit('player_moved', emit_data, broadcast=True, include_self=False)
-
-@socketio.on('player_action')
-def handle_player_action(data):
-    # Get both action and type fields (to handle client inconsistencies)
-    action_type = data.get('action') or data.get('type')
-    
-    # Simplified: Just use the player_id from the current request
-    player_id = data.get('player_id')
+register_game_events()
 
-    logger.info(f"Player action data: {data}, player_id: {player_id}")
-    
-    # Check if player_id is available and valid
-    if not player_id or not player_id.startswith('firebase_'):
-        logger.warning(f"Missing or invalid player ID. Ignoring action.")
-        return
-    
-    # Ensure player exists
-    if player_id not in players:
-        logger.warning(f"Player ID {player_id} not found in cache. Ignoring action.")
-        return
-    
-    if action_type == 'fish_caught':
-        # Increment fish count
-        if 'fishCount' not in players[player_id]:
-            players[player_id]['fishCount'] = 0
-        players[player_id]['fishCount'] += 1
-        
-        # Update player in Firestore
-        firestore_models.Player.update(player_id, 
-                                     fishCount=players[player_id]['fishCount'])
-        
-        # Broadcast achievement to all players
-        emit('player_achievement', {
-            'id': player_id,
-            'name': players[player_id]['name'],
-            'achievement': 'Caught a fish!',
-            'fishCount': players[player_id]['fishCount']
-        }, broadcast=True)
-        
-        # Update leaderboard
-        emit('leaderboard_update', 
-             firestore_models.Player.get_combined_leaderboard(), 
-             broadcast=True)
-    
-    elif action_type == 'monster_killed':
-        # Increment monster kills
-        if 'monsterKills' not in players[player_id]:
-            players[player_id]['monsterKills'] = 0
-        players[player_id]['monsterKills'] += 1
-        
-        # Update player in Firestore
-        firestore_models.Player.update(player_id, 
-                                     monsterKills=players[player_id]['monsterKills'])
-        
-        # Broadcast achievement to all players
-        emit('player_achievement', {
-            'id': player_id,
-            'name': players[player_id]['name'],
-            'achievement': 'Defeated a sea monster!',
-            'monsterKills': players[player_id]['monsterKills']
-        }, broadcast=True)
-        
-        # Update leaderboard
-        emit('leaderboard_update', 
-             firestore_models.Player.get_combined_leaderboard(), 
-             broadcast=True)
-    
-    elif action_type == 'money_earned':
-        amount = data.get('amount', 0)
-        
-        # Add money
-        if 'money' not in players[player_id]:
-            players[player_id]['money'] = 0
-        players[player_id]['money'] += amount
-        
-        # Update player in Firestore
-        firestore_models.Player.update(player_id, 
-                                     money=players[player_id]['money'])
-        
-        # Broadcast achievement to all players
-        emit('player_achievement', {
-            'id': player_id,
-            'name': players[player_id]['name'],
-            'achievement': f'Earned {amount} coins!',
-            'money': players[player_id]['money']
-        }, broadcast=True)
-        
-        # Update leaderboard
-        emit('leaderboard_update', 
-             firestore_models.Player.get_combined_leaderboard(), 
-             broadcast=True)
-
-@socketio.on('send_message')
-def handle_chat_message(data):
-    # Log the entire data payload
-    print(f"=====================================")
-    logger.error(f"CHAT DEBUG: Message data received: {data}")
-    logger.error(f"CHAT DEBUG: Message data received: {data}")
-    
-    # Handle different message formats
-    if isinstance(data, str):
-        print(f"CHAT DEBUG: Data is a string, converting to object")
-        content = data.strip()
-        player_id = None
-        player_name = None
-    else:
-        content = data.get('content', '').strip()
-        player_id = data.get('player_id', None)
-        player_name = data.get('player_name', None)
+# Relay movement, flush islands and admit queued joins on a fixed tick (see game_protocol.background_tick)
+socketio.start_background_task(game_protocol.run_relay_loop, socketio.sleep)
 
-    print(f"CHAT DEBUG: Content: '{content}'")
-    print(f"CHAT DEBUG: Player ID: '{player_id}'")
-    print(f"CHAT DEBUG: Player Name: '{player_name}'")
-    
-    # Validate message
-    if not content or len(content) > 500:
-        logger.warning(f"CHAT DEBUG: Invalid message content (empty or too long): '{content}'")
-        return
-    
-    # Check if player_id is available and valid
-    if not player_id or not player_id.startswith('firebase_'):
-        logger.warning(f"CHAT DEBUG: Missing or invalid player ID: {player_id}. Ignoring chat message.")
-        return
+def run_storage_callbacks():
+    """Run storage completions and cache changes queued by other threads"""
+    while not game_protocol.shutting_down:
+        storage.run_pending_callbacks()
+        socketio.sleep(STORAGE_CALLBACK_INTERVAL)
 
-    # If player_name wasn't provided, try to get it from our players cache
-    if not player_name and player_id in players:
-        player_name = players[player_id].get('name', 'Unknown Sailor')
-        print(f"CHAT DEBUG: Retrieved player name from cache: {player_name}")
-    
-    # Debug log to check if we actually have the player in cache
-    if player_id in players:
-        print(f"CHAT DEBUG: PLAYER FOUND IN CACHE: {player_id}")
-        print(f"CHAT DEBUG: PLAYER NAME IN CACHE: {players[player_id].get('name', 'No name found!')}")
-    else:
-        print(f"CHAT DEBUG: PLAYER NOT FOUND IN CACHE: {player_id}")
-        print(f"CHAT DEBUG: AVAILABLE PLAYER IDS: {list(players.keys())[:10]}") # Show up to 10 for brevity
-    
-    # IMPORTANT: Always use the client-provided name if available
-    final_name = player_name or 'Unknown Sailor'
-    print(f"CHAT DEBUG: FINAL NAME FOR CHAT: {final_name}")
-    
-    # Send message object with more info instead of just content
-    message_obj = {
-        'content': content,
-        'player_id': player_id,
-        'sender_name': final_name,
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    print(f"CHAT DEBUG: Broadcasting message object: {message_obj}")
-    logger.info(f"CHAT DEBUG: Broadcasting message with player name: '{final_name}'")
-    
-    # IMPORTANT: Make sure we're sending the OBJECT, not just the content string
-    try:
-        # Send as JSON to ensure proper serialization
-        emit('new_message', message_obj, broadcast=True, json=True)
-        print(f"CHAT DEBUG: Broadcast complete")
-    except Exception as e:
-        print(f"CHAT DEBUG: ERROR BROADCASTING MESSAGE: {str(e)}")
-        logger.error(f"CHAT DEBUG: Error broadcasting message: {str(e)}")
-    
-    print(f"=====================================")
+socketio.start_background_task(run_storage_callbacks)
 
-@socketio.on('update_player_color')
-def handle_update_player_color(data):
-    """
-    Update a player's color
-    Expects: { player_id, color: {r, g, b} }
-    """
-    player_id = data.get('player_id')
-    if not player_id:
-        logger.warning("Missing player ID in color update. Ignoring.")
-        return
-    
-    color = data.get('color')
-    if not color:
-        logger.warning("Missing color data in update. Ignoring.")
-        return
-    
-    # Ensure player exists in cache
-    if player_id not in players:
-        logger.warning(f"Player ID {player_id} not found in cache. Ignoring color update.")
-        return
-    
-    # Update in-memory cache
-    players[player_id]['color'] = color
-    
-    # Update in Firestore directly with the data
-    firestore_models.Player.update(player_id, color=color)
-    logger.info(f"Updated player {player_id} color to {color}")
-    
-    # Broadcast to all other clients
-    emit('player_updated', {
-        'id': player_id,
-        'color': color
-    }, broadcast=True)
-
-@socketio.on('update_player_name')
-def handle_update_player_name(data):
-    """
-    Update a player's name
-    Expects: { player_id, name }
-    """
-    print(f"DEBUG: Received player name update: {data}")
-    logger.info(f"Received player name update: {data}")
-    
-    player_id = data.get('player_id')
-    if not player_id:
-        logger.warning("Missing player ID in name update. Ignoring.")
-        return
-    
-    name = data.get('name')
-    print(f"DEBUG: Name from update: '{name}'")
-    
-    if not name or not isinstance(name, str):
-        logger.warning(f"Invalid name in update (empty or not a string): '{name}'. Ignoring.")
+def shutdown(signum=None, frame=None):
+    """Handle SIGTERM/SIGINT: flush state, disconnect everyone and exit"""
+    logger.info(f"Received signal {signum}")
+    if not game_protocol.shutdown():
         return
-    
-    # Apply server-side sanitization for extra security
-    sanitized_name = sanitize_player_name(name)
-    print(f"DEBUG: Sanitized name: '{sanitized_name}'")
-    
-    if not sanitized_name or len(sanitized_name) < 2:
-        logger.warning(f"Name invalid after sanitization: '{name}' -> '{sanitized_name}'. Ignoring.")
-        return
-        
-    if len(sanitized_name) > 50:
-        logger.warning(f"Name too long ({len(sanitized_name)} chars): '{sanitized_name}'. Truncating.")
-        sanitized_name = sanitized_name[:50]
-    
-    # Ensure player exists in cache
-    if player_id not in players:
-        logger.warning(f"Player ID {player_id} not found in cache. Ignoring name update.")
-        return
-    
-    # Log previous player name for debugging
-    prev_name = players[player_id].get('name', 'Unknown')
-    print(f"DEBUG: Updating player {player_id} name from '{prev_name}' to '{sanitized_name}'")
-    
-    # Update in-memory cache
-    players[player_id]['name'] = sanitized_name
-    
-    # Update in Firestore directly
-    firestore_models.Player.update(player_id, name=sanitized_name)
-    logger.info(f"Updated player {player_id} name to {sanitized_name}")
-    
-    # Broadcast to all other clients
-    emit('player_updated', {
-        'id': player_id,
-        'name': sanitized_name
-    }, broadcast=True)
-    
-    print(f"DEBUG: Broadcast player name update: {player_id} = '{sanitized_name}'")
+    if event_recorder:
+        event_recorder.close()
+    sys.exit(0)
 
-def sanitize_player_name(name):
-    """
-    Sanitize player names to prevent XSS attacks and ensure valid formatting
-    """
-    # Skip if name is None
-    if name is None:
-        return None
-        
-    # Basic HTML sanitization
-    import re
-    
-    # Remove potentially dangerous HTML/JS characters
-    sanitized = re.sub(r'<[^>]*>', '', name)  # Remove HTML tags
-    sanitized = re.sub(r'&[^;]+;', '', sanitized)  # Remove HTML entities
-    
-    # Remove other potentially problematic characters
-    sanitized = sanitized.replace('\\', '')
-    sanitized = sanitized.replace('/', '')
-    sanitized = sanitized.replace('"', '')
-    sanitized = sanitized.replace("'", '')
-    
-    # Allow clan tags in square brackets but sanitize their content
-    def sanitize_clan_tags(match):
-        # Extract the clan tag content (without brackets)
-        clan_content = match.group(1)
-        # Sanitize the clan content
-        clean_content = re.sub(r'[<>&\\/\'"]', '', clan_content)
-        # Return with brackets
-        return f"[{clean_content}]"
-    
-    # Pattern matches [anything]
-    sanitized = re.sub(r'\[(.*?)\]', sanitize_clan_tags, sanitized)
-    
-    # Trim whitespace and return
-    return sanitized.strip()
+# Signal handlers can only be installed from the main thread
+try:
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+except ValueError:
+    logger.warning("Not running in the main thread; graceful shutdown handlers not installed")
 
 # API endpoints
 @app.route('/api/players', methods=['GET'])
@@ -632,29 +178,111 @@ def get_players():
 
 @app.route('/api/players/<player_id>', methods=['GET'])
 def get_player(player_id):
-    """Get a specific player"""
-    player = firestore_models.Player.get(player_id)
-    if player:
-        return jsonify(player)
-    return jsonify({'error': 'Player not found'}), 404
+    """
+    Get a specific player: connected players from the live cache, others from
+    the profile cache (refreshed in the background once stale) or Firestore
+    """
+    player = players.get(player_id)
+    if player and player.get('active', False):
+        game_protocol.profiles.count_live_hit()
+        return player_response(player, 0, 'live')
+    
+    cached = game_protocol.profiles.lookup(player_id)
+    if cached is not None:
+        profile, age, state = cached
+        if state == 'stale':
+            game_protocol.refresh_player_profile(player_id)
+        return player_response(profile, age, 'hit' if state == 'fresh' else 'stale')
+    
+    try:
+        profile = storage.run(firestore_models.Player.get, player_id)
+    except (StorageSaturated, StorageTimeout):
+        return jsonify({'error': 'Server busy'}), 503
+    game_protocol.profiles.store(player_id, profile)
+    return player_response(profile, 0, 'miss')
+
+def player_response(profile, age, cache_status):
+    """Profile response with Age and X-Cache headers (404 for a missing player)"""
+    if profile:
+        response = jsonify(profile)
+    else:
+        response = jsonify({'error': 'Player not found'})
+        response.status_code = 404
+    response.headers['Age'] = str(int(age))
+    response.headers['X-Cache'] = cache_status
+    return response
 
 @app.route('/api/islands', methods=['GET'])
 def get_islands():
     """Get all islands"""
     return jsonify(list(islands.values()))
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Get server counters and storage pool saturation"""
+    return jsonify(game_protocol.collect_metrics())
+
+@app.route('/api/stats', methods=['GET'])
+def get_global_stats():
+    """Get totals across all players (fish caught, monsters slain, coins)"""
+    try:
+        return jsonify(storage.run(firestore_models.GlobalStats.get_totals))
+    except (StorageSaturated, StorageTimeout):
+        return jsonify({'error': 'Server busy'}), 503
+
 @app.route('/api/leaderboard', methods=['GET'])
 def get_leaderboard():
-    """Get the combined leaderboard"""
-    return jsonify(firestore_models.Player.get_combined_leaderboard())
+    """
+    Get the combined leaderboard from memory
+    Query: window=day|week|all (default all), limit (default 10, max 100)
+    """
+    window = request.args.get('window', 'all')
+    if window not in ('all',) + leaderboards.WINDOWS:
+        return jsonify({'error': "window must be 'day', 'week' or 'all'"}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    return jsonify(game_protocol.leaderboard.combined(window, limit))
+
+MAX_MESSAGES_PAGE = 100
 
 @app.route('/api/messages', methods=['GET'])
 def get_messages():
-    """Get recent chat messages"""
+    """
+    Get a page of chat messages in chronological order, newest page first
+    Query: type (default global), limit (default 50, max 100), before (cursor)
+    
+    When older messages exist, the X-Next-Cursor response header holds the
+    cursor to pass as `before` for the next page.
+    """
     message_type = request.args.get('type', 'global')
-    limit = int(request.args.get('limit', 50))
-    messages = firestore_models.Message.get_recent_messages(limit=limit, message_type=message_type)
-    return jsonify(messages)
+    if message_type not in schemas.MESSAGE_TYPES:
+        return jsonify({'error': 'Unknown message type'}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_MESSAGES_PAGE)
+    before = request.args.get('before')
+    cursor = None
+    if before:
+        cursor = firestore_models.Message.parse_cursor(before)
+        if cursor is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    messages, next_cursor = firestore_models.Message.get_page(message_type, limit=limit, before=cursor)
+    response = jsonify(messages)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = firestore_models.Message.format_cursor(next_cursor)
+    return response
+
+@app.route('/api/messages/search', methods=['GET'])
+@require_admin
+def search_messages():
+    """
+    Search recent chat (moderators), newest first
+    Query: q (all words must match), type (default global), limit (default 50, max 100)
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing q'}), 400
+    message_type = request.args.get('type', 'global')
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_MESSAGES_PAGE)
+    return jsonify(game_protocol.chat_index.search(query, message_type, limit))
 
 @app.route('/api/admin/create_island', methods=['POST'])
 def create_island():
@@ -666,7 +294,7 @@ def create_island():
         return jsonify({'error': 'Invalid island data'}), 400
     
     # Generate island ID
-    island_id = f"island_{int(time.time())}"
+    island_id = firestore_models.Island.new_id()
     
     # Create island in Firestore
     island = firestore_models.Island.create(island_id, **data)
@@ -679,80 +307,190 @@ def create_island():
     
     return jsonify(island)
 
-@socketio.on('add_to_inventory')
-def handle_add_to_inventory(data):
-    """
-    Handle adding items to player's inventory
-    Expects: { player_id, item_type (fish/treasure), item_name, item_data }
+MAX_IMPORT_ISLANDS = int(os.environ.get('MAX_IMPORT_ISLANDS', 50000))
+IMPORT_BATCH_WORKERS = int(os.environ.get('IMPORT_BATCH_WORKERS', 8))
+
+validate_island_position = schemas.compile_schema(schemas.ISLAND_POSITION)
+
+def parse_island_import(body, mimetype):
     """
-    player_id = data.get('player_id')
-    if not player_id:
-        logger.warning("Missing player ID in inventory update. Ignoring.")
-        return
-    
-    # Ensure player exists in cache
-    if player_id not in players:
-        logger.warning(f"Player ID {player_id} not found in cache. Ignoring inventory update.")
-        return
-    
-    item_type = data.get('item_type')
-    item_name = data.get('item_name')
-    item_data = data.get('item_data', {})
+    Parse an island import body as a JSON array or NDJSON (one island per line)
     
-    if not item_type or not item_name:
-        logger.warning("Missing item type or name in inventory update. Ignoring.")
-        return
-    
-    result = None
-    
-    # Add to appropriate inventory type
-    if item_type == 'fish':
-        result = firestore_models.Inventory.add_fish(player_id, item_name, item_data)
-        logger.info(f"Added fish '{item_name}' to player {player_id}'s inventory")
-    elif item_type == 'treasure':
-        result = firestore_models.Inventory.add_treasure(player_id, item_name, item_data)
-        logger.info(f"Added treasure '{item_name}' to player {player_id}'s inventory")
+    :return: (islands_data, errors) where errors lists problems by item number
+    """
+    text = body.decode('utf-8').strip()
+    errors = []
+    if mimetype == 'application/json' or text.startswith('['):
+        try:
+            items = json.loads(text) if text else []
+        except ValueError as e:
+            return [], [f"Invalid JSON: {e}"]
+        if not isinstance(items, list):
+            return [], ['Expected a JSON array of islands']
     else:
-        logger.warning(f"Unknown item type '{item_type}' in inventory update. Ignoring.")
-        return
+        items = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                errors.append(f"Line {line_number}: invalid JSON ({e})")
+    
+    islands_data = []
+    seen_ids = set()
+    for index, item in enumerate(items, start=1):
+        if not isinstance(item, dict) or 'position' not in item:
+            errors.append(f"Item {index}: missing position")
+            continue
+        position, reason = validate_island_position(item['position'])
+        if reason:
+            errors.append(f"Item {index}: position must have finite x and z (y optional) within range ({reason})")
+            continue
+        item['position'] = position
+        island_id = item.get('id')
+        if island_id is None:
+            islands_data.append(item)
+        elif not isinstance(island_id, str) or not island_id or '/' in island_id:
+            errors.append(f"Item {index}: id must be a non-empty string without '/'")
+        elif island_id in islands:
+            errors.append(f"Item {index}: island {island_id} already exists")
+        elif island_id in seen_ids:
+            errors.append(f"Item {index}: island {island_id} appears more than once")
+        else:
+            seen_ids.add(island_id)
+            islands_data.append(item)
+    return islands_data, errors
+
+@app.route('/api/admin/import_islands', methods=['POST'])
+@require_admin
+def import_islands():
+    """Admin endpoint to bulk import islands from NDJSON or a JSON array"""
+    islands_data, errors = parse_island_import(request.get_data(), request.mimetype)
+    if errors:
+        return jsonify({'error': 'Invalid island data', 'details': errors[:100]}), 400
+    if not islands_data:
+        return jsonify({'error': 'No islands provided'}), 400
+    if len(islands_data) > MAX_IMPORT_ISLANDS:
+        return jsonify({'error': f'Too many islands (max {MAX_IMPORT_ISLANDS})'}), 400
+    
+    start_time = time.time()
+    
+    # Assign IDs up front so the snapshot listener can tell the new documents
+    # apart and leave announcing them to the single islands_created below
+    for item in islands_data:
+        item['id'] = item.get('id') or firestore_models.Island.new_id()
+    import_ids = {item['id'] for item in islands_data}
+    game_protocol.islands_being_imported.update(import_ids)
+    try:
+        created, failed_ids = firestore_models.Island.create_many(
+            islands_data, max_workers=IMPORT_BATCH_WORKERS)
+    finally:
+        game_protocol.islands_being_imported.difference_update(import_ids)
     
-    # Send updated inventory to the player
-    if result:
-        emit('inventory_updated', result)
+    # Only cache what was actually committed
+    for island in created:
+        islands[island['id']] = island
+        game_protocol.index_island_position(island)
+    
+    # One aggregated broadcast instead of one event per island
+    if created:
+        socketio.emit('islands_created', created)
+    
+    logger.info(f"Imported {len(created)} islands ({len(failed_ids)} failed) "
+                f"in {time.time() - start_time:.2f}s")
+    
+    return jsonify({
+        'created': len(created),
+        'failed': len(failed_ids),
+        'failed_ids': failed_ids[:100],
+        'ids': [island['id'] for island in created]
+    }), (201 if not failed_ids else 207)
+
+@app.route('/api/admin/admission', methods=['GET', 'POST'])
+@require_admin
+def admission_settings():
+    """Admin endpoint to read join admission state or change its tunables"""
+    if request.method == 'POST':
+        tunables = request.get_json(silent=True)
+        if not isinstance(tunables, dict):
+            return jsonify({'error': 'Expected a JSON object of tunables'}), 400
+        try:
+            settings = game_protocol.admission.configure(**tunables)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        logger.info(f"Admission tunables changed: {settings}")
+        # A raised cap can admit queued clients right away
+        game_protocol.pump_admissions()
+    return jsonify(game_protocol.admission.metrics())
+
+# On-demand profiling of the running server (see profiler.py)
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 60))
+PROFILE_MIN_INTERVAL = 0.001
+profile_lock = threading.Lock()
+
+@app.route('/api/admin/profile', methods=['POST'])
+@require_admin
+def profile_server():
+    """
+    Admin endpoint to sample every thread's stack for a few seconds
+    Query: seconds (default 10), interval_ms (default 10), format (json or collapsed)
+    """
+    seconds = request.args.get('seconds', 10, type=float)
+    interval_ms = request.args.get('interval_ms', 10, type=float)
+    # float() accepts nan and inf, which would never reach the deadline
+    if not (math.isfinite(seconds) and math.isfinite(interval_ms)):
+        return jsonify({'error': 'seconds and interval_ms must be finite numbers'}), 400
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    interval = max(interval_ms / 1000, PROFILE_MIN_INTERVAL)
+    if not profile_lock.acquire(blocking=False):
+        return jsonify({'error': 'A profile is already running'}), 409
+    
+    timer = EventCpuTimer()
+    profiler = SamplingProfiler(seconds, interval)
+    try:
+        logger.info(f"Profiling for {seconds}s every {interval * 1000:g}ms")
+        # Only installed for the window, so events cost nothing extra otherwise
+        game_protocol.event_middlewares.append(timer)
+        profiler.start()
+        profiler.wait(socketio.sleep)
+    finally:
+        game_protocol.event_middlewares.remove(timer)
+        profile_lock.release()
+    
+    if request.args.get('format') == 'collapsed':
+        return Response('\n'.join(profiler.collapsed()) + '\n', mimetype='text/plain')
+    return jsonify({
+        **profiler.summary(),
+        'events': timer.report(profiler.elapsed),
+        'top_functions': profiler.top_functions(),
+        'stacks': profiler.collapsed()
+    })
+
+@app.route('/api/worlds', methods=['GET'])
+def get_worlds():
+    """World instances hosted by this server and their population"""
+    return jsonify({
+        'server_id': game_protocol.worlds.server_id,
+        'capacity': game_protocol.worlds.capacity,
+        'instances': game_protocol.worlds.describe()
+    })
 
 # Add API endpoint to get player inventory
 @app.route('/api/players/<player_id>/inventory', methods=['GET'])
 def get_player_inventory(player_id):
-    print(f"DEBUG: Getting player inventory for {player_id}")
-    logger.error(f"DEBUG: Getting player inventory for {player_id}")
-    """Get a player's inventory"""
-    inventory = firestore_models.Inventory.get(player_id)
+    """Get a player's inventory (from the cache while they are connected)"""
+    cached = game_protocol.inventories.since(player_id, None)
+    if cached:
+        return jsonify(cached[2])
+    try:
+        inventory = storage.run(firestore_models.Inventory.find, player_id)
+    except (StorageSaturated, StorageTimeout):
+        return jsonify({'error': 'Server busy'}), 503
     if inventory:
         return jsonify(inventory)
     return jsonify({'error': 'Inventory not found'}), 404
 
-@socketio.on('get_inventory')
-def handle_get_inventory(data):
-    """
-    Handle request for player inventory
-    Expects: { player_id }
-    """
-    print(f"DEBUG: Getting inventory for {data}")
-    logger.error(f"DEBUG: Getting inventory for {data}")
-    player_id = data.get('player_id')
-    if not player_id:
-        logger.warning("Missing player ID in inventory request. Ignoring.")
-        return
-    
-    # Get inventory
-    inventory = firestore_models.Inventory.get(player_id)
-    
-    # Send inventory data back to the requesting client only
-    if inventory:
-        emit('inventory_data', inventory)
-    else:
-        emit('inventory_data', {'error': 'Inventory not found'})
-
 if __name__ == '__main__':
     # Run the Socket.IO server with debug and reloader enabled
     socketio.run(app, host='0.0.0.0') 
@@ -0,0 +1,154 @@
+"""
+Native asyncio server mode.
+
+Runs the same game protocol as app.py (the handlers in game_protocol) on
+python-socketio's AsyncServer under an ASGI server, with storage calls made
+through the async Firestore client (async_storage.AsyncStorage). Thousands of
+sockets and in-flight storage calls then share one event loop without threads.
+
+Start it with:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Only the Socket.IO protocol and GET /api/metrics are served in this mode; the
+REST and admin endpoints remain on the Flask server (app.py). The sync
+Firestore client is still used for startup loading, the snapshot listeners
+and the shutdown flush, which run outside the event loop.
+"""
+import os
+import json
+import asyncio
+import logging
+from dotenv import load_dotenv
+import socketio
+import firebase_admin
+from firebase_admin import credentials, firestore, firestore_async
+import firestore_models
+import game_protocol
+import async_storage
+from async_transport import AsyncServerTransport
+from event_recorder import EventRecorder
+
+# Load environment variables from .env file
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+logging.getLogger('firebase_admin').setLevel(logging.WARNING)
+
+# Initialize Firebase with both the sync and the async Firestore client
+cred = credentials.Certificate(os.environ.get('FIREBASE_CREDENTIALS', 'firebasekey.json'))
+firebase_app = firebase_admin.initialize_app(cred)
+firestore_models.init_firestore(firestore.client())
+async_storage.init_async_firestore(firestore_async.client())
+
+sio = socketio.AsyncServer(async_mode='asgi',
+                           cors_allowed_origins=os.environ.get('SOCKETIO_CORS_ALLOWED_ORIGINS', '*'))
+transport = None  # AsyncServerTransport, created on startup with the loop
+
+
+# Record inbound events for replay (see replay_events.py)
+event_recorder = None
+if os.environ.get('SOCKET_RECORD_PATH'):
+    record_events = [e.strip() for e in os.environ.get('SOCKET_RECORD_EVENTS', '').split(',') if e.strip()]
+    event_recorder = EventRecorder(os.environ['SOCKET_RECORD_PATH'], events=record_events or None)
+    game_protocol.event_middlewares.append(event_recorder)
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    game_protocol.handle_connect(sid)
+
+
+@sio.event
+async def disconnect(sid, *args):
+    game_protocol.handle_disconnect(sid)
+
+
+def register_game_events():
+    """
+    Register every game_protocol handler with the AsyncServer. Handlers never
+    block on storage (they use storage.call callbacks), so they run directly
+    on the event loop.
+    """
+    for event in game_protocol.EVENT_HANDLERS:
+        def handler(sid, *args, event=event):
+            return game_protocol.dispatch(event, sid, *args)
+        sio.on(event, handler)
+
+
+register_game_events()
+
+
+async def on_startup():
+    global transport
+    loop = asyncio.get_running_loop()
+    storage = async_storage.AsyncStorage(
+        loop,
+        max_concurrency=int(os.environ.get('ASYNC_STORAGE_CONCURRENCY', 512)),
+        max_queue=int(os.environ.get('STORAGE_QUEUE_LIMIT', 4096)),
+        timeout=float(os.environ.get('STORAGE_TIMEOUT', 5))
+    )
+    transport = AsyncServerTransport(sio, loop)
+    game_protocol.init(transport, storage)
+
+    # Initial load and listeners use the sync client; keep them off the loop
+    await loop.run_in_executor(None, game_protocol.load_data_from_firestore)
+    game_protocol.start_cache_listeners()
+    loop.create_task(relay_loop())
+    logger.info("Async game server started")
+
+
+async def relay_loop():
+    """Run game_protocol.background_tick() on a fixed tick"""
+    loop = asyncio.get_running_loop()
+    while not game_protocol.shutting_down:
+        started_at = loop.time()
+        try:
+            game_protocol.background_tick()
+        except Exception:
+            logger.exception("Relay tick failed")
+        await asyncio.sleep(max(0.0, game_protocol.RELAY_TICK_INTERVAL - (loop.time() - started_at)))
+
+
+async def on_shutdown():
+    # The flush blocks and waits for storage calls that need the loop running
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, game_protocol.shutdown)
+    # Let the shutdown notice and the disconnects it scheduled reach the clients
+    still_running = await transport.drain(timeout=float(os.environ.get('SHUTDOWN_DISCONNECT_TIMEOUT', 5)))
+    if still_running:
+        logger.warning(f"{still_running} emits/disconnects still running at shutdown")
+    if event_recorder:
+        event_recorder.close()
+
+
+async def http_app(scope, receive, send):
+    """Minimal ASGI app for the non-Socket.IO routes"""
+    if scope['type'] != 'http':
+        return
+    if scope['path'] == '/api/metrics':
+        status, body = 200, json.dumps(game_protocol.collect_metrics())
+    else:
+        status, body = 404, json.dumps({'error': 'Not found'})
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')]
+    })
+    await send({'type': 'http.response.body', 'body': body.encode('utf-8')})
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app,
+                       on_startup=on_startup, on_shutdown=on_shutdown)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,314 @@
+"""
+Storage backend for the asyncio server (asgi_app.py).
+
+AsyncStorage has the same submit()/call() interface as StoragePool, but runs
+calls as coroutines on the event loop using the async Firestore client, so
+thousands of in-flight storage calls need no threads. Handlers in
+game_protocol keep passing the sync firestore_models functions; each one is
+mapped to an async equivalent below. Writes are built by the same
+firestore_models *_writes functions the sync models commit, addressed through
+the async client. Functions without an equivalent fall back to the default
+thread executor and are counted in the metrics.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import wait
+from firebase_admin import firestore
+import firestore_models
+from storage_pool import StorageCallbacks, StorageSaturated, StorageTimeout
+
+logger = logging.getLogger(__name__)
+
+# Initialized by init_async_firestore()
+adb = None
+
+
+def init_async_firestore(async_client):
+    """Set the async Firestore client used by the async model functions"""
+    global adb
+    adb = async_client
+
+
+async def commit_writes(writes):
+    """firestore_models.commit_writes() through the async client"""
+    if len(writes) == 1:
+        doc_ref, data, op = writes[0]
+        if op == 'update':
+            await doc_ref.update(data)
+        else:
+            await doc_ref.set(data, merge=(op == 'merge'))
+        return
+    batch = adb.batch()
+    firestore_models.add_writes(batch, writes)
+    await batch.commit()
+
+
+async def player_get(player_id):
+    doc = await firestore_models.Player.collection(adb).document(player_id).get()
+    return firestore_models.Player.to_dict(doc)
+
+
+async def player_write(player_id, **updates):
+    await commit_writes(firestore_models.Player.write_writes(player_id, updates, adb))
+
+
+async def player_update(player_id, **updates):
+    await player_write(player_id, **updates)
+    return await player_get(player_id)
+
+
+async def player_increment(player_id, **deltas):
+    await commit_writes(firestore_models.Player.increment_writes(player_id, deltas, adb))
+
+
+async def player_create(player_id, **data):
+    await commit_writes(firestore_models.Player.create_writes(player_id, data, adb))
+    return await player_get(player_id)
+
+
+async def player_get_leaderboard(category, limit=10):
+    if category not in ['fishCount', 'monsterKills', 'money']:
+        raise ValueError("Category must be 'fishCount', 'monsterKills', or 'money'")
+    query = (firestore_models.Player.collection(adb)
+             .order_by(category, direction=firestore.Query.DESCENDING)
+             .limit(limit))
+    return [firestore_models.Player.to_dict(doc) async for doc in query.stream()]
+
+
+async def player_get_combined_leaderboard(limit=10):
+    categories = ['fishCount', 'monsterKills', 'money']
+    results = await asyncio.gather(*(player_get_leaderboard(category, limit)
+                                     for category in categories))
+    return {
+        category: [
+            {
+                'name': player['name'],
+                'value': player[category],
+                'color': player['color']
+            } for player in leaderboard
+        ]
+        for category, leaderboard in zip(categories, results)
+    }
+
+
+async def message_get_recent_messages(limit=50, message_type='global'):
+    query = (firestore_models.Message.collection(adb)
+             .where('message_type', '==', message_type)
+             .order_by('timestamp', direction=firestore.Query.DESCENDING)
+             .limit(limit))
+    messages = [firestore_models.Message.to_dict(doc) async for doc in query.stream()]
+
+    # Look up every distinct sender concurrently
+    sender_ids = list({message['sender_id'] for message in messages})
+    senders = dict(zip(sender_ids, await asyncio.gather(*(player_get(sender_id)
+                                                          for sender_id in sender_ids))))
+    for message in messages:
+        sender = senders.get(message['sender_id'])
+        if sender:
+            message['sender_name'] = sender.get('name', 'Unknown')
+            message['sender_color'] = sender.get('color')
+        else:
+            message['sender_name'] = 'Unknown'
+            message['sender_color'] = {'r': 0.5, 'g': 0.5, 'b': 0.5}
+
+    # Reverse to get chronological order
+    messages.reverse()
+    return messages
+
+
+async def message_write(message_id, message_data):
+    await commit_writes(firestore_models.Message.write_writes(message_id, message_data, adb))
+
+
+async def island_create_many(islands_data, batch_size=firestore_models.MAX_BATCH_SIZE, max_workers=4):
+    prepared = firestore_models.Island.prepare_many(islands_data)
+    chunks = [prepared[i:i + batch_size] for i in range(0, len(prepared), batch_size)]
+
+    async def commit_chunk(chunk):
+        batch = adb.batch()
+        firestore_models.add_writes(batch, firestore_models.Island.create_writes(chunk, adb))
+        await batch.commit()
+
+    # max_workers has no meaning here; every chunk is committed concurrently
+    results = await asyncio.gather(*(commit_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    created, failed_ids = [], []
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error committing batch of {len(chunk)} islands: {result}")
+            failed_ids.extend(island_id for island_id, _, _ in chunk)
+        else:
+            created.extend(island for _, _, island in chunk)
+    return created, failed_ids
+
+
+async def inventory_get(player_id):
+    doc_ref = firestore_models.Inventory.collection(adb).document(player_id)
+    inventory = firestore_models.Inventory.to_dict(await doc_ref.get())
+    if not inventory:
+        await doc_ref.set(firestore_models.Inventory.new_inventory_data(player_id))
+        inventory = firestore_models.Inventory.to_dict(await doc_ref.get())
+    return firestore_models.Inventory.compact(inventory)
+
+
+async def inventory_find(player_id):
+    doc = await firestore_models.Inventory.collection(adb).document(player_id).get()
+    return firestore_models.Inventory.compact(firestore_models.Inventory.to_dict(doc))
+
+
+async def inventory_add_item(player_id, field, item):
+    await commit_writes(firestore_models.Inventory.add_item_writes(player_id, field, item, adb))
+
+
+async def inventory_add_fish(player_id, fish_name, fish_data=None):
+    await inventory_add_item(player_id, *firestore_models.Inventory.new_item('fish', fish_name, fish_data))
+    return await inventory_get(player_id)
+
+
+async def inventory_add_treasure(player_id, treasure_name, treasure_data=None):
+    await inventory_add_item(player_id, *firestore_models.Inventory.new_item('treasure', treasure_name, treasure_data))
+    return await inventory_get(player_id)
+
+
+# Sync model function -> async equivalent
+ASYNC_EQUIVALENTS = {
+    firestore_models.Player.get: player_get,
+    firestore_models.Player.write: player_write,
+    firestore_models.Player.update: player_update,
+    firestore_models.Player.create: player_create,
+    firestore_models.Player.increment: player_increment,
+    firestore_models.Player.get_leaderboard: player_get_leaderboard,
+    firestore_models.Player.get_combined_leaderboard: player_get_combined_leaderboard,
+    firestore_models.Message.get_recent_messages: message_get_recent_messages,
+    firestore_models.Message.write: message_write,
+    firestore_models.Island.create_many: island_create_many,
+    firestore_models.Inventory.get: inventory_get,
+    firestore_models.Inventory.find: inventory_find,
+    firestore_models.Inventory.add_item: inventory_add_item,
+    firestore_models.Inventory.add_fish: inventory_add_fish,
+    firestore_models.Inventory.add_treasure: inventory_add_treasure,
+}
+
+
+class AsyncStorage(StorageCallbacks):
+    """Runs storage calls as coroutines on one event loop"""
+
+    def __init__(self, loop, max_concurrency=512, max_queue=4096, timeout=5.0):
+        """
+        :param loop: Event loop the calls run on
+        :param max_concurrency: Storage calls awaiting Firestore at once
+        :param max_queue: Calls allowed to wait for a concurrency slot
+        :param timeout: Seconds a call may take in total before it fails
+        """
+        self.loop = loop
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.pending = set()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'executor_fallbacks': 0,
+            'peak_in_flight': 0,
+            'total_run_ms': 0.0,
+            'max_run_ms': 0.0
+        }
+
+    async def _run(self, fn, args, kwargs):
+        async with self.semaphore:
+            started_at = time.monotonic()
+            try:
+                equivalent = ASYNC_EQUIVALENTS.get(fn)
+                if equivalent is not None:
+                    coro = equivalent(*args, **kwargs)
+                else:
+                    with self.lock:
+                        self.stats['executor_fallbacks'] += 1
+                    coro = self.loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+                try:
+                    return await asyncio.wait_for(coro, self.timeout)
+                except asyncio.TimeoutError:
+                    raise StorageTimeout(f"{fn.__qualname__} took longer than {self.timeout}s")
+            finally:
+                run_ms = (time.monotonic() - started_at) * 1000
+                with self.lock:
+                    self.stats['total_run_ms'] += run_ms
+                    self.stats['max_run_ms'] = max(self.stats['max_run_ms'], run_ms)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule a storage call on the event loop (safe from any thread)
+
+        :return: concurrent.futures.Future with the call's result
+        """
+        with self.lock:
+            if self.closed or len(self.pending) >= self.max_concurrency + self.max_queue:
+                self.stats['rejected'] += 1
+                saturated = True
+            else:
+                saturated = False
+                self.stats['submitted'] += 1
+        if saturated:
+            future = asyncio.run_coroutine_threadsafe(self._reject(fn), self.loop)
+            return future
+
+        future = asyncio.run_coroutine_threadsafe(self._run(fn, args, kwargs), self.loop)
+        with self.lock:
+            self.pending.add(future)
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], len(self.pending))
+        future.add_done_callback(self._finished)
+        return future
+
+    def defer(self, fn, *args):
+        """Run fn(*args) on the event loop (snapshot listeners call this from their own threads)"""
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    async def _reject(self, fn):
+        raise StorageSaturated(f"Async storage saturated calling {fn.__qualname__}")
+
+    def _finished(self, future):
+        exception = future.exception() if not future.cancelled() else None
+        with self.lock:
+            self.pending.discard(future)
+            if future.cancelled() or exception is not None:
+                key = 'timed_out' if isinstance(exception, StorageTimeout) else 'failed'
+                self.stats[key] += 1
+            else:
+                self.stats['completed'] += 1
+
+    def drain(self, timeout):
+        """Stop accepting calls and wait up to timeout seconds (call off the loop thread)"""
+        self.closed = True
+        with self.lock:
+            pending = list(self.pending)
+        done, not_done = wait(pending, timeout=timeout)
+        return len(done), len(not_done)
+
+    def metrics(self):
+        """Snapshot of counters and saturation gauges"""
+        with self.lock:
+            stats = dict(self.stats)
+            in_flight = len(self.pending)
+        finished = stats['completed'] + stats['failed'] + stats['timed_out']
+        stats.update({
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'in_flight': in_flight,
+            'saturation': round(in_flight / (self.max_concurrency + self.max_queue), 3),
+            'avg_run_ms': round(stats['total_run_ms'] / finished, 3) if finished else 0.0
+        })
+        return stats
@@ -0,0 +1,65 @@
+"""
+Game protocol transport for the asyncio server mode (asgi_app.py).
+
+game_protocol calls emit(), disconnect() and enter_room() synchronously, both
+from handlers on the event loop and from other threads (storage fallbacks and
+Firestore snapshot listeners). AsyncServerTransport runs each call on the
+loop. Some AsyncServer methods are coroutines (emit, disconnect) and some are
+plain methods (enter_room, inherited from the sync Server in the pinned
+python-socketio), so whatever a method returns is only scheduled as a task if
+it is awaitable. Those tasks are kept until they finish so shutdown can wait
+for the final emits and disconnects with drain().
+"""
+import asyncio
+import inspect
+
+
+class AsyncServerTransport:
+    """Delivers protocol messages through a python-socketio AsyncServer from any thread"""
+
+    def __init__(self, server, loop):
+        """
+        :param server: The socketio.AsyncServer
+        :param loop: The event loop it runs on
+        """
+        self.server = server
+        self.loop = loop
+        self.tasks = set()  # Emits and disconnects still running
+
+    def _on_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _run(self, method, *args, **kwargs):
+        """Call a server method on the loop, scheduling it as a task if it is a coroutine"""
+        if not self._on_loop():
+            self.loop.call_soon_threadsafe(lambda: self._run(method, *args, **kwargs))
+            return
+        result = method(*args, **kwargs)
+        if inspect.isawaitable(result):
+            task = self.loop.create_task(result)
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def emit(self, event, data, to=None, skip_sid=None):
+        self._run(self.server.emit, event, data, to=to, skip_sid=skip_sid)
+
+    def disconnect(self, sid):
+        self._run(self.server.disconnect, sid)
+
+    def enter_room(self, sid, room):
+        self._run(self.server.enter_room, sid, room)
+
+    async def drain(self, timeout):
+        """
+        Wait up to timeout seconds for the calls scheduled so far (run on the loop)
+
+        :return: Number of calls still running
+        """
+        # Calls handed over from other threads become tasks once their callbacks run
+        await asyncio.sleep(0)
+        if self.tasks:
+            await asyncio.wait(list(self.tasks), timeout=timeout)
+        return len(self.tasks)
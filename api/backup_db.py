@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Stream Firestore collections to compressed NDJSON backups and restore them.
+
+Each collection is read by its own worker with cursor-paged queries, so memory
+stays bounded by one page per collection no matter how large the world is.
+Restores stream the files back and write them with parallel batched commits.
+
+Usage:
+    python backup_db.py export --out backups/2024-06-01
+    python backup_db.py restore --in backups/2024-06-01 --collections islands
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import base64
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import firebase_admin
+from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1 import GeoPoint
+from google.cloud.firestore_v1.document import DocumentReference
+import firestore_models
+
+# Load environment variables from .env file (if present)
+load_dotenv()
+
+DEFAULT_COLLECTIONS = ['players', 'islands', 'messages', 'inventories']
+DEFAULT_PAGE_SIZE = 1000
+PROGRESS_INTERVAL = 5  # seconds between progress reports
+
+
+def init_db():
+    """Initialize Firebase the same way app.py does"""
+    cred = credentials.Certificate(os.environ.get('FIREBASE_CREDENTIALS', 'firebasekey.json'))
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+    firestore_models.init_firestore(db)
+    return db
+
+
+def encode_value(value):
+    """Convert Firestore values to JSON, tagging types JSON can't represent"""
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, datetime):
+        return {'__type__': 'datetime', 'value': value.isoformat()}
+    if isinstance(value, GeoPoint):
+        return {'__type__': 'geopoint', 'latitude': value.latitude, 'longitude': value.longitude}
+    if isinstance(value, DocumentReference):
+        return {'__type__': 'reference', 'path': value.path}
+    if isinstance(value, bytes):
+        return {'__type__': 'bytes', 'value': base64.b64encode(value).decode('ascii')}
+    return value
+
+
+def decode_value(value, db):
+    """Reverse encode_value"""
+    if isinstance(value, list):
+        return [decode_value(item, db) for item in value]
+    if not isinstance(value, dict):
+        return value
+    value_type = value.get('__type__')
+    if value_type == 'datetime':
+        return datetime.fromisoformat(value['value'])
+    if value_type == 'geopoint':
+        return GeoPoint(value['latitude'], value['longitude'])
+    if value_type == 'reference':
+        return db.document(value['path'])
+    if value_type == 'bytes':
+        return base64.b64decode(value['value'])
+    return {key: decode_value(item, db) for key, item in value.items()}
+
+
+class Progress:
+    """Thread-safe per-collection counters with periodic reporting"""
+
+    def __init__(self, verb):
+        self.verb = verb
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def add(self, collection, count):
+        with self.lock:
+            self.counts[collection] = self.counts.get(collection, 0) + count
+            now = time.time()
+            if now - self.last_report >= PROGRESS_INTERVAL:
+                self.last_report = now
+                self.report()
+
+    def report(self, final=False):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        total = sum(self.counts.values())
+        details = ', '.join(f"{name}: {count}" for name, count in sorted(self.counts.items()))
+        label = 'Done' if final else 'Progress'
+        print(f"[{label}] {self.verb} {total} documents in {elapsed:.1f}s "
+              f"({total / elapsed:.0f}/s) - {details}", flush=True)
+
+
+def export_collection(db, collection_name, out_dir, page_size, progress):
+    """Export one collection to <out_dir>/<collection>.ndjson.gz using cursor paging"""
+    path = os.path.join(out_dir, f"{collection_name}.ndjson.gz")
+    collection = db.collection(collection_name)
+    last_doc = None
+    exported = 0
+
+    with gzip.open(path, 'wt', encoding='utf-8') as out:
+        while True:
+            query = collection.order_by('__name__').limit(page_size)
+            if last_doc is not None:
+                query = query.start_after(last_doc)
+
+            page = list(query.stream())
+            for doc in page:
+                record = {'id': doc.id, 'data': encode_value(doc.to_dict())}
+                out.write(json.dumps(record, separators=(',', ':')))
+                out.write('\n')
+
+            exported += len(page)
+            progress.add(collection_name, len(page))
+            if len(page) < page_size:
+                break
+            last_doc = page[-1]
+
+    return exported
+
+
+def restore_collection(db, collection_name, in_dir, batch_size, workers, progress):
+    """Restore one collection from its NDJSON backup with batched writes"""
+    path = os.path.join(in_dir, f"{collection_name}.ndjson.gz")
+    if not os.path.exists(path):
+        print(f"Skipping {collection_name}: {path} not found")
+        return 0, 0
+
+    collection = db.collection(collection_name)
+    # Hold at most one round of parallel batches in memory at a time
+    round_size = batch_size * workers
+    restored = 0
+    failed = 0
+    writes = []
+
+    def flush():
+        nonlocal restored, failed
+        committed_ids, failed_ids = firestore_models.commit_in_batches(
+            writes, batch_size=batch_size, max_workers=workers)
+        restored += len(committed_ids)
+        failed += len(failed_ids)
+        progress.add(collection_name, len(committed_ids))
+        writes.clear()
+
+    with gzip.open(path, 'rt', encoding='utf-8') as source:
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            writes.append((collection.document(record['id']),
+                           decode_value(record['data'], db), 'set'))
+            if len(writes) >= round_size:
+                flush()
+    if writes:
+        flush()
+
+    return restored, failed
+
+
+def run_export(args):
+    db = init_db()
+    os.makedirs(args.out, exist_ok=True)
+    progress = Progress('Exported')
+
+    # One reader per collection; each holds a single page in memory
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            name: executor.submit(export_collection, db, name, args.out, args.page_size, progress)
+            for name in args.collections
+        }
+        results = {name: future.result() for name, future in futures.items()}
+
+    progress.report(final=True)
+    manifest = {
+        'exported_at': datetime.now().isoformat(),
+        'collections': results
+    }
+    with open(os.path.join(args.out, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Backup written to {args.out}")
+
+
+def run_restore(args):
+    db = init_db()
+    progress = Progress('Restored')
+    total_failed = 0
+
+    # Collections are restored one after another; each uses parallel batches
+    for name in args.collections:
+        restored, failed = restore_collection(db, name, args.input, args.batch_size,
+                                              args.workers, progress)
+        total_failed += failed
+        print(f"{name}: restored {restored} documents ({failed} failed)")
+
+    progress.report(final=True)
+    return 1 if total_failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backup and restore Firestore game data')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export collections to NDJSON')
+    export_parser.add_argument('--out', required=True, help='Output directory')
+    export_parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                               help='Documents fetched per query page')
+
+    restore_parser = subparsers.add_parser('restore', help='Restore collections from NDJSON')
+    restore_parser.add_argument('--in', dest='input', required=True, help='Backup directory')
+    restore_parser.add_argument('--batch-size', type=int, default=firestore_models.MAX_BATCH_SIZE,
+                                help='Writes per batch commit (max 500)')
+
+    for sub in (export_parser, restore_parser):
+        sub.add_argument('--collections', nargs='+', default=DEFAULT_COLLECTIONS,
+                         help='Collections to process')
+        sub.add_argument('--workers', type=int, default=4, help='Concurrent readers/batches')
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        run_export(args)
+        return 0
+    return run_restore(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
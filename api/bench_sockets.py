@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Socket load benchmark for comparing the Flask-SocketIO and asyncio servers.
+
+Opens many simulated players against a server, sends position updates at a
+fixed rate, and measures acknowledgement round trips with latency_probe. The
+server's CPU time (from /api/metrics) gives connections per core.
+
+Start the server under test with REPLAY_AUTH_SECRET set, then:
+
+    python bench_sockets.py --url http://localhost:5000 --secret loadtest \\
+        --clients 2000 --rate 10 --duration 60
+
+Run it once against `python app.py` and once against
+`uvicorn asgi_app:app` to compare the two modes.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import urllib.request
+from collections import Counter
+import socketio
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def fetch_cpu_seconds(url):
+    """Server process CPU time from /api/metrics (None if unavailable)"""
+    try:
+        with urllib.request.urlopen(f"{url}/api/metrics", timeout=5) as response:
+            return json.load(response).get('process_cpu_seconds')
+    except Exception:
+        return None
+
+
+async def run_client(index, args, results, stop_at):
+    client = socketio.AsyncClient(reconnection=False)
+    uid = f"bench_{index}"
+    player_id = f"firebase_{uid}"
+
+    @client.on('*')
+    async def count_event(event, *data):
+        results['received'][event] += 1
+
+    try:
+        await client.connect(args.url, transports=['websocket'])
+    except Exception:
+        results['connect_failures'] += 1
+        return
+    results['connected'] += 1
+
+    await client.emit('player_join', {
+        'player_id': uid,
+        'firebaseToken': f"replay:{args.secret}:{uid}",
+        'name': f"Bench {index}",
+        'position': {'x': 0, 'y': 0, 'z': 0}
+    })
+
+    x, z = random.uniform(-1000, 1000), random.uniform(-1000, 1000)
+    interval = 1.0 / args.rate
+    next_probe = time.time() + random.random()
+    try:
+        while time.time() < stop_at:
+            x += random.uniform(-1, 1)
+            z += random.uniform(-1, 1)
+            await client.emit('update_position', {
+                'x': x, 'y': 0, 'z': z, 'rotation': 0, 'mode': 'boat', 'player_id': player_id
+            })
+            results['sent'] += 1
+
+            if time.time() >= next_probe:
+                next_probe += 1.0
+                sent_at = time.perf_counter()
+                try:
+                    await client.call('latency_probe', {'t': sent_at}, timeout=5)
+                    results['latencies'].append((time.perf_counter() - sent_at) * 1000)
+                except Exception:
+                    results['probe_timeouts'] += 1
+            await asyncio.sleep(interval)
+    finally:
+        await client.disconnect()
+
+
+async def run_benchmark(args):
+    results = {
+        'connected': 0,
+        'connect_failures': 0,
+        'sent': 0,
+        'probe_timeouts': 0,
+        'latencies': [],
+        'received': Counter()
+    }
+    cpu_before = fetch_cpu_seconds(args.url)
+    started_at = time.time()
+    stop_at = started_at + args.ramp + args.duration
+
+    tasks = []
+    for index in range(args.clients):
+        tasks.append(asyncio.create_task(run_client(index, args, results, stop_at)))
+        # Spread connections over the ramp-up period
+        await asyncio.sleep(args.ramp / max(args.clients, 1))
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.time() - started_at
+    cpu_after = fetch_cpu_seconds(args.url)
+    latencies = sorted(results['latencies'])
+    report = {
+        'url': args.url,
+        'clients': args.clients,
+        'connected': results['connected'],
+        'connect_failures': results['connect_failures'],
+        'duration': round(elapsed, 1),
+        'updates_sent': results['sent'],
+        'messages_received': sum(results['received'].values()),
+        'probe_timeouts': results['probe_timeouts'],
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 2),
+            'p95': round(percentile(latencies, 0.95), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(latencies[-1], 2) if latencies else 0.0
+        }
+    }
+    if cpu_before is not None and cpu_after is not None:
+        cores_used = (cpu_after - cpu_before) / elapsed
+        report['server_cores_used'] = round(cores_used, 3)
+        report['connections_per_core'] = round(results['connected'] / cores_used) if cores_used else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent socket connections')
+    parser.add_argument('--url', default='http://localhost:5000', help='Server URL')
+    parser.add_argument('--secret', required=True, help="Server's REPLAY_AUTH_SECRET")
+    parser.add_argument('--clients', type=int, default=500, help='Simulated players')
+    parser.add_argument('--rate', type=float, default=10, help='Position updates per second per player')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run after ramp-up')
+    parser.add_argument('--ramp', type=float, default=10, help='Seconds to spread connections over')
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+In-memory full-text search over recent chat messages.
+
+Each message_type (global, team, ...) has its own inverted index from token
+to the sequence numbers of the messages containing it. Messages are appended
+in arrival order, so every posting list is sorted and the oldest message is
+always at the head of the lists it appears in; expiring a message is a
+popleft on each of its tokens. Messages older than the retention window, or
+beyond max_messages per type, are expired as new ones arrive. Only the
+message types the index was created with are indexed, so the number of
+indexes can't grow with whatever types stored or sent messages carry.
+"""
+import re
+import threading
+import time
+from collections import deque
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+MAX_QUERY_TOKENS = 8
+
+
+def tokenize(text):
+    """Lowercased word tokens of a message or query"""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class ChatTypeIndex:
+    """Inverted index over the retained messages of one message_type"""
+
+    def __init__(self):
+        self.messages = deque()  # (seq, timestamp), oldest first
+        self.by_seq = {}         # seq -> message
+        self.tokens_by_seq = {}  # seq -> frozenset of tokens
+        self.postings = {}       # token -> deque of seqs, ascending
+        self.next_seq = 0
+
+    def add(self, message, timestamp):
+        seq = self.next_seq
+        self.next_seq += 1
+        tokens = frozenset(tokenize(message.get('content', '')))
+        self.messages.append((seq, timestamp))
+        self.by_seq[seq] = message
+        self.tokens_by_seq[seq] = tokens
+        for token in tokens:
+            self.postings.setdefault(token, deque()).append(seq)
+
+    def expire(self, cutoff, max_messages):
+        """Drop messages older than cutoff and beyond max_messages"""
+        while self.messages and (self.messages[0][1] < cutoff or len(self.messages) > max_messages):
+            seq, _ = self.messages.popleft()
+            del self.by_seq[seq]
+            for token in self.tokens_by_seq.pop(seq):
+                posting = self.postings[token]
+                posting.popleft()
+                if not posting:
+                    del self.postings[token]
+
+    def search(self, tokens, limit):
+        """Newest messages containing every token"""
+        lists = [self.postings.get(token) for token in tokens]
+        if not lists or any(posting is None for posting in lists):
+            return []
+        # Walk the rarest token's postings newest first and check the rest
+        rarest = min(lists, key=len)
+        results = []
+        for seq in reversed(rarest):
+            if all(token in self.tokens_by_seq[seq] for token in tokens):
+                results.append(self.by_seq[seq])
+                if len(results) >= limit:
+                    break
+        return results
+
+
+class ChatSearchIndex:
+    """Per-message_type search over chat from the last retention_seconds"""
+
+    def __init__(self, retention_seconds=24 * 3600, max_messages=50000, message_types=('global',)):
+        self.retention_seconds = retention_seconds
+        self.max_messages = max_messages
+        self.message_types = frozenset(message_types)
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def add(self, message):
+        """Index a message ({'content', 'message_type', 'timestamp' (epoch seconds), ...})"""
+        message_type = message.get('message_type', 'global')
+        timestamp = message.get('timestamp') or time.time()
+        with self.lock:
+            if message_type not in self.message_types:
+                return
+            index = self.indexes.setdefault(message_type, ChatTypeIndex())
+            index.add(message, timestamp)
+            index.expire(time.time() - self.retention_seconds, self.max_messages)
+
+    def search(self, query, message_type='global', limit=50):
+        """Retained messages of a type matching every word of the query, newest first"""
+        tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+        if not tokens:
+            return []
+        with self.lock:
+            index = self.indexes.get(message_type)
+            if index is None:
+                return []
+            index.expire(time.time() - self.retention_seconds, self.max_messages)
+            return index.search(tokens, limit)
+
+    def stats(self):
+        """Retained message and token counts per message_type"""
+        with self.lock:
+            return {message_type: {'messages': len(index.messages), 'tokens': len(index.postings)}
+                    for message_type, index in self.indexes.items()}
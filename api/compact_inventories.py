@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Rewrite inventories stored as one entry per item into the stacked layout.
+
+Pages through the inventories collection by document ID and rewrites every
+document that still has fish/treasures/cargo arrays with a batched commit per
+page. Each rewrite is conditional on the document not having changed since
+it was read, so items added by a running server are never lost; documents
+that changed are re-read and retried. The server reads both layouts, so this
+can run while the game is up and be re-run safely.
+
+Usage:
+    python compact_inventories.py --dry-run
+    python compact_inventories.py --page-size 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+import firebase_admin
+from firebase_admin import credentials, firestore
+import firestore_models
+from firestore_models import Inventory
+
+# Load environment variables from .env file (if present)
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = 200
+MAX_ATTEMPTS = 3
+
+
+def init_db():
+    """Initialize Firebase the same way app.py does"""
+    cred = credentials.Certificate(os.environ.get('FIREBASE_CREDENTIALS', 'firebasekey.json'))
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+    firestore_models.init_firestore(db)
+    return db
+
+
+def needs_compacting(data):
+    return any(isinstance(data.get(field), list) for field in Inventory.FIELDS)
+
+
+def document_size(data):
+    """Rough stored size of a document in bytes"""
+    return len(json.dumps(data, default=str))
+
+
+def compacted_update(data):
+    """Update that replaces a document's legacy arrays with stacks"""
+    compacted = Inventory.compact(dict(data))
+    return {
+        'format': Inventory.FORMAT,
+        'stacks': compacted['stacks'],
+        'unique': compacted['unique'],
+        'updated_at': time.time(),
+        **{field: firestore.DELETE_FIELD for field in Inventory.FIELDS}
+    }, compacted
+
+
+def compact_snapshots(db, snapshots, dry_run, totals):
+    """
+    Compact one page of documents in a single batch
+
+    :return: Snapshots whose rewrite was rejected because they changed meanwhile
+    """
+    batch = db.batch()
+    pending = []
+    for snapshot in snapshots:
+        data = snapshot.to_dict()
+        if not needs_compacting(data):
+            continue
+        update, compacted = compacted_update(data)
+        if not dry_run:
+            batch.update(snapshot.reference, update,
+                         option=db.write_option(last_update_time=snapshot.update_time))
+        pending.append((snapshot, document_size(data), document_size(compacted)))
+
+    if pending and not dry_run:
+        try:
+            batch.commit()
+        except Exception as e:
+            # One document changed under us and the whole batch was rejected; retry singly
+            print(f"Batch of {len(pending)} rejected ({e}); retrying one by one", flush=True)
+            return [snapshot for snapshot, _, _ in pending]
+    for _, size_before, size_after in pending:
+        totals['compacted'] += 1
+        totals['bytes_before'] += size_before
+        totals['bytes_after'] += size_after
+    return []
+
+
+def retry_individually(db, snapshots, totals):
+    for snapshot in snapshots:
+        ref = snapshot.reference
+        for _ in range(MAX_ATTEMPTS):
+            fresh = ref.get()
+            if not fresh.exists or not compact_snapshots(db, [fresh], False, totals):
+                break
+        else:
+            totals['failed'] += 1
+            print(f"Gave up on {ref.id} after {MAX_ATTEMPTS} attempts", flush=True)
+
+
+def run(args):
+    db = init_db()
+    collection = db.collection(Inventory.collection_name)
+    totals = {'scanned': 0, 'compacted': 0, 'failed': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_doc = None
+
+    while True:
+        query = collection.order_by('__name__').limit(args.page_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        page = list(query.stream())
+        totals['scanned'] += len(page)
+
+        rejected = compact_snapshots(db, page, args.dry_run, totals)
+        if rejected:
+            retry_individually(db, rejected, totals)
+        print(f"Scanned {totals['scanned']}, compacted {totals['compacted']}", flush=True)
+
+        if len(page) < args.page_size:
+            break
+        last_doc = page[-1]
+
+    verb = 'Would compact' if args.dry_run else 'Compacted'
+    print(f"{verb} {totals['compacted']} of {totals['scanned']} inventories "
+          f"({totals['bytes_before']} -> {totals['bytes_after']} bytes, {totals['failed']} failed)")
+    return 1 if totals['failed'] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact legacy per-item inventories into stacks')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f'Documents read and written per batch (max {firestore_models.MAX_BATCH_SIZE})')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+    args = parser.parse_args()
+    args.page_size = max(1, min(args.page_size, firestore_models.MAX_BATCH_SIZE))
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Dead reckoning for player boats.
+
+The tracker estimates each player's velocity from consecutive position
+updates and predicts where they are between updates. Each update is compared
+with the position predicted from the previous one: while players sail
+straight within the tolerance their send interval grows towards the maximum,
+and a miss or a sharp turn drops it straight back to the minimum. Clients run
+the same prediction for the boats they render, so fewer updates give the
+same motion.
+"""
+import math
+
+
+class MotionState:
+    """Last observed position and velocity of one player"""
+    __slots__ = ('x', 'y', 'z', 'rotation', 'vx', 'vy', 'vz', 't', 'interval')
+
+    def __init__(self, x, y, z, rotation, t, interval):
+        self.x, self.y, self.z = x, y, z
+        self.rotation = rotation
+        self.vx = self.vy = self.vz = 0.0
+        self.t = t
+        self.interval = interval
+
+    def predict(self, now):
+        """Extrapolated (x, y, z) at time now"""
+        dt = now - self.t
+        return self.x + self.vx * dt, self.y + self.vy * dt, self.z + self.vz * dt
+
+    def velocity(self):
+        return {'x': round(self.vx, 3), 'y': round(self.vy, 3), 'z': round(self.vz, 3)}
+
+
+def angle_difference(a, b):
+    """Smallest absolute difference between two angles in radians"""
+    diff = (a - b) % (2 * math.pi)
+    return min(diff, 2 * math.pi - diff)
+
+
+class MotionTracker:
+    """Velocity estimates and adaptive send intervals for all players"""
+
+    def __init__(self, min_interval=0.05, max_interval=0.5, tolerance=2.0,
+                 turn_tolerance=0.1, growth=1.5, max_extrapolation=1.0):
+        """
+        :param min_interval: Seconds between updates while maneuvering
+        :param max_interval: Seconds between updates on a steady course
+        :param tolerance: Prediction error (units) still counted as a steady course
+        :param turn_tolerance: Heading change (radians) between updates that counts as a maneuver
+        :param growth: Factor the interval grows by per well-predicted update
+        :param max_extrapolation: Longest time (seconds) a prediction is extended for
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tolerance = tolerance
+        self.turn_tolerance = turn_tolerance
+        self.growth = growth
+        self.max_extrapolation = max_extrapolation
+        self.states = {}
+
+    def observe(self, player_id, x, y, z, rotation, now):
+        """
+        Record a position update and adapt the player's send interval
+
+        :return: The player's MotionState after the update
+        """
+        state = self.states.get(player_id)
+        if state is None:
+            state = MotionState(x, y, z, rotation, now, self.min_interval)
+            self.states[player_id] = state
+            return state
+
+        dt = now - state.t
+        if dt <= 0:
+            state.x, state.y, state.z = x, y, z
+            return state
+
+        px, py, pz = state.predict(min(now, state.t + self.max_extrapolation))
+        error = math.sqrt((x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2)
+        turned = (rotation is not None and state.rotation is not None and
+                  angle_difference(rotation, state.rotation) > self.turn_tolerance)
+        if error > self.tolerance or turned:
+            state.interval = self.min_interval
+        else:
+            state.interval = min(state.interval * self.growth, self.max_interval)
+
+        state.vx, state.vy, state.vz = (x - state.x) / dt, (y - state.y) / dt, (z - state.z) / dt
+        state.x, state.y, state.z = x, y, z
+        if rotation is not None:
+            state.rotation = rotation
+        state.t = now
+        return state
+
+    def predict(self, player_id, now):
+        """Extrapolated (x, y, z) of a player, or None if not tracked"""
+        state = self.states.get(player_id)
+        if state is None:
+            return None
+        return state.predict(min(now, state.t + self.max_extrapolation))
+
+    def forget(self, player_id):
+        self.states.pop(player_id, None)
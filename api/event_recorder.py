@@ -0,0 +1,113 @@
+"""
+Record inbound Socket.IO events to a compact, timestamped log.
+
+The recorder is installed as an event middleware in app.py. Each line of the
+log (NDJSON, gzip-compressed when the path ends in .gz) is either the header
+
+    {"version": 1, "started_at": <unix time>, "events": [...]}
+
+or one event:
+
+    [t, sid, event, handler_ms, payload]
+
+where t is seconds since the recording started and handler_ms is how long the
+handler took on this build. replay_events.py feeds these logs back into a
+server and compares latency distributions between builds.
+"""
+import gzip
+import json
+import threading
+import time
+
+RECORDING_VERSION = 1
+
+# Never write credentials into a recording
+SCRUBBED_FIELDS = ('firebaseToken',)
+
+
+def open_recording(path, mode):
+    """Open a recording file, transparently handling gzip"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def scrub_payload(payload):
+    """Drop credentials from a payload before it is written"""
+    if isinstance(payload, dict) and any(field in payload for field in SCRUBBED_FIELDS):
+        return {key: value for key, value in payload.items() if key not in SCRUBBED_FIELDS}
+    return payload
+
+
+class EventRecorder:
+    """Event middleware that appends every handled event to a recording file"""
+
+    def __init__(self, path, events=None, flush_interval=1.0):
+        """
+        :param path: Output file (.jsonl or .jsonl.gz)
+        :param events: Optional set of event names to record; None records everything
+        :param flush_interval: Seconds between flushes of the output buffer
+        """
+        self.path = path
+        self.events = set(events) if events else None
+        self.flush_interval = flush_interval
+        self.start_time = time.time()
+        self.last_flush = self.start_time
+        self.recorded = 0
+        self.lock = threading.Lock()
+        self.file = open_recording(path, 'w')
+        self.file.write(json.dumps({
+            'version': RECORDING_VERSION,
+            'started_at': self.start_time,
+            'events': sorted(self.events) if self.events else None
+        }) + '\n')
+
+    def __call__(self, event, call_next, sid, *args):
+        """Run the handler, then record the event with its handler latency"""
+        if self.events is not None and event not in self.events:
+            return call_next(sid, *args)
+
+        received_at = time.time()
+        start = time.perf_counter()
+        try:
+            return call_next(sid, *args)
+        finally:
+            handler_ms = (time.perf_counter() - start) * 1000
+            payload = scrub_payload(args[0]) if args else None
+            self.write(received_at - self.start_time, sid, event, handler_ms, payload)
+
+    def write(self, offset, sid, event, handler_ms, payload):
+        line = json.dumps([round(offset, 4), sid, event, round(handler_ms, 3), payload],
+                          separators=(',', ':'), default=str)
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line + '\n')
+            self.recorded += 1
+            now = time.time()
+            if now - self.last_flush >= self.flush_interval:
+                self.last_flush = now
+                self.file.flush()
+
+    def close(self):
+        """Flush and close the recording"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_recording(path):
+    """
+    Read a recording
+
+    :return: (header, events) where events is a list of
+             (t, sid, event, handler_ms, payload) tuples in time order
+    """
+    with open_recording(path, 'r') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != RECORDING_VERSION:
+            raise ValueError(f"Unsupported recording version: {header.get('version')}")
+        events = [tuple(json.loads(line)) for line in f if line.strip()]
+    events.sort(key=lambda entry: entry[0])
+    return header, events
@@ -1,10 +1,18 @@
 from firebase_admin import firestore
+from google.api_core.exceptions import FailedPrecondition
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import math
 import time
+import uuid
+import random
 
 # This will be initialized in app.py
 db = None
 
+# Firestore allows at most 500 writes in one batch
+MAX_BATCH_SIZE = 500
+
 # Simple timestamp serialization - just convert to string
 def serialize_timestamp(value):
     """Convert any timestamp to a string representation"""
@@ -13,13 +21,98 @@ def serialize_timestamp(value):
     # Just convert to string, no fancy handling
     return str(value)
 
+# Writes are described as (doc_ref, data, op) tuples, op being 'set', 'merge' or
+# 'update'. The *_writes builders below take the Firestore client to address the
+# documents with, so async_storage commits exactly the same writes through the
+# async client.
+
+def add_writes(batch, writes):
+    """Add (doc_ref, data, op) writes to a WriteBatch (sync or async)"""
+    for doc_ref, data, op in writes:
+        if op == 'update':
+            batch.update(doc_ref, data)
+        else:
+            batch.set(doc_ref, data, merge=(op == 'merge'))
+
+def commit_writes(writes):
+    """Commit writes atomically: directly if there is one, else in one batch"""
+    if len(writes) == 1:
+        doc_ref, data, op = writes[0]
+        if op == 'update':
+            doc_ref.update(data)
+        else:
+            doc_ref.set(data, merge=(op == 'merge'))
+        return
+    batch = db.batch()
+    add_writes(batch, writes)
+    batch.commit()
+
+def commit_in_batches(writes, batch_size=MAX_BATCH_SIZE, max_workers=4):
+    """
+    Commit many document writes through chunked WriteBatch commits in parallel
+    
+    :param writes: List of (doc_ref, data, op) tuples where op is 'set', 'merge' or 'update'
+    :param batch_size: Writes per batch (capped at Firestore's limit of 500)
+    :param max_workers: Number of batches committed concurrently
+    :return: (committed_ids, failed_ids) lists of document IDs
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    chunks = [writes[i:i + batch_size] for i in range(0, len(writes), batch_size)]
+    
+    def commit_chunk(chunk):
+        batch = db.batch()
+        add_writes(batch, chunk)
+        batch.commit()
+    
+    committed_ids = []
+    failed_ids = []
+    if not chunks:
+        return committed_ids, failed_ids
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        futures = [(chunk, executor.submit(commit_chunk, chunk)) for chunk in chunks]
+        for chunk, future in futures:
+            ids = [doc_ref.id for doc_ref, _, _ in chunk]
+            try:
+                future.result()
+                committed_ids.extend(ids)
+            except Exception as e:
+                print(f"Error committing batch of {len(chunk)} writes: {str(e)}")
+                failed_ids.extend(ids)
+    
+    return committed_ids, failed_ids
+
+def watch_collection(collection_ref, to_dict, on_change):
+    """
+    Attach a Firestore snapshot listener to a collection
+    
+    :param collection_ref: Collection (or query) to listen on
+    :param to_dict: Model to_dict function used to convert changed documents
+    :param on_change: Called as on_change(change_type, doc_id, data) for every
+                      changed document; change_type is 'ADDED', 'MODIFIED' or 'REMOVED'
+                      and data is None for removals
+    :return: Watch handle, call .unsubscribe() on it to stop listening
+    """
+    def on_snapshot(col_snapshot, changes, read_time):
+        for change in changes:
+            change_type = change.type.name
+            doc = change.document
+            data = None if change_type == 'REMOVED' else to_dict(doc)
+            try:
+                on_change(change_type, doc.id, data)
+            except Exception as e:
+                # Never let one bad document kill the listener thread
+                print(f"Error applying {change_type} change for {doc.id}: {str(e)}")
+    
+    return collection_ref.on_snapshot(on_snapshot)
+
 class Player:
     """Player model for Firestore"""
     collection_name = 'players'
     
     @staticmethod
-    def collection():
-        return db.collection(Player.collection_name)
+    def collection(client=None):
+        return (client or db).collection(Player.collection_name)
     
     @staticmethod
     def to_dict(doc_snapshot):
@@ -46,6 +139,27 @@ class Player:
     @staticmethod
     def create(player_id, **data):
         """Create new player"""
+        commit_writes(Player.create_writes(player_id, data))
+        
+        # Return the created player
+        return Player.get(player_id)
+    
+    @staticmethod
+    def create_writes(player_id, data, client=None):
+        """
+        Writes for create(). The storage pool may run an increment() for a new
+        player before its create(), so the document is merged rather than
+        replaced and the counters are added as increments: whichever write
+        lands first, none of the other's changes are lost.
+        """
+        player_data = Player.new_player_data(player_id, **data)
+        for field in GlobalStats.COUNTERS:
+            player_data[field] = firestore.Increment(player_data[field])
+        return [(Player.collection(client).document(player_id), player_data, 'merge')]
+    
+    @staticmethod
+    def new_player_data(player_id, **data):
+        """Document contents for a new player: defaults overridden by data"""
         # Set defaults if not provided
         defaults = {
             'name': f'Sailor {player_id[:4]}',
@@ -62,38 +176,86 @@ class Player:
         }
         
         # Update defaults with provided data
-        player_data = {**defaults, **data}
-        
-        # Create the document
-        doc_ref = Player.collection().document(player_id)
-        doc_ref.set(player_data)
-        
-        # Return the created player
-        return Player.get(player_id)
+        return {**defaults, **data}
     
     @staticmethod
     def update(player_id, **updates):
         """Update player fields"""
-        # Add updated_at timestamp
-        updates['updated_at'] = time.time()  # Use simple timestamp
-        
-        doc_ref = Player.collection().document(player_id)
-        doc_ref.update(updates)
+        Player.write(player_id, **updates)
         
         # Return updated player
         return Player.get(player_id)
     
+    @staticmethod
+    def write(player_id, **updates):
+        """Update player fields without reading the document back"""
+        commit_writes(Player.write_writes(player_id, updates))
+    
+    @staticmethod
+    def write_writes(player_id, updates, client=None):
+        """Writes for write(): the fields plus updated_at"""
+        return [(Player.collection(client).document(player_id),
+                 {**updates, 'updated_at': time.time()}, 'update')]
+    
+    @staticmethod
+    def increment(player_id, **deltas):
+        """
+        Atomically increment player counters (fishCount, monsterKills, money)
+        and the matching global counters in one batch, without a read-back
+        """
+        commit_writes(Player.increment_writes(player_id, deltas))
+    
+    @staticmethod
+    def increment_writes(player_id, deltas, client=None):
+        """Writes for increment(): the player's counters and a global stats shard"""
+        # Merged, so an increment that lands before the player's create() isn't lost
+        writes = [(Player.collection(client).document(player_id), {
+            **{field: firestore.Increment(amount) for field, amount in deltas.items()},
+            'updated_at': time.time()
+        }, 'merge')]
+        writes.extend(GlobalStats.increment_writes({
+            GlobalStats.COUNTERS[field]: amount
+            for field, amount in deltas.items() if field in GlobalStats.COUNTERS
+        }, client))
+        return writes
+    
+    @staticmethod
+    def update_many(updates_by_id, batch_size=MAX_BATCH_SIZE, max_workers=4):
+        """
+        Update many players with batched writes (no read-back)
+        
+        :param updates_by_id: Dictionary of player ID -> fields to update
+        :return: (committed_ids, failed_ids)
+        """
+        now = time.time()
+        writes = [(Player.collection().document(player_id), {**updates, 'updated_at': now}, 'update')
+                  for player_id, updates in updates_by_id.items()]
+        return commit_in_batches(writes, batch_size, max_workers)
+    
     @staticmethod
     def delete(player_id):
         """Delete player"""
         Player.collection().document(player_id).delete()
     
+    @staticmethod
+    def get_many(player_ids):
+        """Get several players in one round trip, as a dict keyed by ID"""
+        refs = [Player.collection().document(player_id) for player_id in set(player_ids)]
+        if not refs:
+            return {}
+        return {doc.id: Player.to_dict(doc) for doc in db.get_all(refs) if doc.exists}
+    
     @staticmethod
     def get_all():
         """Get all players"""
         docs = Player.collection().stream()
         return [Player.to_dict(doc) for doc in docs]
     
+    @staticmethod
+    def watch(on_change):
+        """Listen for player document changes (see watch_collection)"""
+        return watch_collection(Player.collection(), Player.to_dict, on_change)
+    
     @staticmethod
     def get_active_players():
         """Get all active players"""
@@ -157,13 +319,96 @@ class Player:
         }
 
 
+class GlobalStats:
+    """
+    Global counters aggregated across all players, stored as shards under
+    stats/global/shards/<n> so concurrent increments don't contend on one document
+    """
+    collection_name = 'stats'
+    document_id = 'global'
+    NUM_SHARDS = 10
+    
+    # Player counter -> global counter it feeds. Coins are never spent, so the
+    # money total is coins earned rather than coins in circulation.
+    COUNTERS = {
+        'fishCount': 'totalFishCaught',
+        'monsterKills': 'totalMonstersSlain',
+        'money': 'totalCoinsEarned'
+    }
+    
+    @staticmethod
+    def shards(client=None):
+        return ((client or db).collection(GlobalStats.collection_name)
+                .document(GlobalStats.document_id)
+                .collection('shards'))
+    
+    @staticmethod
+    def increment_writes(deltas, client=None):
+        """Writes incrementing global counters (on a random shard); none without deltas"""
+        if not deltas:
+            return []
+        shard_ref = GlobalStats.shards(client).document(str(random.randrange(GlobalStats.NUM_SHARDS)))
+        return [(shard_ref, {name: firestore.Increment(amount) for name, amount in deltas.items()}, 'merge')]
+    
+    @staticmethod
+    def reset(totals):
+        """
+        Replace the shards with the given totals (held in shard 0), in one batch
+        
+        :param totals: Global counter name -> value, e.g. summed from the players
+        """
+        batch = db.batch()
+        batch.set(GlobalStats.shards().document('0'),
+                  {name: totals.get(name, 0) for name in GlobalStats.COUNTERS.values()})
+        for shard in range(1, GlobalStats.NUM_SHARDS):
+            batch.delete(GlobalStats.shards().document(str(shard)))
+        batch.commit()
+    
+    @staticmethod
+    def get_totals():
+        """Sum the shards into the current global totals"""
+        totals = {name: 0 for name in GlobalStats.COUNTERS.values()}
+        for doc in GlobalStats.shards().stream():
+            for name, value in doc.to_dict().items():
+                if name in totals:
+                    totals[name] += value
+        return totals
+
+
+class LeaderboardSnapshot:
+    """
+    Persisted state of a time-windowed leaderboard (see leaderboards.py),
+    one document per window: leaderboards/day, leaderboards/week
+    """
+    collection_name = 'leaderboards'
+
+    @staticmethod
+    def collection():
+        return db.collection(LeaderboardSnapshot.collection_name)
+
+    @staticmethod
+    def get(window):
+        doc = LeaderboardSnapshot.collection().document(window).get()
+        return doc.to_dict() if doc.exists else None
+
+    @staticmethod
+    def save(window, snapshot):
+        """Replace a window's snapshot"""
+        LeaderboardSnapshot.collection().document(window).set(snapshot)
+
+
 class Island:
     """Island model for Firestore"""
     collection_name = 'islands'
     
     @staticmethod
-    def collection():
-        return db.collection(Island.collection_name)
+    def collection(client=None):
+        return (client or db).collection(Island.collection_name)
+    
+    @staticmethod
+    def new_id():
+        """Generate a collision-free island ID"""
+        return f"island_{uuid.uuid4().hex}"
     
     @staticmethod
     def to_dict(doc_snapshot):
@@ -208,6 +453,49 @@ class Island:
         # Return the created island
         return Island.get(island_id)
     
+    @staticmethod
+    def create_many(islands_data, batch_size=MAX_BATCH_SIZE, max_workers=4):
+        """
+        Create many islands with batched writes (no read-back)
+        
+        :param islands_data: List of island dicts; missing IDs are generated
+        :return: (created, failed_ids) where created is a list of island dicts
+        """
+        prepared = Island.prepare_many(islands_data)
+        by_id = {island_id: island for island_id, _, island in prepared}
+        committed_ids, failed_ids = commit_in_batches(Island.create_writes(prepared), batch_size, max_workers)
+        return [by_id[island_id] for island_id in committed_ids], failed_ids
+    
+    @staticmethod
+    def create_writes(prepared, client=None):
+        """Writes for create_many(), one per island from prepare_many()"""
+        return [(Island.collection(client).document(island_id), island_data, 'set')
+                for island_id, island_data, _ in prepared]
+    
+    @staticmethod
+    def prepare_many(islands_data):
+        """
+        Documents for create_many()
+        
+        :return: List of (island_id, document data, island dict as to_dict would return it)
+        """
+        now = time.time()
+        prepared = []
+        for data in islands_data:
+            data = dict(data)
+            island_id = data.pop('id', None) or Island.new_id()
+            island_data = {
+                'position': {'x': 0, 'y': 0, 'z': 0},
+                'radius': 50,
+                'type': 'default',
+                'created_at': now,
+                **data
+            }
+            # Match what to_dict would return for the stored document
+            prepared.append((island_id, island_data, {
+                **island_data, 'id': island_id, 'created_at': serialize_timestamp(island_data['created_at'])}))
+        return prepared
+    
     @staticmethod
     def update(island_id, **updates):
         """Update island fields"""
@@ -230,6 +518,11 @@ class Island:
         """Get all islands"""
         docs = Island.collection().stream()
         return [Island.to_dict(doc) for doc in docs]
+    
+    @staticmethod
+    def watch(on_change):
+        """Listen for island document changes (see watch_collection)"""
+        return watch_collection(Island.collection(), Island.to_dict, on_change)
 
 
 class Message:
@@ -237,8 +530,8 @@ class Message:
     collection_name = 'messages'
     
     @staticmethod
-    def collection():
-        return db.collection(Message.collection_name)
+    def collection(client=None):
+        return (client or db).collection(Message.collection_name)
     
     @staticmethod
     def to_dict(doc_snapshot):
@@ -282,6 +575,119 @@ class Message:
         
         return created_message
     
+    @staticmethod
+    def new_id():
+        """Generate a message ID without a round trip"""
+        return Message.collection().document().id
+    
+    @staticmethod
+    def new_message_data(sender_id, content, message_type='global'):
+        """Document contents for a new message"""
+        return {
+            'sender_id': sender_id,
+            'content': content[:500],  # Limit message length
+            'timestamp': time.time(),
+            'message_type': message_type
+        }
+    
+    @staticmethod
+    def write(message_id, message_data):
+        """Store a message built by new_message_data (no read-back)"""
+        commit_writes(Message.write_writes(message_id, message_data))
+    
+    @staticmethod
+    def write_writes(message_id, message_data, client=None):
+        """Writes for write()"""
+        return [(Message.collection(client).document(message_id), message_data, 'set')]
+    
+    @staticmethod
+    def attach_senders(messages):
+        """Add sender_name/sender_color to messages with one batched player lookup"""
+        senders = Player.get_many(message['sender_id'] for message in messages)
+        for message in messages:
+            sender = senders.get(message['sender_id'])
+            if sender:
+                message['sender_name'] = sender.get('name', 'Unknown')
+                message['sender_color'] = sender.get('color')
+            else:
+                message['sender_name'] = 'Unknown'
+                message['sender_color'] = {'r': 0.5, 'g': 0.5, 'b': 0.5}
+        return messages
+    
+    @staticmethod
+    def get_page(message_type='global', limit=50, before=None):
+        """
+        Get a page of chat history, newest page first
+        
+        :param limit: Maximum number of messages in the page
+        :param before: Cursor from a previous page's next_cursor, or None for the newest page
+        :return: (messages in chronological order, next_cursor or None if there are no older messages)
+        
+        Needs the composite index on messages (message_type, timestamp DESC) from
+        firestore.indexes.json. Until it is built Firestore rejects the query with
+        FailedPrecondition and the page is cut from every message of the type instead.
+        """
+        query = (Message.collection()
+                 .where('message_type', '==', message_type)
+                 .order_by('timestamp', direction=firestore.Query.DESCENDING)
+                 .order_by('__name__', direction=firestore.Query.DESCENDING))
+        if before:
+            timestamp, message_id = before
+            query = query.start_after({'timestamp': timestamp,
+                                       '__name__': Message.collection().document(message_id)})
+        try:
+            docs = list(query.limit(limit).stream())
+        except FailedPrecondition as e:
+            print(f"Warning: messages index missing, paging in memory: {e}")
+            docs = Message._page_without_index(message_type, limit, before)
+        
+        next_cursor = None
+        if len(docs) == limit:
+            last = docs[-1]
+            next_cursor = (last.get('timestamp'), last.id)
+        
+        messages = Message.attach_senders([Message.to_dict(doc) for doc in docs])
+        messages.reverse()
+        return messages, next_cursor
+    
+    @staticmethod
+    def format_cursor(cursor):
+        """A get_page() next_cursor as the '<timestamp>_<message id>' string sent to clients"""
+        timestamp, message_id = cursor
+        return f"{timestamp}_{message_id}"
+    
+    @staticmethod
+    def parse_cursor(cursor):
+        """Parse a format_cursor() string back into a get_page() cursor (None if invalid)"""
+        try:
+            timestamp, message_id = cursor.split('_', 1)
+            timestamp = float(timestamp)
+        except (AttributeError, ValueError):
+            return None
+        if not math.isfinite(timestamp) or not message_id or '/' in message_id:
+            return None
+        return timestamp, message_id
+    
+    @staticmethod
+    def _page_without_index(message_type, limit, before):
+        """get_page's query done in memory: newest first by (timestamp, id), after the cursor"""
+        docs = [doc for doc in Message.collection().where('message_type', '==', message_type).stream()
+                if isinstance(doc.get('timestamp'), (int, float))]
+        docs.sort(key=lambda doc: (doc.get('timestamp'), doc.id), reverse=True)
+        if before:
+            docs = [doc for doc in docs if (doc.get('timestamp'), doc.id) < tuple(before)]
+        return docs[:limit]
+    
+    @staticmethod
+    def get_since(since, limit=10000):
+        """Messages of every type sent after a timestamp, oldest first (raw timestamps)"""
+        docs = (Message.collection()
+                .where('timestamp', '>', since)
+                .order_by('timestamp')
+                .limit(limit)
+                .stream())
+        return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+    
     @staticmethod
     def get(message_id):
         """Get message by ID"""
@@ -345,12 +751,36 @@ class Message:
         return messages
 
 class Inventory:
-    """Inventory model for Firestore - stores player's fish, treasures, and cargo"""
+    """
+    Inventory model for Firestore - stores player's fish, treasures, and cargo
+    
+    Items are stacked by name: stacks[field][name] holds the count, the first
+    and last time one was added and the item data. Items whose data has
+    'unique': true are kept one by one in the unique list instead (at most
+    MAX_UNIQUE_ITEMS). Older documents kept every item as its own entry in
+    fish/treasures/cargo arrays; compact() folds those in when they are read
+    and compact_inventories.py rewrites them.
+    """
     collection_name = 'inventories'
     
+    # Item type -> (inventory field, timestamp key of legacy and unique entries)
+    ITEM_FIELDS = {
+        'fish': ('fish', 'caught_at'),
+        'treasure': ('treasures', 'found_at'),
+        'cargo': ('cargo', 'acquired_at')
+    }
+    FIELDS = ('fish', 'treasures', 'cargo')
+    TIMESTAMP_KEYS = {field: timestamp_key for field, timestamp_key in ITEM_FIELDS.values()}
+    
+    # Version of the document layout written by this code
+    FORMAT = 2
+    MAX_UNIQUE_ITEMS = 200
+    # Reads and conditional writes remove_item() tries while the document keeps changing
+    REMOVE_ATTEMPTS = 3
+    
     @staticmethod
-    def collection():
-        return db.collection(Inventory.collection_name)
+    def collection(client=None):
+        return (client or db).collection(Inventory.collection_name)
     
     @staticmethod
     def to_dict(doc_snapshot):
@@ -368,6 +798,61 @@ class Inventory:
                 
         return data
     
+    @staticmethod
+    def is_unique(item_data):
+        return bool(item_data and item_data.get('unique'))
+    
+    @staticmethod
+    def stack_item(stacks, field, name, added_at, data=None, count=1):
+        """
+        Add items to an in-memory stacks map (the same change add_item() writes)
+        
+        :return: The updated stack {'count', 'first_at', 'last_at', 'data'}
+        """
+        stack = stacks.setdefault(field, {}).get(name)
+        if stack is None:
+            stack = {'count': 0, 'first_at': added_at, 'last_at': added_at, 'data': {}}
+            stacks[field][name] = stack
+        stack['count'] += count
+        stack['first_at'] = min(stack['first_at'], added_at)
+        stack['last_at'] = max(stack['last_at'], added_at)
+        if data:
+            stack['data'] = {**stack['data'], **data}
+        return stack
+    
+    @staticmethod
+    def compact(inventory):
+        """
+        Convert a stored inventory to the stacked layout, folding in any legacy
+        per-item arrays. Returns None for None.
+        """
+        if inventory is None:
+            return None
+        compacted = {key: value for key, value in inventory.items() if key not in Inventory.FIELDS}
+        # Copied, as folding legacy items in changes the stacks
+        stored_stacks = inventory.get('stacks') or {}
+        stacks = compacted['stacks'] = {
+            field: {name: dict(stack) for name, stack in stored_stacks.get(field, {}).items()}
+            for field in Inventory.FIELDS
+        }
+        unique = compacted['unique'] = list(inventory.get('unique') or [])
+        for field in Inventory.FIELDS:
+            legacy = inventory.get(field)
+            if not isinstance(legacy, list):
+                continue
+            timestamp_key = Inventory.TIMESTAMP_KEYS[field]
+            for entry in legacy:
+                data = dict(entry.get('data') or {})
+                added_at = entry.get(timestamp_key) or inventory.get('created_at') or 0
+                if Inventory.is_unique(data):
+                    unique.append({'type': field, 'name': entry.get('name'), 'at': added_at, 'data': data})
+                else:
+                    data.pop('count', None)
+                    Inventory.stack_item(stacks, field, entry.get('name'), added_at, data)
+        compacted['format'] = Inventory.FORMAT
+        compacted.setdefault('version', 0)
+        return compacted
+    
     @staticmethod
     def get(player_id):
         """Get player's inventory by player ID"""
@@ -378,26 +863,85 @@ class Inventory:
         if not inventory:
             return Inventory.create(player_id)
             
-        return inventory
+        return Inventory.compact(inventory)
     
     @staticmethod
-    def create(player_id):
-        """Create new inventory for a player with default empty collections"""
-        # Set defaults for a new inventory
-        defaults = {
+    def find(player_id):
+        """Get player's inventory by player ID, or None if there is none (never creates one)"""
+        return Inventory.compact(Inventory.to_dict(Inventory.collection().document(player_id).get()))
+    
+    @staticmethod
+    def new_item(item_type, item_name, item_data=None):
+        """
+        Describe an item being added
+        
+        :return: (inventory field, item) where item is {'name', 'at', 'data', 'unique'}
+        """
+        field, _ = Inventory.ITEM_FIELDS[item_type]
+        data = dict(item_data or {})
+        unique = Inventory.is_unique(data)
+        if not unique:
+            # Stacks do their own counting
+            data.pop('count', None)
+        return field, {'name': item_name, 'at': time.time(), 'data': data, 'unique': unique}
+    
+    @staticmethod
+    def item_write(player_id, field, item):
+        """Merge-write that adds an item from new_item() and bumps the version"""
+        if item['unique']:
+            change = {'unique': firestore.ArrayUnion([
+                {'type': field, 'name': item['name'], 'at': item['at'], 'data': item['data']}])}
+        else:
+            change = {'stacks': {field: {item['name']: {
+                'count': firestore.Increment(1),
+                'first_at': firestore.Minimum(item['at']),
+                'last_at': firestore.Maximum(item['at']),
+                'data': item['data']
+            }}}}
+        return {
             'player_id': player_id,
-            'fish': [],       # List of fish caught
-            'treasures': [],  # List of treasures found
-            'cargo': [],      # List of cargo/trade items
-            'created_at': time.time()
+            'format': Inventory.FORMAT,
+            'version': firestore.Increment(1),
+            'updated_at': time.time(),
+            **change
         }
-        
+    
+    @staticmethod
+    def add_item(player_id, field, item):
+        """
+        Add an item from new_item() and bump the inventory version in a single
+        write, without reading the document (created if missing)
+        """
+        commit_writes(Inventory.add_item_writes(player_id, field, item))
+    
+    @staticmethod
+    def add_item_writes(player_id, field, item, client=None):
+        """Writes for add_item()"""
+        return [(Inventory.collection(client).document(player_id),
+                 Inventory.item_write(player_id, field, item), 'merge')]
+    
+    @staticmethod
+    def create(player_id):
+        """Create new inventory for a player with default empty collections"""
         # Create the document with player_id as the document ID
         doc_ref = Inventory.collection().document(player_id)
-        doc_ref.set(defaults)
+        doc_ref.set(Inventory.new_inventory_data(player_id))
         
         # Return the created inventory
-        return Inventory.to_dict(doc_ref.get())
+        return Inventory.compact(Inventory.to_dict(doc_ref.get()))
+    
+    @staticmethod
+    def new_inventory_data(player_id):
+        """Document contents for a new, empty inventory"""
+        # Set defaults for a new inventory
+        return {
+            'player_id': player_id,
+            'format': Inventory.FORMAT,
+            'version': 0,
+            'stacks': {field: {} for field in Inventory.FIELDS},  # Item name -> stack
+            'unique': [],  # One entry per unique item
+            'created_at': time.time()
+        }
     
     @staticmethod
     def update(player_id, **updates):
@@ -414,110 +958,92 @@ class Inventory:
     @staticmethod
     def add_fish(player_id, fish_name, fish_data=None):
         """Add a fish to player's inventory"""
-        # Get current inventory
-        inventory = Inventory.get(player_id)
-        
-        # Create fish entry with timestamp
-        fish_entry = {
-            'name': fish_name,
-            'caught_at': time.time(),
-            'data': fish_data or {}
-        }
-        
-        # Ensure fish array exists
-        current_fish = inventory.get('fish', [])
-        
-        # Add new fish
-        current_fish.append(fish_entry)
-        
-        # Update inventory
-        return Inventory.update(player_id, fish=current_fish)
+        Inventory.add_item(player_id, *Inventory.new_item('fish', fish_name, fish_data))
+        return Inventory.get(player_id)
     
     @staticmethod
     def add_treasure(player_id, treasure_name, treasure_data=None):
         """Add a treasure to player's inventory"""
-        # Get current inventory
-        inventory = Inventory.get(player_id)
-        
-        # Create treasure entry with timestamp
-        treasure_entry = {
-            'name': treasure_name,
-            'found_at': time.time(),
-            'data': treasure_data or {}
-        }
-        
-        # Ensure treasures array exists
-        current_treasures = inventory.get('treasures', [])
-        
-        # Add new treasure
-        current_treasures.append(treasure_entry)
-        
-        # Update inventory
-        return Inventory.update(player_id, treasures=current_treasures)
+        Inventory.add_item(player_id, *Inventory.new_item('treasure', treasure_name, treasure_data))
+        return Inventory.get(player_id)
     
     @staticmethod
     def add_cargo(player_id, cargo_name, cargo_data=None):
         """Add cargo item to player's inventory"""
-        # Get current inventory
-        inventory = Inventory.get(player_id)
-        
-        # Create cargo entry with timestamp
-        cargo_entry = {
-            'name': cargo_name,
-            'acquired_at': time.time(),
-            'data': cargo_data or {}
-        }
-        
-        # Ensure cargo array exists
-        current_cargo = inventory.get('cargo', [])
-        
-        # Add new cargo
-        current_cargo.append(cargo_entry)
-        
-        # Update inventory
-        return Inventory.update(player_id, cargo=current_cargo)
+        Inventory.add_item(player_id, *Inventory.new_item('cargo', cargo_name, cargo_data))
+        return Inventory.get(player_id)
     
     @staticmethod
-    def remove_item(player_id, item_type, item_index):
-        """Remove an item from player's inventory by index"""
-        # Get current inventory
-        inventory = Inventory.get(player_id)
+    def remove_item(player_id, item_type, item_name):
+        """
+        Remove one item (by name) from player's inventory
         
+        The write only applies if the document hasn't changed since it was
+        read (and is retried otherwise), so concurrent removals can't take a
+        stack below zero.
+        """
         # Validate item type
-        if item_type not in ['fish', 'treasures', 'cargo']:
+        if item_type not in Inventory.FIELDS:
             raise ValueError("Item type must be 'fish', 'treasures', or 'cargo'")
         
-        # Get current items of the specified type
-        current_items = inventory.get(item_type, [])
-        
-        # Check if index is valid
-        if item_index < 0 or item_index >= len(current_items):
-            raise ValueError(f"Invalid index {item_index} for {item_type}")
-        
-        # Remove the item at the specified index
-        removed_item = current_items.pop(item_index)
+        doc_ref = Inventory.collection().document(player_id)
+        for _ in range(Inventory.REMOVE_ATTEMPTS):
+            snapshot = doc_ref.get()
+            change, removed = Inventory.removal(Inventory.to_dict(snapshot), item_type, item_name)
+            if change is None:
+                raise ValueError(f"No {item_name} in {item_type}")
+            try:
+                doc_ref.update({**change, 'version': firestore.Increment(1), 'updated_at': time.time()},
+                               option=db.write_option(last_update_time=snapshot.update_time))
+            except FailedPrecondition:
+                continue
+            # Return the removed item and updated inventory
+            return {'removed_item': {'name': item_name, 'data': removed}, 'inventory': Inventory.get(player_id)}
+        raise RuntimeError(f"Inventory of {player_id} kept changing while removing {item_name}")
+    
+    @staticmethod
+    def removal(stored, field, name):
+        """
+        Update taking one item off a stored (not compacted) inventory
         
-        # Update inventory
-        update_data = {item_type: current_items}
-        result = Inventory.update(player_id, **update_data)
+        Items still only in a legacy array are removed from that array; a
+        stack is decremented, and dropped with its last item.
         
-        # Return the removed item and updated inventory
-        return {'removed_item': removed_item, 'inventory': result}
+        :return: (update fields, removed item's data), or (None, None) if there is no such item
+        """
+        if not stored:
+            return None, None
+        stack = ((stored.get('stacks') or {}).get(field) or {}).get(name)
+        if stack and stack.get('count', 0) > 0:
+            stack_path = firestore.FieldPath('stacks', field, name).to_api_repr()
+            if stack['count'] > 1:
+                change = {stack_path + '.count': stack['count'] - 1}
+            else:
+                change = {stack_path: firestore.DELETE_FIELD}
+            return change, stack.get('data') or {}
+        legacy = stored.get(field)
+        if isinstance(legacy, list):
+            for index, entry in enumerate(legacy):
+                data = entry.get('data') or {}
+                # Unique legacy items are listed under unique, not in a stack
+                if entry.get('name') == name and not Inventory.is_unique(data):
+                    return {field: legacy[:index] + legacy[index + 1:]}, data
+        return None, None
     
     @staticmethod
     def get_all_player_inventories():
         """Get all player inventories"""
         docs = Inventory.collection().stream()
-        return [Inventory.to_dict(doc) for doc in docs]
+        return [Inventory.compact(Inventory.to_dict(doc)) for doc in docs]
     
     @staticmethod
     def clear_inventory(player_id):
         """Clear a player's entire inventory"""
         empty_inventory = {
-            'fish': [],
-            'treasures': [],
-            'cargo': [],
-            'updated_at': time.time()
+            'stacks': {field: {} for field in Inventory.FIELDS},
+            'unique': [],
+            'version': firestore.Increment(1),
+            **{field: firestore.DELETE_FIELD for field in Inventory.FIELDS}
         }
         
         return Inventory.update(player_id, **empty_inventory)
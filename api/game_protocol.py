@@ -0,0 +1,1660 @@
+"""
+Game protocol shared by the Flask-SocketIO server (app.py) and the asyncio
+server (asgi_app.py).
+
+This module owns the session caches and the Socket.IO event handlers. The
+entry points only differ in how they deliver messages and run storage calls,
+which they provide through init():
+
+- transport.emit(event, data, to=None, skip_sid=None) sends to one socket or
+  room (to), or broadcasts to everyone except skip_sid; transport.disconnect(sid)
+  drops a socket and transport.enter_room(sid, room) adds a socket to a room.
+  emit must be safe to call from storage callbacks.
+- storage.call(fn, *args, on_result=None, on_error=None, **kwargs) runs a
+  blocking firestore_models function without blocking the caller and invokes
+  the callbacks when it completes (see storage_pool.StoragePool).
+
+Handlers are registered with @game_event and called as handler(sid, *args)
+through dispatch(), which applies the event middlewares. Events registered
+with a schema (see schemas.py) have their payload validated before the
+handler runs; the handler only ever sees the cleaned payload.
+"""
+import math
+import os
+import re
+import threading
+import time
+import logging
+from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial, wraps
+from firebase_admin import auth as firebase_auth
+import firestore_models
+import leaderboards
+import schemas
+from admission import AdmissionController, ADMITTED, QUEUED, FULL
+from dead_reckoning import MotionTracker
+from inventory_cache import InventoryCache
+from loot import LootEngine
+from monsters import MonsterSimulation
+from projectiles import ProjectileSystem, HIT_RADIUS as CANNON_HIT_RADIUS
+from profile_cache import ProfileCache
+from worlds import WorldDirectory
+from chat_index import ChatSearchIndex
+
+logger = logging.getLogger(__name__)
+
+# Provided by the entry point through init()
+transport = None
+storage = None
+
+def init(game_transport, game_storage):
+    """Set the transport and storage used by the handlers"""
+    global transport, storage
+    transport = game_transport
+    storage = game_storage
+
+# Keep a session cache for quick access
+players = {}
+islands = {}
+
+# Add this near your other global variables
+last_db_update = defaultdict(float)  # Track last database update time for each player
+DB_UPDATE_INTERVAL = 2  # seconds between database updates
+# Add new distance threshold constant and tracking dictionary
+MIN_POSITION_UPDATE_DISTANCE = 20  # minimum distance in units to trigger a database update
+last_db_positions = {}  # Track last database position for each player
+
+# Highest position update sequence number accepted from each socket. Keyed by
+# sid, so a new session numbers from scratch and late packets of an old one
+# can't affect it.
+last_position_seq = {}
+
+# Dead reckoning: clients send positions at an interval the server adapts per player
+# (short while maneuvering or near other players, long on a steady course)
+motion = MotionTracker(
+    min_interval=float(os.environ.get('MIN_SEND_INTERVAL', 0.05)),
+    max_interval=float(os.environ.get('MAX_SEND_INTERVAL', 0.5)),
+    tolerance=float(os.environ.get('POSITION_TOLERANCE', 2.0))
+)
+NEARBY_DISTANCE = float(os.environ.get('NEARBY_DISTANCE', 150))  # units
+NEARBY_SEND_INTERVAL = float(os.environ.get('NEARBY_SEND_INTERVAL', 0.1))  # seconds, when others are nearby
+advertised_intervals = {}  # player_id -> send interval last sent to the client
+
+# Movement is relayed on a fixed tick, at a rate that depends on the distance between
+# sender and receiver: every tick when near, every RELAY_MID_EVERY ticks at medium range,
+# every RELAY_FAR_EVERY ticks far away and never beyond the cutoff.
+RELAY_TICK_INTERVAL = float(os.environ.get('RELAY_TICK_INTERVAL', 0.05))  # seconds
+RELAY_NEAR_DISTANCE = float(os.environ.get('RELAY_NEAR_DISTANCE', 300))
+RELAY_MID_DISTANCE = float(os.environ.get('RELAY_MID_DISTANCE', 1500))
+RELAY_CUTOFF_DISTANCE = float(os.environ.get('RELAY_CUTOFF_DISTANCE', 5000))
+RELAY_MID_EVERY = int(os.environ.get('RELAY_MID_EVERY', 4))
+RELAY_FAR_EVERY = int(os.environ.get('RELAY_FAR_EVERY', 20))
+relay_state = {}     # player_id -> latest player_moved payload
+relay_versions = {}  # player_id -> number of accepted updates, to skip unchanged boats
+relayed_versions = defaultdict(dict)  # receiver player_id -> {sender player_id: version sent}
+relay_tick_count = 0
+
+# Add this near your other global variables (at the top of the file)
+socket_to_user_map = {}
+# player_id -> sid of their current session. A player who rejoins before the
+# old socket has closed owns two sids for a while; only this one tears down.
+player_sockets = {}
+
+# Players whose cached position/rotation/mode hasn't been written to Firestore yet
+dirty_players = set()
+
+# Set once shutdown starts; new joins are refused from then on
+shutting_down = False
+SHUTDOWN_FLUSH_DEADLINE = float(os.environ.get('SHUTDOWN_FLUSH_DEADLINE', 8))  # seconds
+
+# Simple named counters reported by /api/metrics
+metrics = defaultdict(int)
+
+# Inventories of connected players, loaded at join and updated write-through
+inventories = InventoryCache(max_changes=int(os.environ.get('INVENTORY_DELTA_HISTORY', 100)))
+
+# Profiles of offline players read by /api/players/<id>, served stale-while-revalidate
+profiles = ProfileCache(
+    ttl=float(os.environ.get('PROFILE_CACHE_TTL', 30)),
+    stale_ttl=float(os.environ.get('PROFILE_CACHE_STALE_TTL', 300)),
+    max_entries=int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', 10000))
+)
+
+# Daily/weekly/all-time leaderboards, kept in memory and updated by player_action.
+# Daily and weekly snapshots are persisted at most every LEADERBOARD_PERSIST_INTERVAL.
+leaderboard = leaderboards.Leaderboards(players, max_entries=int(os.environ.get('LEADERBOARD_MAX_ENTRIES', 5000)))
+LEADERBOARD_PERSIST_INTERVAL = float(os.environ.get('LEADERBOARD_PERSIST_INTERVAL', 30))  # seconds
+last_leaderboard_persist = 0.0
+
+# Searchable chat from the last CHAT_RETENTION_SECONDS, per message_type
+CHAT_RETENTION_SECONDS = float(os.environ.get('CHAT_RETENTION_SECONDS', 24 * 3600))
+chat_index = ChatSearchIndex(retention_seconds=CHAT_RETENTION_SECONDS,
+                             max_messages=int(os.environ.get('CHAT_INDEX_MAX_MESSAGES', 50000)),
+                             message_types=schemas.MESSAGE_TYPES)
+
+# Islands reported by clients (register_island/register_islands) are buffered and
+# persisted with batched writes every ISLAND_FLUSH_INTERVAL, or sooner once
+# ISLAND_FLUSH_SIZE are waiting. Islands already known by ID, or at the same position
+# (rounded to ISLAND_POSITION_PRECISION units), are dropped without any write.
+ISLAND_FLUSH_INTERVAL = float(os.environ.get('ISLAND_FLUSH_INTERVAL', 2))  # seconds
+ISLAND_FLUSH_SIZE = int(os.environ.get('ISLAND_FLUSH_SIZE', 500))
+ISLAND_BUFFER_LIMIT = int(os.environ.get('ISLAND_BUFFER_LIMIT', 10000))
+ISLAND_POSITION_PRECISION = float(os.environ.get('ISLAND_POSITION_PRECISION', 1.0))  # units
+# Each player may queue ISLAND_REGISTER_BURST new islands at once, refilled at
+# ISLAND_REGISTER_RATE per second (a token bucket kept across reconnects), so one
+# client can't fill the buffer and the Islands collection on its own.
+ISLAND_REGISTER_BURST = float(os.environ.get('ISLAND_REGISTER_BURST', 1000))
+ISLAND_REGISTER_RATE = float(os.environ.get('ISLAND_REGISTER_RATE', 20))  # islands/second
+island_budgets = {}    # player_id -> [islands it may still queue, time of last refill]
+pending_islands = {}   # island_id -> island data waiting to be written
+island_positions = {}  # position key -> island_id, for known and pending islands
+last_island_flush = 0.0
+
+# Join admission: at most JOIN_MAX_CONCURRENT joins run at once and at most MAX_PLAYERS
+# sessions are joined or joining; other clients queue (FIFO, up to JOIN_QUEUE_LIMIT) and
+# are sent queue_position updates at most every QUEUE_UPDATE_INTERVAL seconds
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get('JOIN_MAX_CONCURRENT', 16)),
+    max_players=int(os.environ.get('MAX_PLAYERS', 500)),
+    max_queue=int(os.environ.get('JOIN_QUEUE_LIMIT', 5000))
+)
+QUEUE_UPDATE_INTERVAL = float(os.environ.get('QUEUE_UPDATE_INTERVAL', 1.0))  # seconds
+admission_pump_lock = threading.Lock()
+last_queue_update = 0.0
+
+# World instances (shards) hosted by this process; each has its own players, spatial
+# grids and broadcast room. A new instance opens when all are at WORLD_CAPACITY.
+worlds = WorldDirectory(
+    server_id=os.environ.get('WORLD_SERVER_ID', 'world'),
+    capacity=int(os.environ.get('WORLD_CAPACITY', 100)),
+    max_instances=int(os.environ.get('MAX_WORLD_INSTANCES', 8)),
+    relay_cell_size=RELAY_MID_DISTANCE / 2,
+    nearby_cell_size=NEARBY_DISTANCE
+)
+
+def world_room(player_id):
+    """Broadcast target for a player's world instance (everyone if they aren't in one)"""
+    world = worlds.of(player_id)
+    return world.room if world else None
+
+# Sea monsters are simulated here, one MonsterSimulation per world instance, stepped every
+# MONSTER_TICK_INTERVAL. Every MONSTER_SEND_INTERVAL each player is sent the monsters within
+# MONSTER_INTEREST_RADIUS. Kills only count when a server-simulated cannonball killed the monster.
+MONSTER_TICK_INTERVAL = float(os.environ.get('MONSTER_TICK_INTERVAL', 0.1))  # seconds
+MONSTER_SEND_INTERVAL = float(os.environ.get('MONSTER_SEND_INTERVAL', 0.2))  # seconds
+MONSTER_INTEREST_RADIUS = float(os.environ.get('MONSTER_INTEREST_RADIUS', 1000))  # units
+MONSTERS_PER_PLAYER = int(os.environ.get('MONSTERS_PER_PLAYER', 15))
+MAX_MONSTERS_PER_WORLD = int(os.environ.get('MAX_MONSTERS_PER_WORLD', 2000))
+# Credit player_action monster_killed as before, for clients that still simulate monsters locally
+TRUST_CLIENT_MONSTER_KILLS = os.environ.get('TRUST_CLIENT_MONSTER_KILLS', 'false').lower() == 'true'
+monster_worlds = {}          # world instance ID -> MonsterSimulation
+monster_views = {}           # player_id -> number of monsters last streamed to them
+last_monster_step = 0.0
+last_monster_send = 0.0
+
+# Cannonballs fly on the server: fire_cannons launches up to CANNON_MAX_SHOTS balls from the
+# player's boat at most every CANNON_COOLDOWN, every relay tick integrates them in one batch
+# per world instance, and hits are sent to players within CANNON_HIT_BROADCAST_RADIUS
+CANNON_COOLDOWN = float(os.environ.get('CANNON_COOLDOWN', 0.25))  # seconds
+CANNON_MAX_SHOTS = int(os.environ.get('CANNON_MAX_SHOTS', 3))
+CANNON_DAMAGE = int(os.environ.get('CANNON_DAMAGE', 3))
+MAX_PROJECTILES_PER_WORLD = int(os.environ.get('MAX_PROJECTILES_PER_WORLD', 512))
+CANNON_HIT_BROADCAST_RADIUS = float(os.environ.get('CANNON_HIT_BROADCAST_RADIUS', 500))  # units
+projectile_worlds = {}  # world instance ID -> ProjectileSystem
+last_cannon_fire = {}   # player_id -> time of their last accepted volley
+last_projectile_step = 0.0
+
+# Fishing: hook_fish draws the fish from the loot table of the biome the boat is in (at most
+# every FISHING_MIN_INTERVAL), and a successful land_fish within FISHING_CATCH_WINDOW awards
+# it: fish count, coins, inventory and leaderboards all come from award_catch()
+loot = LootEngine.load(os.environ.get('LOOT_TABLES_PATH',
+                                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loot_tables.json')))
+FISHING_MIN_INTERVAL = float(os.environ.get('FISHING_MIN_INTERVAL', 3))  # seconds
+FISHING_CATCH_WINDOW = float(os.environ.get('FISHING_CATCH_WINDOW', 30))  # seconds
+hooked_fish = {}       # player_id -> (catch, time hooked)
+last_fish_hooked = {}  # player_id -> time of their last hook
+
+# Load data from Firestore on startup
+def load_data_from_firestore():
+    # Load players
+    db_players = firestore_models.Player.get_all()
+    stale_sessions = {}
+    for player in db_players:
+        # Set all players to inactive on server start
+        if player.get('active', False):
+            stale_sessions[player['id']] = {'active': False}
+            player['active'] = False
+        players[player['id']] = player
+    
+    # Deactivate sessions left over from an unclean shutdown in bulk
+    if stale_sessions:
+        committed_ids, failed_ids = firestore_models.Player.update_many(stale_sessions)
+        logger.info(f"Deactivated {len(committed_ids)} stale sessions ({len(failed_ids)} failed)")
+    
+    # Load islands
+    db_islands = firestore_models.Island.get_all()
+    for island in db_islands:
+        islands[island['id']] = island
+        index_island_position(island)
+    
+    # Index lifetime totals for rank lookups
+    for player_id in players:
+        leaderboard.track(player_id)
+    
+    # Rebuild the chat search index from the retention window
+    recent_messages = firestore_models.Message.get_since(time.time() - CHAT_RETENTION_SECONDS,
+                                                         limit=chat_index.max_messages)
+    for message in recent_messages:
+        sender = players.get(message.get('sender_id'), {})
+        chat_index.add({**message, 'sender_name': sender.get('name', 'Unknown')})
+    
+    # Pick up the current day/week where the last run left off
+    for window, board in leaderboard.windows.items():
+        if board.restore(firestore_models.LeaderboardSnapshot.get(window)):
+            logger.info(f"Restored {window} leaderboard for {board.bucket}")
+    
+    logger.info(f"Loaded {len(players)} players and {len(islands)} islands from Firestore")
+
+# Keep caches coherent with changes made by other server instances or in the console.
+# Islands are always synced; player profile fields are opt-in because every position
+# write would otherwise come back to us as a change event.
+SYNC_PLAYER_PROFILES = os.environ.get('SYNC_PLAYER_PROFILES', 'false').lower() == 'true'
+PLAYER_PROFILE_FIELDS = ('name', 'color', 'fishCount', 'monsterKills', 'money')
+cache_watches = []  # Snapshot listener handles, so they can be unsubscribed
+# IDs of islands an admin bulk import is writing; the import announces them itself
+islands_being_imported = set()
+
+def apply_island_change(change_type, island_id, island):
+    """Apply an incremental island change from Firestore to the islands cache"""
+    if change_type == 'REMOVED':
+        island = islands.pop(island_id, None)
+        if island is not None:
+            unindex_island_position(island)
+            transport.emit('island_removed', {'id': island_id})
+            logger.info(f"Island {island_id} removed from cache (snapshot)")
+        return
+
+    # The initial snapshot replays every island as ADDED; only broadcast ones we didn't know
+    is_new = island_id not in islands
+    islands[island_id] = island
+    index_island_position(island)
+    if is_new and island_id not in islands_being_imported:
+        transport.emit('island_created', island)
+        logger.info(f"Island {island_id} added to cache (snapshot)")
+
+def apply_player_change(change_type, player_id, player):
+    """Apply profile field changes from Firestore to the players cache"""
+    if change_type == 'REMOVED':
+        # Only forget players that aren't connected to this instance
+        if player_id in players and not players[player_id].get('active', False):
+            del players[player_id]
+            leaderboard.track(player_id)
+        return
+
+    if player_id not in players:
+        # Player created elsewhere; cache it as inactive on this instance
+        players[player_id] = {**player, 'active': False}
+        leaderboard.track(player_id)
+        return
+
+    # Only copy profile fields so live position/session state is left alone
+    cached = players[player_id]
+    changed = {field: player[field] for field in PLAYER_PROFILE_FIELDS
+               if field in player and cached.get(field) != player[field]}
+    if changed:
+        cached.update(changed)
+        leaderboard.track(player_id)
+        if cached.get('active', False):
+            transport.emit('player_updated', {'id': player_id, **changed}, to=world_room(player_id))
+
+def start_cache_listeners():
+    """Start Firestore snapshot listeners that keep the caches in sync"""
+    # Listeners call back on Firestore's threads; apply changes where handlers run
+    cache_watches.append(firestore_models.Island.watch(
+        lambda *change: storage.defer(apply_island_change, *change)))
+    if SYNC_PLAYER_PROFILES:
+        cache_watches.append(firestore_models.Player.watch(
+            lambda *change: storage.defer(apply_player_change, *change)))
+    logger.info(f"Started cache listeners (player profiles: {SYNC_PLAYER_PROFILES})")
+
+# When set, replay_events.py can join as recorded players with 'replay:<secret>:<uid>'
+# tokens. Only ever set this on load-test servers.
+REPLAY_AUTH_SECRET = os.environ.get('REPLAY_AUTH_SECRET')
+if REPLAY_AUTH_SECRET:
+    logger.warning("REPLAY_AUTH_SECRET is set: replay tokens are accepted. Do not use in production!")
+
+# Add this new function for token verification
+def verify_firebase_token(token):
+    """Verify Firebase token and return the UID if valid"""
+    try:
+        if not token:
+            logger.warning("No token provided for verification")
+            return None
+        
+        if REPLAY_AUTH_SECRET and token.startswith('replay:'):
+            _, secret, uid = token.split(':', 2)
+            return uid if secret == REPLAY_AUTH_SECRET else None
+            
+        logger.info("Attempting to verify Firebase token")
+        
+        # Verify the token
+        decoded_token = firebase_auth.verify_id_token(token)
+        
+        # Get user UID from the token
+        uid = decoded_token['uid']
+        logger.info(f"Successfully verified Firebase token for user: {uid}")
+        return uid
+    except Exception as e:
+        logger.error(f"Error verifying Firebase token: {e}")
+        logger.exception("Token verification exception details:")  # This logs the full stack trace
+        return None
+
+# Middlewares wrap every game event handler. Each is called as
+# middleware(event, call_next, sid, *args) and must return call_next(sid, *args).
+event_middlewares = []
+
+# Event name -> handler(sid, *args), filled in by @game_event
+EVENT_HANDLERS = {}
+
+def game_event(event, schema=None):
+    """
+    Register a handler for a Socket.IO game event
+    
+    :param schema: Payload schema (see schemas.py); malformed payloads are
+                   dropped before the handler runs and counted in metrics as
+                   payload_rejected:<event>:<reason>
+    """
+    def decorator(handler):
+        if schema is None:
+            EVENT_HANDLERS[event] = handler
+            return handler
+        
+        validate = schemas.compile_schema(schema)
+        
+        @wraps(handler)
+        def validated(sid, data=None, *args):
+            payload, reason = validate(data)
+            if reason:
+                metrics[f'payload_rejected:{event}:{reason}'] += 1
+                logger.debug(f"Rejected {event} payload from {sid}: {reason}")
+                return None
+            return handler(sid, payload, *args)
+        
+        EVENT_HANDLERS[event] = validated
+        return handler
+    return decorator
+
+def dispatch(event, sid, *args):
+    """Run an event's handler through the event middlewares"""
+    call = EVENT_HANDLERS[event]
+    for middleware in reversed(event_middlewares):
+        call = partial(middleware, event, call)
+    return call(sid, *args)
+
+def collect_metrics():
+    """Server counters and gauges reported by /api/metrics in both server modes"""
+    return {
+        'counters': dict(metrics),
+        'storage': storage.metrics(),
+        'active_players': sum(1 for p in players.values() if p.get('active', False)),
+        'connected_sockets': len(socket_to_user_map),
+        'chat_index': chat_index.stats(),
+        'inventory_cache': inventories.metrics(),
+        'profile_cache': profiles.metrics(),
+        'admission': admission.metrics(),
+        'worlds': worlds.metrics(),
+        'monsters': {world_id: simulation.metrics() for world_id, simulation in list(monster_worlds.items())},
+        'projectiles': {world_id: system.metrics() for world_id, system in list(projectile_worlds.items())},
+        'loot': loot.metrics(),
+        'process_cpu_seconds': time.process_time()
+    }
+
+# Socket.IO event handlers
+def handle_connect(sid):
+    logger.info(f"Client connected: {sid}")
+
+def handle_disconnect(sid):
+    logger.error(f"Client disconnected: {sid}")
+    
+    # Free its join slot or queue place for the next client
+    admission.leave(sid)
+    pump_admissions()
+    
+    # Look up the player ID from our mapping
+    player_id = socket_to_user_map.pop(sid, None)
+    last_position_seq.pop(sid, None)
+    if player_id and player_sockets.get(player_id) != sid:
+        # A late disconnect of a socket the player has already rejoined from;
+        # their state now belongs to the new session
+        logger.info(f"Superseded socket {sid} of {player_id} disconnected")
+        return
+    player_sockets.pop(player_id, None)
+    logger.error(f'sid: {sid}')
+    logger.error(f"Socket to user map: {socket_to_user_map}")
+
+    logger.error(f"Player ID: {player_id}")
+    logger.error(f"Players: {players}")
+    
+    if player_id:
+        motion.forget(player_id)
+        advertised_intervals.pop(player_id, None)
+        forget_relay_state(player_id)
+        monster_views.pop(player_id, None)
+        last_cannon_fire.pop(player_id, None)
+        hooked_fish.pop(player_id, None)
+        last_fish_hooked.pop(player_id, None)
+        world = worlds.leave(player_id)
+        inventories.evict(player_id)
+    
+    # Shutdown already flushed and deactivated everyone in bulk
+    if shutting_down:
+        return
+    
+    # If this was a player, mark them as inactive
+    if player_id and player_id in players:
+        # Update player in Firestore and cache, including any unsaved movement
+        update_data = {'active': False, 'last_update': time.time()}
+        if player_id in dirty_players:
+            update_data.update(dirty_player_fields(player_id))
+            dirty_players.discard(player_id)
+        storage.call(firestore_models.Player.write, player_id, **update_data)
+        if player_id in players:
+            players[player_id]['active'] = False
+            # Their live record is the freshest profile we'll have for a while
+            profiles.store(player_id, {**players[player_id], **update_data})
+            
+            # Tell the rest of their world instance that the player left
+            transport.emit('player_disconnected', {'id': player_id}, to=world.room if world else None)
+            logger.error(f"Player {player_id} marked as inactive after disconnect")
+
+def refresh_player_profile(player_id):
+    """Re-read an offline player's profile in the background (once at a time per player)"""
+    if not profiles.start_refresh(player_id):
+        return
+    storage.call(firestore_models.Player.get, player_id,
+                 on_result=lambda profile: profiles.store(player_id, profile),
+                 on_error=lambda e: profiles.refresh_failed(player_id))
+
+def dirty_player_fields(player_id):
+    """Fields of a player's cached state that may not have been persisted yet"""
+    player = players[player_id]
+    fields = {key: player[key] for key in ('position', 'rotation', 'mode') if key in player}
+    fields['last_update'] = player.get('last_update', time.time())
+    return fields
+
+def shutdown(deadline=None):
+    """
+    Gracefully stop serving: refuse new joins, flush unsaved player state and
+    deactivate sessions with batched writes, then disconnect all sockets.
+    
+    :param deadline: Seconds allowed for flushing (defaults to SHUTDOWN_FLUSH_DEADLINE)
+    :return: False if shutdown had already started
+    """
+    global shutting_down
+    if shutting_down:
+        return False
+    shutting_down = True
+    deadline = SHUTDOWN_FLUSH_DEADLINE if deadline is None else deadline
+    start_time = time.time()
+    logger.info("Shutdown started")
+    
+    # Let queued storage writes land before flushing what's still dirty
+    drained, abandoned = storage.drain(timeout=deadline / 2)
+    # Apply their completions now (failed writes mark players dirty again)
+    storage.run_pending_callbacks()
+    logger.info(f"Drained {drained} pending storage calls ({abandoned} abandoned)")
+    
+    # One update per player: unsaved movement plus the inactive flag
+    updates = {}
+    for player_id in list(dirty_players):
+        if player_id in players:
+            updates[player_id] = dirty_player_fields(player_id)
+    for player_id, player in list(players.items()):
+        if player.get('active', False):
+            updates.setdefault(player_id, {})['active'] = False
+            player['active'] = False
+    
+    committed_ids, failed_ids = [], []
+    if updates:
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(firestore_models.Player.update_many, updates, max_workers=8)
+        try:
+            committed_ids, failed_ids = future.result(timeout=deadline)
+        except FutureTimeoutError:
+            logger.error(f"Shutdown flush did not finish within {deadline}s")
+        except Exception as e:
+            logger.error(f"Shutdown flush failed: {e}")
+        executor.shutdown(wait=False)
+    dirty_players.difference_update(committed_ids)
+    
+    # Write islands still waiting in the ingest buffer
+    if pending_islands:
+        try:
+            created, failed_ids = firestore_models.Island.create_many(list(pending_islands.values()))
+            logger.info(f"Stored {len(created)} buffered islands ({len(failed_ids)} failed)")
+        except Exception as e:
+            logger.error(f"Could not store buffered islands: {e}")
+        pending_islands.clear()
+    
+    # Save the daily/weekly leaderboards so a restart resumes them
+    for snapshot in leaderboard.dirty_snapshots():
+        try:
+            firestore_models.LeaderboardSnapshot.save(snapshot['window'], snapshot)
+        except Exception as e:
+            logger.error(f"Could not save {snapshot['window']} leaderboard: {e}")
+    
+    # Tell clients why they're being dropped, then disconnect them cleanly
+    transport.emit('server_shutdown', {'message': 'Server is restarting'})
+    for sid in list(socket_to_user_map):
+        try:
+            transport.disconnect(sid)
+        except Exception as e:
+            logger.warning(f"Error disconnecting {sid}: {e}")
+    
+    for watch in cache_watches:
+        watch.unsubscribe()
+    
+    logger.info(f"Shutdown complete in {time.time() - start_time:.2f}s: flushed {len(committed_ids)} "
+                f"of {len(updates)} player records ({len(failed_ids)} failed)")
+    return True
+
+@game_event('player_join', schema=schemas.PLAYER_JOIN)
+def handle_player_join(sid, data):
+    # Refuse new sessions once shutdown has started
+    if shutting_down:
+        transport.emit('server_shutdown', {'message': 'Server is restarting'}, to=sid)
+        return
+    
+    decision, position = admission.request(sid, data)
+    if decision == ADMITTED:
+        start_player_join(sid, data)
+    elif decision == FULL:
+        transport.emit('server_full', {'message': 'Server is full, please try again later'}, to=sid)
+    elif position is not None:
+        transport.emit('queue_position', {'position': position, 'queue_length': len(admission.queue)}, to=sid)
+    if decision == QUEUED:
+        logger.info(f"Join from {sid} queued at position {position}")
+
+def pump_admissions():
+    """Start queued joins while there is capacity"""
+    # Whoever holds the lock admits everyone that fits; the queue tick catches races
+    if not admission_pump_lock.acquire(blocking=False):
+        return
+    try:
+        while not shutting_down:
+            admitted = admission.next_admission()
+            if admitted is None:
+                break
+            start_player_join(*admitted)
+    finally:
+        admission_pump_lock.release()
+
+def join_finished(sid, joined):
+    """A join pipeline ended; let the next queued client in"""
+    admission.finish(sid, joined)
+    pump_admissions()
+
+def admission_tick():
+    """Admit queued joins and send changed queue positions, at most every QUEUE_UPDATE_INTERVAL"""
+    global last_queue_update
+    now = time.time()
+    if now - last_queue_update < QUEUE_UPDATE_INTERVAL:
+        return
+    last_queue_update = now
+    pump_admissions()
+    for sid, position, queue_length in admission.position_updates():
+        transport.emit('queue_position', {'position': position, 'queue_length': queue_length}, to=sid)
+
+def start_player_join(sid, data):
+    """First half of player_join, run once the join has been admitted"""
+    # Get the Firebase token and UID from the request
+    firebase_token = data.get('firebaseToken')
+    claimed_firebase_uid = data.get('player_id')
+    # ONLY proceed with database storage if Firebase authentication is provided and valid
+    if not (firebase_token and claimed_firebase_uid):
+        logger.warning(f"No Firebase authentication provided. No data will be stored.")
+        transport.emit('auth_required', {'message': 'Firebase authentication required'}, to=sid)
+        join_finished(sid, False)
+        return
+    
+    verified_uid = verify_firebase_token(firebase_token)
+    if not verified_uid or verified_uid != claimed_firebase_uid:
+        logger.warning(f"Firebase token verification failed. No data will be stored.")
+        transport.emit('auth_error', {'message': 'Authentication failed'}, to=sid)
+        join_finished(sid, False)
+        return
+    
+    logger.info(f"Authentication successful for Firebase user: {verified_uid}")
+    
+    # Store in our socket-to-user mapping
+    docid = "firebase_" + verified_uid
+    socket_to_user_map[sid] = docid
+    player_sockets[docid] = sid
+    logger.info(f"Mapped socket {sid} to user {docid}")
+    
+    # Load the player off the handler thread and finish joining when it arrives
+    storage.call(firestore_models.Player.get, docid,
+                 on_result=lambda existing_player: finish_player_join(sid, docid, verified_uid, data, existing_player),
+                 on_error=lambda e: join_failed(sid, docid, e))
+
+def forget_socket(sid, docid):
+    """Drop the mapping of a socket whose join didn't complete"""
+    socket_to_user_map.pop(sid, None)
+    if player_sockets.get(docid) == sid:
+        del player_sockets[docid]
+
+def join_failed(sid, docid, error):
+    """Report a join that couldn't load the player from storage"""
+    logger.error(f"Could not load player {docid} for join: {error!r}")
+    metrics['joins_failed'] += 1
+    forget_socket(sid, docid)
+    transport.emit('join_error', {'message': 'Server busy, please retry'}, to=sid)
+    join_finished(sid, False)
+
+def finish_player_join(sid, docid, verified_uid, data, existing_player):
+    """Second half of player_join, run once the stored player has been loaded"""
+    world = worlds.assign(docid, data.get('world'))
+    if world is None:
+        logger.warning(f"No world instance has room for {docid}")
+        forget_socket(sid, docid)
+        transport.emit('server_full', {'message': 'All worlds on this server are full'}, to=sid)
+        join_finished(sid, False)
+        return
+    transport.enter_room(sid, world.room)
+    
+    if existing_player:
+        # Update the existing player in database
+        player_data = {
+            'active': True,
+            'last_update': time.time(),
+        }
+        storage.call(firestore_models.Player.write, docid, **player_data)
+        
+        # Update cache
+        players[docid] = {**existing_player, **player_data}
+        auth_player_data = existing_player
+    else:
+        # Create new player entry with stats
+        player_data = {
+            'name': data.get('name', f'Sailor {verified_uid[:4]}'),
+            'color': data.get('color', {'r': 0.3, 'g': 0.6, 'b': 0.8}),
+            'position': data.get('position', {'x': 0, 'y': 0, 'z': 0}),
+            'rotation': data.get('rotation', 0),
+            'mode': data.get('mode', 'boat'),
+            'last_update': time.time(),
+            'fishCount': 0,
+            'monsterKills': 0,
+            'money': 0,
+            'active': True,  # Mark as active when they join
+            'firebase_uid': verified_uid
+        }
+        storage.call(firestore_models.Player.create, docid, **player_data)
+        
+        # Cache what we wrote rather than waiting for the read-back
+        players[docid] = {**player_data, 'id': docid}
+        auth_player_data = player_data
+    
+    players[docid]['world'] = world.id
+    leaderboard.track(docid)
+    
+    # Tell the client how often to send positions until told otherwise (send_rate)
+    advertised_intervals[docid] = motion.min_interval
+    transport.emit('connection_response', {
+        **auth_player_data,
+        'world': world.id,
+        'send_interval': int(motion.min_interval * 1000),
+        'position_tolerance': motion.tolerance
+    }, to=sid)
+    
+    # Tell the world instance that a new player joined
+    transport.emit('player_joined', players[docid], to=world.room)
+    
+    # Send the instance's ACTIVE players to the new player
+    active_players = [players[player_id] for player_id in list(world.player_ids)
+                      if players.get(player_id, {}).get('active', False)]
+    transport.emit('all_players', active_players, to=sid)
+    
+    # Send all islands to the new player
+    transport.emit('all_islands', list(islands.values()), to=sid)
+    
+    # Cache the inventory for the session (never creates a document)
+    storage.call(firestore_models.Inventory.find, docid,
+                 on_result=lambda inventory: inventories.load(docid, inventory))
+    
+    # Send recent messages and leaderboard data to the new player when they load
+    storage.call(firestore_models.Message.get_recent_messages, limit=20,
+                 on_result=lambda messages: transport.emit('chat_history', messages, to=sid))
+    transport.emit('leaderboard_update', leaderboard.combined('all'), to=sid)
+    
+    join_finished(sid, True)
+
+@game_event('update_position', schema=schemas.UPDATE_POSITION)
+def handle_position_update(sid, data):
+    """
+    Handle frequent position updates from client.
+    Expects: { x, y, z, rotation, mode, player_id, seq }
+    
+    seq numbers each update from 1 per session; out-of-order and duplicate
+    updates are dropped before they reach the cache, persistence or broadcast.
+    """
+    player_id = data['player_id']
+    x, y, z = data['x'], data['y'], data['z']
+    rotation = data.get('rotation')
+    mode = data.get('mode')
+    
+    # Only the player's current session may move their boat
+    if socket_to_user_map.get(sid) != player_id or player_sockets.get(player_id) != sid:
+        metrics['position_updates_wrong_socket'] += 1
+        return
+    
+    # Ensure player exists in cache
+    if player_id not in players:
+        logger.warning(f"Player ID {player_id} not found in cache. Ignoring position update.")
+        return
+    
+    # Drop stale (older than what we've applied) and duplicate updates
+    seq = data.get('seq')
+    if seq is not None:
+        last_seq = last_position_seq.get(sid)
+        if last_seq is not None and seq <= last_seq:
+            metrics['position_updates_duplicate' if seq == last_seq else 'position_updates_stale'] += 1
+            return
+        last_position_seq[sid] = seq
+    
+    current_time = time.time()
+    
+    # Construct position object for storage
+    position = {
+        'x': x,
+        'y': y,
+        'z': z
+    }
+    
+    # Only players placed in a world instance at join are simulated
+    world = worlds.of(player_id)
+    if world is None:
+        metrics['position_updates_no_world'] += 1
+        return
+    
+    # Track velocity and adapt how often this client should send
+    state = motion.observe(player_id, x, y, z, rotation, current_time)
+    world.player_grid.move(player_id, x, z)
+    adapt_send_interval(sid, player_id, state.interval, x, z, world)
+    
+    # Always update in-memory cache immediately for responsive gameplay
+    players[player_id]['position'] = position
+    if rotation is not None:
+        players[player_id]['rotation'] = rotation
+    if mode is not None:
+        players[player_id]['mode'] = mode
+    players[player_id]['last_update'] = current_time
+    dirty_players.add(player_id)
+    
+    # Calculate distance from last stored database position (if available)
+    should_update_db = False
+    if player_id not in last_db_positions:
+        # First time seeing this player, always update
+        should_update_db = True
+    else:
+        # Calculate distance between current and last stored position
+        last_pos = last_db_positions[player_id]
+        dx = x - last_pos['x']
+        dy = y - last_pos['y']
+        dz = z - last_pos['z']
+        distance = (dx*dx + dy*dy + dz*dz) ** 0.5  # Euclidean distance
+
+        # logger.info(f"Distance between current and last stored position: {distance}")
+        
+        # Update if moved more than threshold distance
+        if distance > MIN_POSITION_UPDATE_DISTANCE:
+            should_update_db = True
+    
+    # Throttle database updates to reduce Firestore writes
+    if current_time - last_db_update.get(player_id, 0) > DB_UPDATE_INTERVAL and should_update_db:
+        last_db_update[player_id] = current_time
+        last_db_positions[player_id] = position  # Update the last known DB position
+        
+        # Build update data with only necessary fields
+        update_data = {
+            'position': position,
+            'last_update': current_time
+        }
+        if rotation is not None:
+            update_data['rotation'] = rotation
+        if mode is not None:
+            update_data['mode'] = mode
+        
+        # Update in Firestore without holding up the movement relay. Clear the
+        # dirty flag first: a saturated pool fails the call (and runs on_error)
+        # inside storage.call, and the failure must be able to set it again.
+        dirty_players.discard(player_id)
+        storage.call(firestore_models.Player.write, player_id, **update_data,
+                     on_error=lambda e: dirty_players.add(player_id))
+        logger.debug(f"Updated player {player_id} position in Firestore (distance threshold)")
+    
+    # Broadcast to all other clients (not back to sender)
+    emit_data = {
+        'id': player_id,
+        'position': position,
+        'velocity': state.velocity()
+    }
+    if rotation is not None:
+        emit_data['rotation'] = rotation
+    if mode is not None:
+        emit_data['mode'] = mode
+    if seq is not None:
+        emit_data['seq'] = seq
+    
+    # Queue for the relay tick, which sends it to other players by distance
+    relay_state[player_id] = emit_data
+    relay_versions[player_id] = relay_versions.get(player_id, 0) + 1
+    world.relay_grid.move(player_id, x, z)
+
+def has_nearby_player(player_id, x, z, world):
+    """Whether another active player in the world instance is within NEARBY_DISTANCE of (x, z)"""
+    for other_id in world.player_grid.nearby(x, z, NEARBY_DISTANCE):
+        if other_id == player_id:
+            continue
+        other = players.get(other_id)
+        if other and other.get('active', False):
+            other_position = other.get('position', {})
+            dx = other_position.get('x', 0) - x
+            dz = other_position.get('z', 0) - z
+            if dx * dx + dz * dz <= NEARBY_DISTANCE * NEARBY_DISTANCE:
+                return True
+    return False
+
+def adapt_send_interval(sid, player_id, interval, x, z, world):
+    """Send the client a new position send interval (send_rate) when it changes enough"""
+    if interval > NEARBY_SEND_INTERVAL and has_nearby_player(player_id, x, z, world):
+        interval = NEARBY_SEND_INTERVAL
+    advertised = advertised_intervals.get(player_id)
+    # Speed up immediately; slow down only in noticeable steps
+    if advertised is not None and advertised <= interval < advertised * 1.25:
+        return
+    advertised_intervals[player_id] = interval
+    metrics['send_rate_changes'] += 1
+    transport.emit('send_rate', {'interval': int(interval * 1000)}, to=sid)
+
+def forget_relay_state(player_id):
+    """Stop relaying a player that left, and forget what was sent to them"""
+    relay_state.pop(player_id, None)
+    relay_versions.pop(player_id, None)
+    relayed_versions.pop(player_id, None)
+    for sent in list(relayed_versions.values()):
+        sent.pop(player_id, None)
+
+def relay_tick():
+    """
+    Send each connected player the movement of others in their world instance
+    that is due this tick, as one players_moved batch per receiver
+    """
+    global relay_tick_count
+    relay_tick_count += 1
+    tick = relay_tick_count
+    # Only look as far as the furthest tier that is due this tick
+    if tick % RELAY_FAR_EVERY == 0:
+        radius = RELAY_CUTOFF_DISTANCE
+    elif tick % RELAY_MID_EVERY == 0:
+        radius = RELAY_MID_DISTANCE
+    else:
+        radius = RELAY_NEAR_DISTANCE
+    near_sq, mid_sq, radius_sq = RELAY_NEAR_DISTANCE ** 2, RELAY_MID_DISTANCE ** 2, radius ** 2
+    
+    for receiver_id, receiver_sid in list(player_sockets.items()):
+        receiver = players.get(receiver_id)
+        world = worlds.of(receiver_id)
+        if not receiver or 'position' not in receiver or world is None:
+            continue
+        rx, rz = receiver['position']['x'], receiver['position']['z']
+        sent = relayed_versions[receiver_id]
+        batch = []
+        for sender_id in world.relay_grid.nearby(rx, rz, radius):
+            if sender_id == receiver_id:
+                continue
+            version = relay_versions.get(sender_id)
+            payload = relay_state.get(sender_id)
+            if payload is None or sent.get(sender_id) == version:
+                continue
+            position = payload['position']
+            dx, dz = position['x'] - rx, position['z'] - rz
+            distance_sq = dx * dx + dz * dz
+            if distance_sq > radius_sq:
+                continue
+            # Medium and far boats are only due on their tier's ticks
+            if distance_sq > near_sq and tick % (RELAY_MID_EVERY if distance_sq <= mid_sq else RELAY_FAR_EVERY):
+                continue
+            sent[sender_id] = version
+            batch.append(payload)
+        if batch:
+            metrics['relay_batches'] += 1
+            metrics['relay_updates'] += len(batch)
+            transport.emit('players_moved', batch, to=receiver_sid)
+
+def monster_tick():
+    """Step every world instance's monsters and stream them to their players when due"""
+    global last_monster_step, last_monster_send
+    now = time.monotonic()
+    if now - last_monster_step < MONSTER_TICK_INTERVAL:
+        return
+    # Don't jump monsters across the map after a stall
+    dt = min(now - last_monster_step, 1.0)
+    last_monster_step = now
+    send = now - last_monster_send >= MONSTER_SEND_INTERVAL
+    if send:
+        last_monster_send = now
+        player_sids = dict(player_sockets)
+    
+    live_worlds = set()
+    for world in list(worlds.instances.values()):
+        live_worlds.add(world.id)
+        simulation = monster_worlds.get(world.id)
+        if simulation is None:
+            simulation = monster_worlds[world.id] = MonsterSimulation(
+                capacity=MAX_MONSTERS_PER_WORLD, per_player=MONSTERS_PER_PLAYER)
+        viewers = []
+        for player_id in list(world.player_ids):
+            position = players.get(player_id, {}).get('position')
+            if position:
+                viewers.append((player_id, position['x'], position['z']))
+        simulation.step(dt, [(x, z) for _, x, z in viewers])
+        if not send:
+            continue
+        visible = simulation.visible_from([(x, z) for _, x, z in viewers], MONSTER_INTEREST_RADIUS)
+        for (player_id, _, _), rows in zip(viewers, visible):
+            sid = player_sids.get(player_id)
+            # An empty update is only needed once, to clear the monsters the client had
+            if sid is None or (not rows and not monster_views.get(player_id)):
+                continue
+            monster_views[player_id] = len(rows)
+            metrics['monster_updates'] += 1
+            transport.emit('monsters_update', {'monsters': rows}, to=sid)
+    
+    # Instances that closed take their monsters and cannonballs with them
+    for world_id in list(monster_worlds):
+        if world_id not in live_worlds:
+            del monster_worlds[world_id]
+            projectile_worlds.pop(world_id, None)
+
+def projectile_tick():
+    """Move every cannonball in flight and resolve what it hit"""
+    global last_projectile_step
+    now = time.monotonic()
+    dt = min(now - last_projectile_step, 0.25)
+    last_projectile_step = now
+    player_sids = None
+    for world_id, system in list(projectile_worlds.items()):
+        if not len(system):
+            continue
+        if player_sids is None:
+            player_sids = dict(player_sockets)
+        world = worlds.instances.get(world_id)
+        if world is None:
+            continue
+        # Targets: surfaced monsters and every boat in the instance
+        positions, keys = [], []
+        simulation = monster_worlds.get(world_id)
+        if simulation is not None:
+            for monster_id, position in simulation.surfaced():
+                positions.append(position)
+                keys.append(('monster', monster_id))
+        for player_id in list(world.player_ids):
+            position = players.get(player_id, {}).get('position')
+            if position:
+                positions.append((position['x'], 0.0, position['z']))
+                keys.append(('boat', player_id))
+        own_boats = {key[1]: key for key in keys if key[0] == 'boat'}
+        for shooter, (kind, target_id), x, y, z in system.step(dt, positions, keys, own_boats):
+            resolve_cannon_hit(world, simulation, player_sids, shooter, kind, target_id, x, y, z)
+
+def resolve_cannon_hit(world, simulation, player_sids, shooter, kind, target_id, x, y, z):
+    """Apply a cannonball hit and tell the players near it"""
+    killed = False
+    if kind == 'monster':
+        result = simulation.damage(target_id, x, z, CANNON_HIT_RADIUS * 2, CANNON_DAMAGE)
+        if result is None:
+            return
+        monster_type, _, killed = result
+        if killed and shooter in players:
+            credit_monster_kill(shooter)
+            sid = player_sids.get(shooter)
+            if sid is not None:
+                transport.emit('monster_killed', {
+                    'id': target_id,
+                    'type': monster_type,
+                    'monsterKills': players[shooter]['monsterKills']
+                }, to=sid)
+    metrics[f'cannon_hits:{kind}'] += 1
+    
+    hit = {'shooter': shooter, 'target': kind, 'id': target_id,
+           'x': round(x, 1), 'y': round(y, 1), 'z': round(z, 1), 'killed': killed}
+    radius_sq = CANNON_HIT_BROADCAST_RADIUS ** 2
+    for player_id in world.relay_grid.nearby(x, z, CANNON_HIT_BROADCAST_RADIUS):
+        position = players.get(player_id, {}).get('position', {})
+        dx, dz = position.get('x', 0) - x, position.get('z', 0) - z
+        sid = player_sids.get(player_id)
+        if sid is not None and dx * dx + dz * dz <= radius_sq:
+            transport.emit('cannon_hit', hit, to=sid)
+
+def background_tick():
+    """Work done on every relay tick: relay movement and monsters, flush islands, admit queued joins"""
+    relay_tick()
+    monster_tick()
+    projectile_tick()
+    flush_islands()
+    admission_tick()
+
+def run_relay_loop(sleep):
+    """
+    Run background_tick() every RELAY_TICK_INTERVAL until shutdown
+    
+    :param sleep: The server's sleep function (cooperative under eventlet)
+    """
+    while not shutting_down:
+        started_at = time.monotonic()
+        try:
+            background_tick()
+        except Exception:
+            logger.exception("Relay tick failed")
+        sleep(max(0.0, RELAY_TICK_INTERVAL - (time.monotonic() - started_at)))
+
+def broadcast_leaderboard():
+    """Broadcast the all-time leaderboard from memory"""
+    transport.emit('leaderboard_update', leaderboard.combined('all'))
+
+def persist_leaderboards(force=False):
+    """Save changed daily/weekly leaderboards, at most every LEADERBOARD_PERSIST_INTERVAL"""
+    global last_leaderboard_persist
+    now = time.time()
+    if not force and now - last_leaderboard_persist < LEADERBOARD_PERSIST_INTERVAL:
+        return
+    last_leaderboard_persist = now
+    for snapshot in leaderboard.dirty_snapshots():
+        window = snapshot['window']
+        storage.call(firestore_models.LeaderboardSnapshot.save, window, snapshot,
+                     on_error=lambda e, window=window: setattr(leaderboard.windows[window], 'dirty', True))
+
+def record_action(player_id, category, amount):
+    """Count a player action toward the time-windowed leaderboards and rank index"""
+    leaderboard.record(player_id, category, amount)
+    leaderboard.track(player_id)
+    persist_leaderboards()
+
+@game_event('player_action', schema=schemas.PLAYER_ACTION)
+def handle_player_action(sid, data):
+    # Get both action and type fields (to handle client inconsistencies)
+    action_type = data.get('action') or data.get('type')
+    
+    # Simplified: Just use the player_id from the current request
+    player_id = data['player_id']
+
+    logger.info(f"Player action data: {data}, player_id: {player_id}")
+    
+    # Ensure player exists
+    if player_id not in players:
+        logger.warning(f"Player ID {player_id} not found in cache. Ignoring action.")
+        return
+    
+    if action_type in ('fish_caught', 'money_earned'):
+        # Catches and their coins are awarded by land_fish from the server's loot tables
+        metrics[f'{action_type}_unverified'] += 1
+        logger.warning(f"Ignoring unverified {action_type} from {player_id}")
+        return
+    
+    if action_type == 'monster_killed':
+        # Kills are credited when a server-simulated cannonball kills the monster
+        if not TRUST_CLIENT_MONSTER_KILLS:
+            metrics['monster_kills_unverified'] += 1
+            logger.warning(f"Ignoring unverified monster_killed from {player_id}")
+            return
+        credit_monster_kill(player_id)
+
+def credit_monster_kill(player_id):
+    """Count a monster kill for a player and announce it"""
+    # Increment monster kills
+    if 'monsterKills' not in players[player_id]:
+        players[player_id]['monsterKills'] = 0
+    players[player_id]['monsterKills'] += 1
+    
+    # Atomically increment in Firestore (with the global counters)
+    storage.call(firestore_models.Player.increment, player_id, monsterKills=1)
+    record_action(player_id, 'monsterKills', 1)
+    
+    # Broadcast achievement to the player's world instance
+    transport.emit('player_achievement', {
+        'id': player_id,
+        'name': players[player_id]['name'],
+        'achievement': 'Defeated a sea monster!',
+        'monsterKills': players[player_id]['monsterKills']
+    }, to=world_room(player_id))
+    
+    # Update leaderboard
+    broadcast_leaderboard()
+
+@game_event('fire_cannons', schema=schemas.FIRE_CANNONS)
+def handle_fire_cannons(sid, data):
+    """
+    Fire a volley from the player's boat.
+    Expects: { shots: [{ x, z }, ...] }, the points each cannon aims at
+    
+    The server launches the balls and decides what they hit (see projectile_tick).
+    """
+    player_id = socket_to_user_map.get(sid)
+    world = worlds.of(player_id) if player_id else None
+    position = players.get(player_id, {}).get('position')
+    if world is None or not position:
+        return
+    
+    now = time.time()
+    if now - last_cannon_fire.get(player_id, 0) < CANNON_COOLDOWN:
+        metrics['cannon_volleys_throttled'] += 1
+        return
+    last_cannon_fire[player_id] = now
+    
+    system = projectile_worlds.get(world.id)
+    if system is None:
+        system = projectile_worlds[world.id] = ProjectileSystem(capacity=MAX_PROJECTILES_PER_WORLD)
+    for shot in data['shots'][:CANNON_MAX_SHOTS]:
+        if not system.fire(player_id, position['x'], position['z'], shot['x'], shot['z']):
+            metrics['cannon_shots_refused'] += 1
+            break
+    metrics['cannon_volleys'] += 1
+
+@game_event('hook_fish')
+def handle_hook_fish(sid, data=None):
+    """
+    A fish bit and the player started reeling it in; draw which fish it is
+    from the loot table of the biome the boat is in and send it as fish_hooked
+    """
+    player_id = socket_to_user_map.get(sid)
+    position = players.get(player_id, {}).get('position') if player_id else None
+    if not position:
+        return
+    
+    now = time.time()
+    if now - last_fish_hooked.get(player_id, 0) < FISHING_MIN_INTERVAL:
+        metrics['fish_hooks_throttled'] += 1
+        return
+    last_fish_hooked[player_id] = now
+    
+    catch = loot.draw(position['x'], position['z'])
+    hooked_fish[player_id] = (catch, now)
+    metrics['fish_hooked'] += 1
+    transport.emit('fish_hooked', catch, to=sid)
+
+@game_event('land_fish', schema=schemas.LAND_FISH)
+def handle_land_fish(sid, data):
+    """
+    The fishing minigame for the hooked fish ended.
+    Expects: { success }
+    """
+    player_id = socket_to_user_map.get(sid)
+    hooked = hooked_fish.pop(player_id, None) if player_id else None
+    if hooked is None or player_id not in players:
+        metrics['fish_landed_unhooked'] += 1
+        return
+    catch, hooked_at = hooked
+    if not data['success']:
+        return
+    if time.time() - hooked_at > FISHING_CATCH_WINDOW:
+        metrics['fish_landed_expired'] += 1
+        return
+    award_catch(sid, player_id, catch)
+
+def award_catch(sid, player_id, catch):
+    """Give a player a landed fish and its coins, the only way fish and fishing money are earned"""
+    player = players[player_id]
+    coins = catch['coins']
+    player['fishCount'] = player.get('fishCount', 0) + 1
+    player['money'] = player.get('money', 0) + coins
+    
+    # One atomic increment for both counters (with the global counters)
+    storage.call(firestore_models.Player.increment, player_id, fishCount=1, money=coins)
+    record_action(player_id, 'fishCount', 1)
+    record_action(player_id, 'money', coins)
+    
+    add_inventory_item(sid, player_id, 'fish', catch['name'], {
+        'value': catch['value'],
+        'rarity': catch['rarity'],
+        'color': catch['color'],
+        'difficulty': catch['difficulty'],
+        'biome': catch['biome']
+    })
+    
+    transport.emit('fish_landed', {
+        'fish': catch,
+        'coins': coins,
+        'fishCount': player['fishCount'],
+        'money': player['money']
+    }, to=sid)
+    
+    # Broadcast achievement to the player's world instance
+    transport.emit('player_achievement', {
+        'id': player_id,
+        'name': player['name'],
+        'achievement': f"Caught a {catch['name']} worth {coins} coins!",
+        'fishCount': player['fishCount'],
+        'money': player['money']
+    }, to=world_room(player_id))
+    
+    # Update leaderboard
+    broadcast_leaderboard()
+
+@game_event('get_player_stats', schema=schemas.GET_PLAYER_STATS)
+def handle_get_player_stats(sid, data):
+    """
+    Send a player's stats and all-time ranks to the requesting client
+    Expects: { player_id }
+    """
+    player_id = data['player_id']
+    if player_id not in players:
+        logger.warning(f"Player ID {player_id} not found in cache. Ignoring stats request.")
+        return
+    
+    player = players[player_id]
+    transport.emit('player_stats', {
+        'id': player_id,
+        'fishCount': player.get('fishCount', 0),
+        'monsterKills': player.get('monsterKills', 0),
+        'money': player.get('money', 0),
+        'ranks': leaderboard.player_ranks(player_id),
+        'totalPlayers': len(leaderboard.ranks['fishCount'])
+    }, to=sid)
+
+@game_event('get_leaderboard', schema=schemas.GET_LEADERBOARD)
+def handle_get_leaderboard(sid, data):
+    """
+    Send a leaderboard to the requesting client, with the players ranked
+    around the requester in each category
+    Expects: { player_id, window (day/week/all, optional), limit (optional) }
+    """
+    window = data['window']
+    board = leaderboard.combined(window, data['limit'])
+    board['window'] = window
+    player_id = data.get('player_id')
+    if player_id in players:
+        board['ranks'] = leaderboard.player_ranks(player_id)
+        board['around'] = {category: leaderboard.around(player_id, category)
+                           for category in leaderboards.CATEGORIES}
+    transport.emit('leaderboard_update', board, to=sid)
+
+@game_event('send_message', schema=schemas.SEND_MESSAGE)
+def handle_chat_message(sid, data):
+    """
+    Broadcast a chat message
+    Expects: { player_id, content, type (optional), player_name (optional) }
+    """
+    content = data['content']
+    player_id = data['player_id']
+    message_type = data['type']
+    
+    # IMPORTANT: Always use the client-provided name if available, else the cached one
+    player_name = data.get('player_name')
+    if not player_name and player_id in players:
+        player_name = players[player_id].get('name', 'Unknown Sailor')
+    final_name = player_name or 'Unknown Sailor'
+    
+    # Store the message for chat history and make it searchable
+    message_id = firestore_models.Message.new_id()
+    message_data = firestore_models.Message.new_message_data(player_id, content, message_type)
+    storage.call(firestore_models.Message.write, message_id, message_data)
+    chat_index.add({**message_data, 'id': message_id, 'sender_name': final_name})
+    
+    # Send message object with more info instead of just content
+    message_obj = {
+        'id': message_id,
+        'content': content,
+        'player_id': player_id,
+        'sender_name': final_name,
+        'message_type': message_type,
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    # Chat is per world instance
+    logger.info(f"Broadcasting chat message from {player_id} as '{final_name}'")
+    transport.emit('new_message', message_obj, to=world_room(player_id))
+
+@game_event('update_player_color', schema=schemas.UPDATE_PLAYER_COLOR)
+def handle_update_player_color(sid, data):
+    """
+    Update a player's color
+    Expects: { player_id, color: {r, g, b} }
+    """
+    player_id = data['player_id']
+    color = data['color']
+    
+    # Ensure player exists in cache
+    if player_id not in players:
+        logger.warning(f"Player ID {player_id} not found in cache. Ignoring color update.")
+        return
+    
+    # Update in-memory cache
+    players[player_id]['color'] = color
+    
+    # Update in Firestore directly with the data
+    storage.call(firestore_models.Player.write, player_id, color=color)
+    logger.info(f"Updated player {player_id} color to {color}")
+    
+    # Broadcast to the player's world instance
+    transport.emit('player_updated', {
+        'id': player_id,
+        'color': color
+    }, to=world_room(player_id))
+
+@game_event('update_player_name', schema=schemas.UPDATE_PLAYER_NAME)
+def handle_update_player_name(sid, data):
+    """
+    Update a player's name
+    Expects: { player_id, name }
+    """
+    logger.info(f"Received player name update: {data}")
+    
+    player_id = data['player_id']
+    name = data['name']
+    
+    # Apply server-side sanitization for extra security
+    sanitized_name = sanitize_player_name(name)
+    
+    if not sanitized_name or len(sanitized_name) < 2:
+        logger.warning(f"Name invalid after sanitization: '{name}' -> '{sanitized_name}'. Ignoring.")
+        return
+        
+    if len(sanitized_name) > 50:
+        logger.warning(f"Name too long ({len(sanitized_name)} chars): '{sanitized_name}'. Truncating.")
+        sanitized_name = sanitized_name[:50]
+    
+    # Ensure player exists in cache
+    if player_id not in players:
+        logger.warning(f"Player ID {player_id} not found in cache. Ignoring name update.")
+        return
+    
+    # Update in-memory cache
+    players[player_id]['name'] = sanitized_name
+    
+    # Update in Firestore directly
+    storage.call(firestore_models.Player.write, player_id, name=sanitized_name)
+    logger.info(f"Updated player {player_id} name to {sanitized_name}")
+    
+    # Broadcast to the player's world instance
+    transport.emit('player_updated', {
+        'id': player_id,
+        'name': sanitized_name
+    }, to=world_room(player_id))
+
+# Name sanitization patterns, compiled once
+HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+HTML_ENTITY_PATTERN = re.compile(r'&[^;]+;')
+CLAN_TAG_PATTERN = re.compile(r'\[(.*?)\]')
+CLAN_TAG_UNSAFE_PATTERN = re.compile(r'[<>&\\/\'"]')
+NAME_UNSAFE_CHARS = str.maketrans('', '', '\\/"\'')
+
+def sanitize_clan_tag(match):
+    """Keep a [clan tag] but strip unsafe characters from its content"""
+    return f"[{CLAN_TAG_UNSAFE_PATTERN.sub('', match.group(1))}]"
+
+def sanitize_player_name(name):
+    """
+    Sanitize player names to prevent XSS attacks and ensure valid formatting
+    """
+    # Skip if name is None
+    if name is None:
+        return None
+    
+    # Remove potentially dangerous HTML/JS characters
+    sanitized = HTML_TAG_PATTERN.sub('', name)  # Remove HTML tags
+    sanitized = HTML_ENTITY_PATTERN.sub('', sanitized)  # Remove HTML entities
+    
+    # Remove other potentially problematic characters
+    sanitized = sanitized.translate(NAME_UNSAFE_CHARS)
+    
+    # Allow clan tags in square brackets but sanitize their content
+    sanitized = CLAN_TAG_PATTERN.sub(sanitize_clan_tag, sanitized)
+    
+    # Trim whitespace and return
+    return sanitized.strip()
+
+@game_event('add_to_inventory', schema=schemas.ADD_TO_INVENTORY)
+def handle_add_to_inventory(sid, data):
+    """
+    Handle adding items to player's inventory
+    Expects: { player_id, item_type (treasure), item_name, item_data }
+    
+    Fish are only added by the server when they are landed (see award_catch).
+    """
+    player_id = data['player_id']
+    
+    # Ensure player exists in cache
+    if player_id not in players:
+        logger.warning(f"Player ID {player_id} not found in cache. Ignoring inventory update.")
+        return
+    
+    add_inventory_item(sid, player_id, data['item_type'], data['item_name'], data['item_data'])
+
+def add_inventory_item(sid, player_id, item_type, item_name, item_data):
+    """Add an item to a player's cached and stored inventory and send them the change"""
+    field, item = firestore_models.Inventory.new_item(item_type, item_name, item_data)
+    
+    # Write through: update the cached inventory now and tell the client which
+    # stack changed (or which unique item was added)
+    cached = inventories.add(player_id, field, item, max_unique=firestore_models.Inventory.MAX_UNIQUE_ITEMS)
+    if cached is not None:
+        version, change = cached
+        if change is None:
+            transport.emit('inventory_error', {'message': 'Too many unique items'}, to=sid)
+            return
+        transport.emit('inventory_updated', {'version': version, **change}, to=sid)
+    
+    def inventory_stored(_):
+        logger.info(f"Added {item_type} '{item_name}' to player {player_id}'s inventory")
+        if cached is None:
+            # Not cached yet (join still loading); load it now that the write has landed
+            storage.call(firestore_models.Inventory.find, player_id,
+                         on_result=lambda inventory: send_full_inventory(
+                             sid, 'inventory_updated', inventories.load(player_id, inventory)))
+    
+    def inventory_store_failed(error):
+        # Drop the cached copy so the next request reloads what was actually stored
+        logger.error(f"Could not store {item_type} '{item_name}' for {player_id}: {error!r}")
+        inventories.evict(player_id)
+        transport.emit('inventory_error', {'message': 'Inventory update failed, please retry'}, to=sid)
+    
+    storage.call(firestore_models.Inventory.add_item, player_id, field, item,
+                 on_result=inventory_stored, on_error=inventory_store_failed)
+
+def send_full_inventory(sid, event, cached):
+    """Send a whole cached inventory (including its version)"""
+    transport.emit(event, {'version': cached.version, 'inventory': cached.inventory}, to=sid)
+
+@game_event('get_inventory', schema=schemas.GET_INVENTORY)
+def handle_get_inventory(sid, data):
+    """
+    Handle request for player inventory
+    Expects: { player_id, version (optional) }
+    
+    With the version the client already has, the reply is { version, unchanged: true }
+    or { version, base_version, stacks: {field: {name: stack}}, unique: [entries] }
+    instead of the full inventory.
+    """
+    player_id = data['player_id']
+    known_version = data.get('version')
+    
+    cached = inventories.since(player_id, known_version)
+    if cached is not None:
+        version, kind, payload = cached
+        if kind == 'unchanged':
+            transport.emit('inventory_data', {'version': version, 'unchanged': True}, to=sid)
+        elif kind == 'delta':
+            transport.emit('inventory_data', {'version': version, 'base_version': known_version,
+                                              **payload}, to=sid)
+        else:
+            transport.emit('inventory_data', payload, to=sid)
+        return
+    
+    def inventory_loaded(inventory):
+        # Keep it cached if the player is connected here, otherwise just send it
+        if players.get(player_id, {}).get('active', False):
+            inventory = inventories.load(player_id, inventory).inventory
+        transport.emit('inventory_data', inventory or {'error': 'Inventory not found'}, to=sid)
+    
+    storage.call(firestore_models.Inventory.find, player_id,
+                 on_result=inventory_loaded,
+                 on_error=lambda e: transport.emit(
+                     'inventory_data', {'error': 'Inventory unavailable'}, to=sid))
+
+def island_position_key(island):
+    """
+    Rounded position of an island, so the same island reported twice matches
+    
+    :return: The key, or None if the stored position isn't a dict of finite numbers
+    """
+    position = island.get('position')
+    if position is None:
+        position = {}
+    if not isinstance(position, dict):
+        return None
+    key = []
+    for axis in ('x', 'y', 'z'):
+        value = position.get(axis, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return None
+        key.append(round(value / ISLAND_POSITION_PRECISION))
+    return tuple(key)
+
+def index_island_position(island):
+    key = island_position_key(island)
+    if key is None:
+        # Written before positions were validated; keep the island, just not deduplicated by position
+        metrics['islands_bad_position'] += 1
+        logger.warning(f"Island {island.get('id')!r} has a malformed position {island.get('position')!r}")
+        return
+    island_positions[key] = island['id']
+
+def unindex_island_position(island):
+    key = island_position_key(island)
+    if key is not None and island_positions.get(key) == island['id']:
+        del island_positions[key]
+
+def queue_island(island, player_id=None):
+    """
+    Buffer a client-reported island unless it is already known
+    
+    :param island: Validated schemas.ISLAND payload
+    :return: True if the island was queued
+    """
+    island_id = island['id']
+    if island_id in islands or island_id in pending_islands:
+        metrics['islands_duplicate'] += 1
+        return False
+    data = {
+        'id': island_id,
+        'position': {'x': island['x'], 'y': island['y'], 'z': island['z']},
+        'radius': island['radius'],
+        'type': island['type'],
+        'registered_by': player_id
+    }
+    if island_position_key(data) in island_positions:
+        metrics['islands_duplicate'] += 1
+        return False
+    if len(pending_islands) >= ISLAND_BUFFER_LIMIT:
+        metrics['islands_dropped'] += 1
+        return False
+    pending_islands[island_id] = data
+    index_island_position(data)
+    metrics['islands_queued'] += 1
+    return True
+
+def flush_islands(force=False):
+    """Persist buffered islands with batched writes and announce them in one event"""
+    global last_island_flush
+    if not pending_islands:
+        return
+    now = time.time()
+    if not force and len(pending_islands) < ISLAND_FLUSH_SIZE and now - last_island_flush < ISLAND_FLUSH_INTERVAL:
+        return
+    last_island_flush = now
+    prune_island_budgets(now)
+    batch = list(pending_islands.values())
+    pending_islands.clear()
+    
+    # Cache them before the write so the snapshot listener doesn't announce them again
+    for island in batch:
+        islands[island['id']] = island
+    
+    def islands_stored(result):
+        created, failed_ids = result
+        islands.update({island['id']: island for island in created})
+        for island_id in failed_ids:
+            forget_island(island_id)
+        metrics['islands_registered'] += len(created)
+        if created:
+            transport.emit('islands_created', created)
+        logger.info(f"Registered {len(created)} islands ({len(failed_ids)} failed)")
+    
+    def islands_failed(error):
+        logger.error(f"Could not store {len(batch)} islands: {error!r}")
+        for island in batch:
+            forget_island(island['id'])
+    
+    storage.call(firestore_models.Island.create_many, batch,
+                 on_result=islands_stored, on_error=islands_failed)
+
+def forget_island(island_id):
+    """Drop an island whose write failed, so a later report can retry it"""
+    island = islands.pop(island_id, None)
+    if island is not None:
+        unindex_island_position(island)
+
+def island_budget(player_id, now):
+    """The player's island token bucket, refilled up to now"""
+    budget = island_budgets.get(player_id)
+    if budget is None:
+        budget = island_budgets[player_id] = [ISLAND_REGISTER_BURST, now]
+    else:
+        budget[0] = min(ISLAND_REGISTER_BURST, budget[0] + (now - budget[1]) * ISLAND_REGISTER_RATE)
+        budget[1] = now
+    return budget
+
+def prune_island_budgets(now):
+    """Drop buckets that have refilled; a missing bucket starts full anyway"""
+    for player_id, (tokens, refilled_at) in list(island_budgets.items()):
+        if tokens + (now - refilled_at) * ISLAND_REGISTER_RATE >= ISLAND_REGISTER_BURST:
+            del island_budgets[player_id]
+
+def register_islands(sid, reported):
+    """Queue islands reported by a joined player's client, within the player's budget"""
+    player_id = socket_to_user_map.get(sid)
+    if player_id is None:
+        return
+    budget = island_budget(player_id, time.time())
+    for island in reported:
+        # Only new islands are charged, so a client resending ones we know isn't limited
+        if budget[0] < 1 and island['id'] not in islands and island['id'] not in pending_islands:
+            metrics['islands_over_budget'] += 1
+            continue
+        if queue_island(island, player_id=player_id):
+            budget[0] -= 1
+    if len(pending_islands) >= ISLAND_FLUSH_SIZE:
+        flush_islands()
+
+@game_event('register_island', schema=schemas.REGISTER_ISLAND)
+def handle_register_island(sid, data):
+    """
+    Handle a client reporting one island
+    Expects: { id, x, y, z, radius, type }
+    """
+    register_islands(sid, [data])
+
+@game_event('register_islands', schema=schemas.REGISTER_ISLANDS)
+def handle_register_islands(sid, data):
+    """
+    Handle a client reporting all its islands in one message
+    Expects: { islands: [{ id, x, y, z, radius, type }, ...] }
+    """
+    register_islands(sid, data['islands'])
+
+@game_event('latency_probe')
+def handle_latency_probe(sid, data=None):
+    """Echo the payload back as the acknowledgement (used by bench_sockets.py)"""
+    return data
@@ -0,0 +1,130 @@
+"""
+Write-through cache of connected players' inventories.
+
+Inventories are loaded when a player joins and kept in memory while they are
+connected. Added items update the cache immediately (and are written to
+Firestore by the caller). Every inventory carries a version that is bumped on
+each change and persisted on the document. A client that sends the version it
+has gets back "unchanged", the stacks changed and unique items added since
+that version, or the full inventory if it is too far behind for the change
+log. Inventories are stacked by item name (see firestore_models.Inventory), so
+both the full inventory and a delta stay small however long someone plays.
+"""
+import threading
+from collections import deque
+from firestore_models import Inventory
+
+
+class CachedInventory:
+    """One player's inventory with its version and recent changes"""
+
+    def __init__(self, inventory, max_changes):
+        self.inventory = inventory
+        self.version = inventory.get('version', 0) or 0
+        # (version, field, stack name) or (version, None, unique entry), oldest first
+        self.changes = deque(maxlen=max_changes)
+
+    @property
+    def unique_count(self):
+        return len(self.inventory['unique'])
+
+    def add(self, field, item):
+        """
+        Apply an item from Inventory.new_item()
+
+        :return: The change to send, {'stacks': {field: {name: stack}}} or {'unique': [entry]}
+        """
+        self.version += 1
+        self.inventory['version'] = self.version
+        if item['unique']:
+            entry = {'type': field, 'name': item['name'], 'at': item['at'], 'data': item['data']}
+            self.inventory['unique'].append(entry)
+            self.changes.append((self.version, None, entry))
+            return {'unique': [entry]}
+        stack = Inventory.stack_item(self.inventory['stacks'], field, item['name'], item['at'], item['data'])
+        self.changes.append((self.version, field, item['name']))
+        return {'stacks': {field: {item['name']: stack}}}
+
+    def since(self, known_version):
+        """
+        What a client holding known_version needs
+
+        :return: ('unchanged', None), ('delta', {'stacks': {field: {name: stack}}, 'unique': [entries]})
+                 or ('full', inventory)
+        """
+        if known_version == self.version:
+            return 'unchanged', None
+        oldest = self.changes[0][0] if self.changes else self.version + 1
+        if known_version is None or known_version > self.version or known_version < oldest - 1:
+            return 'full', self.inventory
+        stacks = {}
+        unique = []
+        for version, field, change in self.changes:
+            if version <= known_version:
+                continue
+            if field is None:
+                unique.append(change)
+            else:
+                # Current stack, so a name changed several times is sent once
+                stacks.setdefault(field, {})[change] = self.inventory['stacks'][field][change]
+        return 'delta', {'stacks': stacks, 'unique': unique}
+
+
+class InventoryCache:
+    """Inventories of connected players, keyed by player ID"""
+
+    def __init__(self, max_changes=100):
+        """
+        :param max_changes: Changes remembered per inventory for deltas
+        """
+        self.max_changes = max_changes
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def load(self, player_id, inventory):
+        """Cache a compacted inventory read from storage (None for a player without one)"""
+        if inventory is None:
+            inventory = Inventory.compact({'player_id': player_id})
+        with self.lock:
+            cached = CachedInventory(inventory, self.max_changes)
+            self.entries[player_id] = cached
+            return cached
+
+    def since(self, player_id, known_version):
+        """
+        CachedInventory.since() for a cached player
+
+        :return: (version, kind, payload), or None if the player isn't cached
+        """
+        with self.lock:
+            cached = self.entries.get(player_id)
+            self.stats['hits' if cached else 'misses'] += 1
+            if cached is None:
+                return None
+            return (cached.version, *cached.since(known_version))
+
+    def add(self, player_id, field, item, max_unique=None):
+        """
+        Add an item to a cached inventory
+
+        :return: (version, change) as from CachedInventory.add(), (version, None) if the
+                 item is unique and the player already has max_unique of them, or None
+                 if the player isn't cached
+        """
+        with self.lock:
+            cached = self.entries.get(player_id)
+            if cached is None:
+                return None
+            if item['unique'] and max_unique is not None and cached.unique_count >= max_unique:
+                return cached.version, None
+            change = cached.add(field, item)
+            return cached.version, change
+
+    def evict(self, player_id):
+        with self.lock:
+            self.entries.pop(player_id, None)
+
+    def metrics(self):
+        with self.lock:
+            return {**self.stats, 'cached': len(self.entries)}
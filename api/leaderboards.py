@@ -0,0 +1,300 @@
+"""
+In-memory leaderboards for the game server.
+
+Daily and weekly boards are time-bucketed counters: each window keeps one
+score table per category for the current bucket (UTC day or ISO week) and
+starts a fresh bucket automatically when time rolls over. Scores are added
+incrementally as player_action events arrive, so serving a board never
+touches Firestore. Each window's table is capped at max_entries players;
+when it grows past the cap the lowest scores are evicted, which also keeps a
+persisted snapshot well inside Firestore's 1 MiB document limit.
+
+The all-time board is a RankIndex per category over the lifetime totals in
+the players cache. It answers "top N", "rank of player X" and "players
+around X" in O(log n) without scanning every player.
+"""
+import bisect
+import heapq
+import threading
+import time
+from datetime import datetime, timezone
+
+CATEGORIES = ('fishCount', 'monsterKills', 'money')
+WINDOWS = ('day', 'week')
+
+
+def bucket_key(window, now=None):
+    """Identify the current bucket of a window, e.g. '2024-06-01' or '2024-W22'"""
+    moment = datetime.fromtimestamp(now if now is not None else time.time(), tz=timezone.utc)
+    if window == 'day':
+        return moment.strftime('%Y-%m-%d')
+    if window == 'week':
+        year, week, _ = moment.isocalendar()
+        return f"{year}-W{week:02d}"
+    raise ValueError(f"Unknown leaderboard window: {window}")
+
+
+class WindowedLeaderboard:
+    """Per-category scores for the current bucket of one time window"""
+
+    def __init__(self, window, max_entries=5000):
+        self.window = window
+        self.max_entries = max_entries
+        self.bucket = bucket_key(window)
+        self.scores = {category: {} for category in CATEGORIES}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _roll_over(self, now):
+        key = bucket_key(self.window, now)
+        if key != self.bucket:
+            self.bucket = key
+            self.scores = {category: {} for category in CATEGORIES}
+            self.dirty = True
+
+    def add(self, player_id, category, amount, now=None):
+        """Add to a player's score in the current bucket"""
+        with self.lock:
+            self._roll_over(now if now is not None else time.time())
+            table = self.scores[category]
+            table[player_id] = table.get(player_id, 0) + amount
+            self.dirty = True
+            # Trim in chunks so eviction cost is amortized over many adds
+            if len(table) > self.max_entries * 1.1:
+                keep = heapq.nlargest(self.max_entries, table.items(), key=lambda item: item[1])
+                self.scores[category] = dict(keep)
+
+    def top(self, category, limit=10, now=None):
+        """Highest scores in the current bucket as (player_id, score) pairs"""
+        with self.lock:
+            self._roll_over(now if now is not None else time.time())
+            return heapq.nlargest(limit, self.scores[category].items(), key=lambda item: item[1])
+
+    def snapshot(self):
+        """Serializable copy of the current bucket (clears the dirty flag)"""
+        with self.lock:
+            self.dirty = False
+            return {
+                'window': self.window,
+                'bucket': self.bucket,
+                'scores': {category: dict(table) for category, table in self.scores.items()},
+                'saved_at': time.time()
+            }
+
+    def restore(self, snapshot):
+        """Load a persisted snapshot if it belongs to the current bucket"""
+        if not snapshot or snapshot.get('bucket') != bucket_key(self.window):
+            return False
+        with self.lock:
+            self.bucket = snapshot['bucket']
+            stored = snapshot.get('scores', {})
+            self.scores = {category: dict(stored.get(category, {})) for category in CATEGORIES}
+            self.dirty = False
+        return True
+
+
+class RankIndex:
+    """
+    Order-statistic index of players by score for one category.
+
+    Keys are (-score, player_id) kept in sorted blocks of up to 2 * BLOCK_SIZE
+    keys, with a Fenwick tree over the block lengths. Updates, rank lookups and
+    positional lookups each touch one block plus O(log blocks) tree nodes.
+    Players with equal scores share a rank.
+    """
+    BLOCK_SIZE = 256
+
+    def __init__(self):
+        self.blocks = []  # Sorted lists of keys
+        self.maxes = []   # Last key of each block, for picking a block by bisect
+        self.tree = [0]   # Fenwick tree (1-based) over len(blocks[i])
+        self.scores = {}  # player_id -> indexed score
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _rebuild_tree(self):
+        tree = [0] * (len(self.blocks) + 1)
+        for i, block in enumerate(self.blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _tree_add(self, block_index, delta):
+        i = block_index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _count_before_block(self, block_index):
+        total, i = 0, block_index
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position):
+        """Block index and offset of the key at a 0-based position"""
+        block_index, step = 0, 1
+        while step * 2 < len(self.tree):
+            step *= 2
+        while step:
+            if block_index + step < len(self.tree) and self.tree[block_index + step] <= position:
+                block_index += step
+                position -= self.tree[block_index]
+            step //= 2
+        return block_index, position
+
+    def _insert(self, key):
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            self._rebuild_tree()
+            return
+        i = min(bisect.bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[i]
+        bisect.insort(block, key)
+        self.maxes[i] = block[-1]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self.blocks.insert(i + 1, block[self.BLOCK_SIZE:])
+            del block[self.BLOCK_SIZE:]
+            self.maxes[i] = block[-1]
+            self.maxes.insert(i + 1, self.blocks[i + 1][-1])
+            self._rebuild_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def _remove(self, key):
+        i = bisect.bisect_left(self.maxes, key)
+        block = self.blocks[i]
+        del block[bisect.bisect_left(block, key)]
+        if block:
+            self.maxes[i] = block[-1]
+            self._tree_add(i, -1)
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+            self._rebuild_tree()
+
+    def update(self, player_id, score):
+        """Index a player's current score"""
+        with self.lock:
+            old_score = self.scores.get(player_id)
+            if old_score == score:
+                return
+            if old_score is not None:
+                self._remove((-old_score, player_id))
+            self.scores[player_id] = score
+            self._insert((-score, player_id))
+
+    def remove(self, player_id):
+        with self.lock:
+            score = self.scores.pop(player_id, None)
+            if score is not None:
+                self._remove((-score, player_id))
+
+    def rank(self, player_id):
+        """1-based rank of a player (None if not indexed)"""
+        with self.lock:
+            score = self.scores.get(player_id)
+            if score is None:
+                return None
+            # Count players with a strictly higher score; '' sorts before any id
+            key = (-score, '')
+            i = bisect.bisect_left(self.maxes, key)
+            if i == len(self.blocks):
+                return len(self.scores) + 1
+            return self._count_before_block(i) + bisect.bisect_left(self.blocks[i], key) + 1
+
+    def position(self, player_id):
+        """0-based position of a player in index order (None if not indexed)"""
+        with self.lock:
+            score = self.scores.get(player_id)
+            if score is None:
+                return None
+            key = (-score, player_id)
+            i = bisect.bisect_left(self.maxes, key)
+            return self._count_before_block(i) + bisect.bisect_left(self.blocks[i], key)
+
+    def slice(self, start, count):
+        """(player_id, score) pairs at positions start .. start + count - 1"""
+        entries = []
+        with self.lock:
+            if start >= len(self.scores) or count <= 0:
+                return entries
+            block_index, offset = self._locate(max(start, 0))
+            while block_index < len(self.blocks) and len(entries) < count:
+                for neg_score, player_id in self.blocks[block_index][offset:offset + count - len(entries)]:
+                    entries.append((player_id, -neg_score))
+                block_index, offset = block_index + 1, 0
+        return entries
+
+
+def format_entries(entries, players, ranks=None):
+    """Turn (player_id, score) pairs into the client's leaderboard entry format"""
+    formatted = []
+    for index, (player_id, score) in enumerate(entries):
+        player = players.get(player_id, {})
+        entry = {
+            'id': player_id,
+            'name': player.get('name', 'Unknown Sailor'),
+            'value': score,
+            'color': player.get('color', {'r': 0.5, 'g': 0.5, 'b': 0.5})
+        }
+        if ranks is not None:
+            entry['rank'] = ranks[index]
+        formatted.append(entry)
+    return formatted
+
+
+class Leaderboards:
+    """Daily, weekly and all-time leaderboards served from memory"""
+
+    def __init__(self, players, max_entries=5000):
+        self.players = players
+        self.windows = {window: WindowedLeaderboard(window, max_entries) for window in WINDOWS}
+        self.ranks = {category: RankIndex() for category in CATEGORIES}
+
+    def track(self, player_id):
+        """Re-index a player's lifetime totals after the players cache changed"""
+        player = self.players.get(player_id)
+        for category, index in self.ranks.items():
+            if player is None:
+                index.remove(player_id)
+            else:
+                index.update(player_id, player.get(category, 0) or 0)
+
+    def player_ranks(self, player_id):
+        """All-time rank of a player in every category"""
+        return {category: index.rank(player_id) for category, index in self.ranks.items()}
+
+    def around(self, player_id, category, radius=5):
+        """All-time entries within radius positions of a player, with their ranks"""
+        index = self.ranks[category]
+        position = index.position(player_id)
+        if position is None:
+            return []
+        entries = index.slice(max(position - radius, 0), 2 * radius + 1)
+        return format_entries(entries, self.players, [index.rank(entry_id) for entry_id, _ in entries])
+
+    def record(self, player_id, category, amount):
+        """Count a player_action toward every time window"""
+        now = time.time()
+        for board in self.windows.values():
+            board.add(player_id, category, amount, now)
+
+    def combined(self, window='all', limit=10):
+        """Leaderboards for all categories in the get_combined_leaderboard format"""
+        if window == 'all':
+            return {category: format_entries(self.ranks[category].slice(0, limit), self.players)
+                    for category in CATEGORIES}
+        board = self.windows[window]
+        return {category: format_entries(board.top(category, limit), self.players)
+                for category in CATEGORIES}
+
+    def dirty_snapshots(self):
+        """Snapshots of windows changed since they were last persisted"""
+        return [board.snapshot() for board in self.windows.values() if board.dirty]
@@ -0,0 +1,119 @@
+"""
+Server-side fishing loot.
+
+Loot tables are data (loot_tables.json by default): for each biome, its
+weight in the biome map, a coin multiplier and the fish that can be caught
+there with their relative weights, values and minigame difficulty. Each
+table is compiled once into an alias-method sampler, so drawing a catch
+costs two random numbers and a list lookup however many fish a table has.
+
+Biomes are assigned per chunk exactly as src/biomes/biomeSystem.js does
+(the same seeded hash of the chunk coordinates, walked against the biome
+weights in order), so the server's biome for a position is the one the
+player sees.
+"""
+import json
+import math
+import random
+
+
+class AliasSampler:
+    """Draws indexes in proportion to fixed weights in O(1) (Vose's alias method)"""
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0 or any(w < 0 for w in weights):
+            raise ValueError("Weights must be non-negative and not all zero")
+        scaled = [w * n / total for w in weights]
+        self.probability = [0.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # What's left is 1 up to rounding
+        for i in small + large:
+            self.probability[i] = 1.0
+
+    def sample(self, rng):
+        i = int(rng.random() * len(self.probability))
+        return i if rng.random() < self.probability[i] else self.alias[i]
+
+
+class LootTable:
+    """One biome's catches, compiled"""
+
+    def __init__(self, biome):
+        self.id = biome['id']
+        self.weight = float(biome.get('weight', 1))
+        self.coin_multiplier = float(biome.get('coin_multiplier', 1.0))
+        fish = biome.get('fish') or []
+        if not fish:
+            raise ValueError(f"Biome {self.id} has no fish")
+        total = float(sum(entry['weight'] for entry in fish))
+        self.catches = []
+        for entry in fish:
+            value = int(entry['value'])
+            self.catches.append({
+                'name': entry['name'],
+                'value': value,
+                'coins': max(1, round(value * self.coin_multiplier)),
+                'rarity': round(entry['weight'] / total, 4),
+                'color': entry.get('color', 0xCCCCCC),
+                'difficulty': entry.get('difficulty', 1),
+                'biome': self.id
+            })
+        self.sampler = AliasSampler([entry['weight'] for entry in fish])
+
+    def draw(self, rng):
+        return self.catches[self.sampler.sample(rng)]
+
+
+class LootEngine:
+    """Maps positions to biomes and draws catches from their tables"""
+
+    def __init__(self, tables, rng=None):
+        """
+        :param tables: Parsed loot tables ({chunk_size, biome_seed, biomes: [...]})
+        """
+        self.chunk_size = float(tables.get('chunk_size', 600))
+        self.biome_seed = float(tables.get('biome_seed', 12345))
+        self.tables = [LootTable(biome) for biome in tables['biomes']]
+        if not self.tables:
+            raise ValueError("Loot tables define no biomes")
+        self.total_weight = sum(table.weight for table in self.tables)
+        self.rng = rng or random.Random()
+        self.stats = {'draws': 0}
+
+    @staticmethod
+    def load(path, rng=None):
+        with open(path) as f:
+            return LootEngine(json.load(f), rng=rng)
+
+    def _chunk_random(self, chunk_x, chunk_z):
+        # Same hash as seededRandom() in biomeSystem.js
+        h = math.sin(chunk_x * 12345.6789 + chunk_z * 9876.54321 + self.biome_seed) * 43758.5453123
+        return h - math.floor(h)
+
+    def table_at(self, x, z):
+        """The loot table of the biome at a world position"""
+        roll = self._chunk_random(math.floor(x / self.chunk_size), math.floor(z / self.chunk_size))
+        cumulative = 0.0
+        for table in self.tables:
+            cumulative += table.weight
+            if roll <= cumulative / self.total_weight:
+                return table
+        return self.tables[0]
+
+    def draw(self, x, z):
+        """A catch for a line cast at (x, z): {name, value, coins, rarity, color, difficulty, biome}"""
+        self.stats['draws'] += 1
+        return self.table_at(x, z).draw(self.rng)
+
+    def metrics(self):
+        return {**self.stats, 'biomes': len(self.tables)}
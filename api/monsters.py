@@ -0,0 +1,367 @@
+"""
+Server-authoritative sea monster simulation.
+
+Each world instance has one MonsterSimulation holding all of its monsters as
+NumPy arrays (one row per monster slot), so spawning, the behaviour state
+machine, movement and death run as a handful of vectorized operations per
+tick however many monsters there are. The behaviour mirrors
+src/entities/seaMonsters.js: monsters lurk at depth, hunt a nearby boat,
+surface to attack it, then dive again. Speeds are in units per second and
+probabilities per second (the client's per-frame values times 60).
+
+Players are found with a uniform grid built per query from a sorted array of
+cell keys (see nearest_within), so each monster only looks at players in the
+3x3 cells around it. The same kind of grid answers which monsters each player
+can see (see visible_from), so clients are only streamed monsters near them.
+
+Health only changes through damage(), which checks that the monster exists,
+is alive and surfaced and is where the hit landed, so kills can't be claimed
+for monsters that were never hit.
+"""
+import math
+import numpy as np
+
+TYPES = ('yellowBeast', 'kraken', 'seaSerpent', 'phantomJellyfish')
+TYPE_WEIGHTS = np.array([0.4, 0.2, 0.2, 0.2])
+TYPE_HEALTH = np.array([3, 6, 4, 3], dtype=np.int16)
+
+# Behaviour states, in the order of STATES
+LURKING, HUNTING, SURFACING, ATTACKING, DIVING, DYING = range(6)
+STATES = ('lurking', 'hunting', 'surfacing', 'attacking', 'diving', 'dying')
+
+SPEED = 6.6              # units/second (0.11 per frame at 60 fps)
+SURFACING_SPEED = 24.0   # units/second, both up and down
+DETECTION_RANGE = 200.0
+ATTACK_RANGE = 50.0
+DEPTH = -20.0
+SURFACE_TIME = 10.0      # seconds spent attacking on the surface
+DIVE_TIME = 30.0         # seconds at depth before considering resurfacing
+DEATH_TIME = 3.0         # seconds a dead monster sinks before it is removed
+SPAWN_MIN_DISTANCE = 300.0
+SPAWN_MAX_DISTANCE = 800.0
+WANDER_TURN_RATE = 0.6   # heading changes per second while lurking
+HUNT_RATE = 12.0         # chance per second of noticing a boat in detection range
+SURFACE_RATE = 0.3       # chance per second of surfacing unprovoked once the dive timer ran out
+DIVE_DRAG = 0.95 ** 60   # horizontal speed kept per second while diving
+CHARGE_SPEED = 3.0       # multiple of SPEED when charging a boat on the surface
+REPOSITION_SPEED = 1.2   # multiple of SPEED when swimming off to charge again
+SURFACED_DEPTH = -5.0    # monsters above this can be hit
+
+
+def cell_keys(cx, cz):
+    """One int64 key per (cx, cz) grid cell"""
+    return cx * (1 << 32) + (cz + (1 << 31))
+
+
+def nearest_within(points, targets, radius):
+    """
+    Nearest target within radius of every point
+
+    Targets are bucketed into cells of radius units and sorted by cell key, so
+    each point only compares against the targets in the 3x3 cells around its
+    own. The comparisons run column by column (the j-th target of each
+    neighbouring cell for every point at once), so the cost is 9 times the
+    fullest cell's occupancy in vectorized steps rather than points * targets.
+
+    :param points: (n, 2) array of x, z
+    :param targets: (m, 2) array of x, z
+    :return: (index into targets or -1, distance or inf) arrays of length n
+    """
+    n = len(points)
+    best = np.full(n, -1, dtype=np.int64)
+    best_sq = np.full(n, np.inf)
+    if n == 0 or len(targets) == 0:
+        return best, np.sqrt(best_sq)
+    target_cells = np.floor(targets / radius).astype(np.int64)
+    keys = cell_keys(target_cells[:, 0], target_cells[:, 1])
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    point_cells = np.floor(points / radius).astype(np.int64)
+    for dx in (-1, 0, 1):
+        for dz in (-1, 0, 1):
+            wanted = cell_keys(point_cells[:, 0] + dx, point_cells[:, 1] + dz)
+            start = np.searchsorted(sorted_keys, wanted, side='left')
+            count = np.searchsorted(sorted_keys, wanted, side='right') - start
+            for j in range(int(count.max())):
+                rows = np.flatnonzero(count > j)
+                candidates = order[start[rows] + j]
+                offset = targets[candidates] - points[rows]
+                distance_sq = np.einsum('ij,ij->i', offset, offset)
+                closer = distance_sq < best_sq[rows]
+                best[rows[closer]] = candidates[closer]
+                best_sq[rows[closer]] = distance_sq[closer]
+    outside = best_sq > radius * radius
+    best[outside] = -1
+    best_sq[outside] = np.inf
+    return best, np.sqrt(best_sq)
+
+
+class MonsterSimulation:
+    """All monsters of one world instance, as arrays indexed by slot"""
+
+    def __init__(self, capacity=2000, per_player=15, spawn_per_tick=50,
+                 despawn_distance=2000.0, seed=None):
+        """
+        :param capacity: Monsters this instance can hold at once
+        :param per_player: Monsters kept alive per player in the instance
+        :param spawn_per_tick: Monsters spawned at most per step, so a crowd joining doesn't spike one tick
+        :param despawn_distance: Monsters further than this from every player are removed
+        """
+        self.capacity = capacity
+        self.per_player = per_player
+        self.spawn_per_tick = spawn_per_tick
+        self.despawn_distance = despawn_distance
+        self.rng = np.random.default_rng(seed)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.timer = np.zeros(capacity)
+        self.reposition = np.zeros(capacity)  # seconds left swimming away before charging again
+        self.health = np.zeros(capacity, dtype=np.int16)
+        self.position = np.zeros((capacity, 3))
+        self.velocity = np.zeros((capacity, 3))
+        self.slots = {}  # monster ID -> slot
+        self.next_id = 1
+        self.steps = 0
+        self.stats = {'spawned': 0, 'despawned': 0, 'killed': 0, 'hits': 0, 'hits_rejected': 0}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def spawn(self, player_xz, count):
+        """Spawn up to count monsters at depth, 300-800 units from random players"""
+        free = np.flatnonzero(~self.active)[:count]
+        n = len(free)
+        if n == 0 or len(player_xz) == 0:
+            return 0
+        around = player_xz[self.rng.integers(len(player_xz), size=n)]
+        angle = self.rng.uniform(0, 2 * math.pi, n)
+        distance = self.rng.uniform(SPAWN_MIN_DISTANCE, SPAWN_MAX_DISTANCE, n)
+        kind = self.rng.choice(len(TYPES), size=n, p=TYPE_WEIGHTS)
+        ids = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+
+        self.active[free] = True
+        self.ids[free] = ids
+        self.kind[free] = kind
+        self.state[free] = LURKING
+        self.timer[free] = self.rng.uniform(0, DIVE_TIME, n)
+        self.reposition[free] = 0
+        self.health[free] = TYPE_HEALTH[kind]
+        self.position[free, 0] = around[:, 0] + np.cos(angle) * distance
+        self.position[free, 1] = DEPTH
+        self.position[free, 2] = around[:, 1] + np.sin(angle) * distance
+        self.velocity[free] = 0
+        self.slots.update(zip(ids.tolist(), free.tolist()))
+        self.stats['spawned'] += n
+        return n
+
+    def _free(self, slots):
+        for monster_id in self.ids[slots].tolist():
+            self.slots.pop(monster_id, None)
+        self.active[slots] = False
+
+    def step(self, dt, player_xz):
+        """
+        Advance every monster by dt seconds
+
+        :param player_xz: (x, z) of each of the instance's players
+        """
+        player_xz = np.asarray(player_xz, dtype=float).reshape(-1, 2)
+        self.steps += 1
+        self._populate(player_xz)
+        slots = np.flatnonzero(self.active)
+        if len(slots) == 0:
+            return
+        n = len(slots)
+        state = self.state[slots]
+        timer = self.timer[slots] - dt
+        reposition = np.maximum(self.reposition[slots] - dt, 0)
+        position = self.position[slots]
+        velocity = self.velocity[slots]
+        roll = self.rng.random(n)
+
+        # Nearest boat within detection range, and the unit vector towards it
+        target, distance = nearest_within(position[:, [0, 2]], player_xz, DETECTION_RANGE)
+        has_target = target >= 0
+        toward = np.zeros((n, 2))
+        if has_target.any():
+            offset = player_xz[target[has_target]] - position[has_target][:, [0, 2]]
+            toward[has_target] = offset / np.maximum(distance[has_target], 1e-6)[:, None]
+
+        lurking = state == LURKING
+        hunting = state == HUNTING
+        surfacing = state == SURFACING
+        attacking = state == ATTACKING
+        diving = state == DIVING
+        dying = state == DYING
+
+        # Lurking: wander at depth, notice boats, occasionally surface
+        turn = lurking & (roll < WANDER_TURN_RATE * dt)
+        heading = self.rng.uniform(0, 2 * math.pi, n)
+        velocity[turn, 0] = np.cos(heading[turn]) * SPEED * 0.5
+        velocity[turn, 2] = np.sin(heading[turn]) * SPEED * 0.5
+        velocity[lurking, 1] = 0
+        notice = lurking & has_target & (self.rng.random(n) < HUNT_RATE * dt)
+        wander_up = lurking & ~notice & (timer <= 0) & (self.rng.random(n) < SURFACE_RATE * dt)
+
+        # Hunting: chase the boat at depth, surface when close or when the hunt times out nearby
+        velocity[hunting, 0] = toward[hunting, 0] * SPEED * 1.5
+        velocity[hunting, 1] = 0
+        velocity[hunting, 2] = toward[hunting, 1] * SPEED * 1.5
+        hunt_over = hunting & (timer <= 0)
+        strike = hunting & has_target & (distance < ATTACK_RANGE)
+        strike |= hunt_over & (distance < ATTACK_RANGE * 2) & (roll < 0.7)
+        give_up = hunt_over & ~strike
+
+        # Surfacing: rise, steering towards a boat in attack range
+        velocity[surfacing, 1] = SURFACING_SPEED
+        steer = surfacing & (distance < ATTACK_RANGE * 2)
+        velocity[steer, 0] = toward[steer, 0] * SPEED
+        velocity[steer, 2] = toward[steer, 1] * SPEED
+        surfaced = surfacing & (position[:, 1] + velocity[:, 1] * dt >= 0)
+
+        # Attacking: charge through the boat, swim off, charge again
+        passed = attacking & has_target & (distance < 5) & (reposition <= 0)
+        reposition[passed] = self.rng.uniform(5, 7, int(passed.sum()))
+        charge = attacking & has_target & (reposition <= 0)
+        retreat = attacking & has_target & (reposition > 0)
+        velocity[charge, 0] = toward[charge, 0] * SPEED * CHARGE_SPEED
+        velocity[charge, 2] = toward[charge, 1] * SPEED * CHARGE_SPEED
+        velocity[retreat, 0] = -toward[retreat, 0] * SPEED * REPOSITION_SPEED
+        velocity[retreat, 2] = -toward[retreat, 1] * SPEED * REPOSITION_SPEED
+        velocity[attacking, 1] = 0
+        position[attacking, 1] = 0
+        # No boat within detection range means it is well past ATTACK_RANGE * 3 too
+        dive = attacking & ((timer <= 0) | ~has_target | (distance > ATTACK_RANGE * 3))
+
+        # Diving: sink back to depth, slowing down
+        velocity[diving, 1] = -SURFACING_SPEED
+        velocity[diving, 0] *= DIVE_DRAG ** dt
+        velocity[diving, 2] *= DIVE_DRAG ** dt
+        at_depth = diving & (position[:, 1] + velocity[:, 1] * dt <= DEPTH)
+
+        # Dying: sink and accelerate until removed
+        velocity[dying, 0] = 0
+        velocity[dying, 2] = 0
+        velocity[dying, 1] -= 216.0 * dt  # 0.06 per frame per frame
+
+        # Apply transitions after all behaviours read the old state
+        state[notice], timer[notice] = HUNTING, 10.0
+        state[wander_up], timer[wander_up] = SURFACING, 5.0
+        state[strike], timer[strike] = SURFACING, 3.0
+        state[give_up], timer[give_up] = LURKING, DIVE_TIME / 2
+        state[surfaced], timer[surfaced] = ATTACKING, SURFACE_TIME
+        reposition[surfaced] = 0
+        state[dive], timer[dive] = DIVING, 5.0
+        state[at_depth], timer[at_depth] = LURKING, DIVE_TIME
+
+        position += velocity * dt
+        position[surfaced, 1] = 0
+        velocity[surfaced, 1] = 0
+        position[at_depth, 1] = DEPTH
+        velocity[at_depth, 1] = 0
+
+        self.state[slots] = state
+        self.timer[slots] = timer
+        self.reposition[slots] = reposition
+        self.position[slots] = position
+        self.velocity[slots] = velocity
+
+        # Remove monsters that finished sinking
+        self._free(slots[dying & (timer <= 0)])
+
+    def _populate(self, player_xz):
+        """Top the population up towards per_player per player; drop monsters nobody is near"""
+        if len(player_xz) == 0:
+            if self.slots:
+                self.stats['despawned'] += len(self.slots)
+                self._free(np.flatnonzero(self.active))
+            return
+        # Far-away monsters only need checking now and then
+        if self.steps % 10 == 0:
+            slots = np.flatnonzero(self.active)
+            nearest, _ = nearest_within(self.position[slots][:, [0, 2]], player_xz, self.despawn_distance)
+            lost = slots[nearest < 0]
+            if len(lost):
+                self.stats['despawned'] += len(lost)
+                self._free(lost)
+        alive = int(np.count_nonzero(self.active & (self.state != DYING)))
+        wanted = min(self.capacity, self.per_player * len(player_xz)) - alive
+        if wanted > 0:
+            self.spawn(player_xz, min(wanted, self.spawn_per_tick))
+
+    def surfaced(self):
+        """(monster ID, (x, y, z)) of every living monster that can be hit"""
+        slots = np.flatnonzero(self.active & (self.state != DYING) & (self.position[:, 1] >= SURFACED_DEPTH))
+        return list(zip(self.ids[slots].tolist(), map(tuple, self.position[slots].tolist())))
+
+    def damage(self, monster_id, x, z, max_distance, amount):
+        """
+        Apply a hit landing at (x, z)
+
+        :return: None if the hit is rejected (unknown, dead or submerged monster, or
+                 further than max_distance), else (monster type, health left, killed)
+        """
+        slot = self.slots.get(monster_id)
+        if slot is None or self.state[slot] == DYING or self.position[slot, 1] < SURFACED_DEPTH:
+            self.stats['hits_rejected'] += 1
+            return None
+        dx, dz = self.position[slot, 0] - x, self.position[slot, 2] - z
+        if dx * dx + dz * dz > max_distance * max_distance:
+            self.stats['hits_rejected'] += 1
+            return None
+        self.stats['hits'] += 1
+        health = max(0, int(self.health[slot]) - amount)
+        self.health[slot] = health
+        killed = health == 0
+        if killed:
+            self.state[slot] = DYING
+            self.timer[slot] = DEATH_TIME
+            self.velocity[slot] = (0, -12.0, 0)
+            self.stats['killed'] += 1
+        return TYPES[self.kind[slot]], health, killed
+
+    def visible_from(self, viewers_xz, radius):
+        """
+        Rows of the monsters within radius of each viewer
+
+        :param viewers_xz: (x, z) of each viewer
+        :return: One list of [id, type, state, x, y, z, vx, vy, vz, health] rows per viewer
+        """
+        viewers_xz = np.asarray(viewers_xz, dtype=float).reshape(-1, 2)
+        slots = np.flatnonzero(self.active)
+        if len(slots) == 0:
+            return [[] for _ in range(len(viewers_xz))]
+        position = self.position[slots]
+        rows = [[monster_id, kind, state, *xyz, *velocity, health] for monster_id, kind, state, xyz, velocity, health in zip(
+            self.ids[slots].tolist(), self.kind[slots].tolist(), self.state[slots].tolist(),
+            np.round(position, 1).tolist(), np.round(self.velocity[slots], 1).tolist(), self.health[slots].tolist()
+        )]
+        # Bucket monsters by cell once, then each viewer reads its 3x3 cells
+        cells = np.floor(position[:, [0, 2]] / radius).astype(np.int64)
+        keys = cell_keys(cells[:, 0], cells[:, 1])
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        viewer_cells = np.floor(viewers_xz / radius).astype(np.int64)
+        offsets = np.array([(dx, dz) for dx in (-1, 0, 1) for dz in (-1, 0, 1)])
+        radius_sq = radius * radius
+        visible = []
+        for (vx, vz), cell in zip(viewers_xz, viewer_cells):
+            wanted = cell_keys(cell[0] + offsets[:, 0], cell[1] + offsets[:, 1])
+            start = np.searchsorted(sorted_keys, wanted, side='left')
+            end = np.searchsorted(sorted_keys, wanted, side='right')
+            candidates = np.concatenate([order[s:e] for s, e in zip(start, end)])
+            dx = position[candidates, 0] - vx
+            dz = position[candidates, 2] - vz
+            near = candidates[dx * dx + dz * dz <= radius_sq]
+            visible.append([rows[i] for i in near.tolist()])
+        return visible
+
+    def metrics(self):
+        return {
+            **self.stats,
+            'monsters': len(self.slots),
+            'surfaced': int(np.count_nonzero(self.active & (self.position[:, 1] >= SURFACED_DEPTH)))
+        }
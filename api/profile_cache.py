@@ -0,0 +1,89 @@
+"""
+TTL cache of offline players' profiles for the profile endpoint.
+
+Connected players are served from the live players cache; this holds
+profiles fetched from Firestore for everyone else. An entry is fresh for
+ttl seconds. After that, until stale_ttl, it is still served ("stale") while
+the caller refreshes it in the background; older entries are misses. Players
+that don't exist are cached too, so repeated lookups of a bad ID don't each
+cost a read.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+FRESH, STALE = 'fresh', 'stale'
+
+
+class ProfileCache:
+    """Recently fetched profiles keyed by player ID, least recently used evicted first"""
+
+    def __init__(self, ttl=30.0, stale_ttl=300.0, max_entries=10000):
+        """
+        :param ttl: Seconds an entry is served without refreshing
+        :param stale_ttl: Seconds an entry may be served at all (refreshed in the background after ttl)
+        :param max_entries: Profiles kept at most
+        """
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # player_id -> (profile or None, fetched_at)
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.stats = {'live_hits': 0, 'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0}
+
+    def lookup(self, player_id, now=None):
+        """
+        :return: (profile, age in seconds, FRESH or STALE), or None on a miss.
+                 profile is None for a player known not to exist.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            entry = self.entries.get(player_id)
+            if entry is not None:
+                profile, fetched_at = entry
+                age = now - fetched_at
+                if age < self.stale_ttl:
+                    self.entries.move_to_end(player_id)
+                    state = FRESH if age < self.ttl else STALE
+                    self.stats['hits' if state == FRESH else 'stale_hits'] += 1
+                    return profile, age, state
+                del self.entries[player_id]
+            self.stats['misses'] += 1
+            return None
+
+    def store(self, player_id, profile, now=None):
+        """Cache a profile just read (None if the player doesn't exist)"""
+        with self.lock:
+            self.entries[player_id] = (profile, time.time() if now is None else now)
+            self.entries.move_to_end(player_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.refreshing.discard(player_id)
+
+    def start_refresh(self, player_id):
+        """Claim a background refresh; False if one is already running for this player"""
+        with self.lock:
+            if player_id in self.refreshing:
+                return False
+            self.refreshing.add(player_id)
+            self.stats['refreshes'] += 1
+            return True
+
+    def refresh_failed(self, player_id):
+        with self.lock:
+            self.refreshing.discard(player_id)
+
+    def count_live_hit(self):
+        with self.lock:
+            self.stats['live_hits'] += 1
+
+    def metrics(self):
+        with self.lock:
+            served = self.stats['live_hits'] + self.stats['hits'] + self.stats['stale_hits']
+            total = served + self.stats['misses']
+            return {
+                **self.stats,
+                'cached': len(self.entries),
+                'hit_ratio': round(served / total, 4) if total else None
+            }
@@ -0,0 +1,188 @@
+"""
+On-demand sampling profiler for the live server.
+
+SamplingProfiler runs on its own thread for a fixed window and, every
+interval, reads the current stack of every other thread with
+sys._current_frames(). Nothing is hooked into the interpreter, so code
+runs at full speed while it samples and nothing at all is done when no
+profile is running. Each sample walks the stacks that changed since the
+previous one; threads still waiting where they were (most of a server's
+threads, most of the time) cost a lookup.
+
+Samples are wall-clock: a thread blocked in a Firestore call is counted in
+the frame it is waiting in, which is usually what a latency spike needs.
+Stacks are reported in the collapsed format ("thread;outer;...;inner count"
+per line) that flamegraph.pl, speedscope and inferno read directly.
+
+EventCpuTimer is an event middleware (see game_protocol.event_middlewares)
+that adds up the CPU time each Socket.IO event's handlers use. It is only
+installed for the length of a profile.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class EventCpuTimer:
+    """Event middleware that adds up handler CPU and wall time per event"""
+
+    def __init__(self):
+        self.events = {}  # event -> [count, cpu seconds, wall seconds, max cpu seconds]
+        self.lock = threading.Lock()
+
+    def __call__(self, event, call_next, sid, *args):
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        try:
+            return call_next(sid, *args)
+        finally:
+            cpu = time.thread_time() - cpu_start
+            wall = time.perf_counter() - wall_start
+            with self.lock:
+                totals = self.events.setdefault(event, [0, 0.0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += cpu
+                totals[2] += wall
+                totals[3] = max(totals[3], cpu)
+
+    def report(self, seconds):
+        """Per-event totals, most CPU first; cpu_share is the share of one core over the window"""
+        with self.lock:
+            events = sorted(self.events.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            event: {
+                'count': count,
+                'cpu_seconds': round(cpu, 6),
+                'wall_seconds': round(wall, 6),
+                'mean_cpu_ms': round(cpu / count * 1000, 3),
+                'max_cpu_ms': round(max_cpu * 1000, 3),
+                'cpu_share': round(cpu / seconds, 4) if seconds > 0 else 0.0
+            }
+            for event, (count, cpu, wall, max_cpu) in events
+        }
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread for a fixed window"""
+
+    def __init__(self, seconds, interval=0.01):
+        """
+        :param seconds: Length of the sampling window
+        :param interval: Seconds between samples
+        """
+        if not (math.isfinite(seconds) and math.isfinite(interval) and seconds > 0 and interval > 0):
+            raise ValueError("seconds and interval must be positive finite numbers")
+        self.seconds = seconds
+        self.interval = interval
+        self.stacks = Counter()  # (thread name, frame labels...) -> samples
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self.labels = {}  # code object -> frame label
+        self.finished = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def wait(self, sleep=time.sleep):
+        """
+        Wait for the window to end
+
+        :param sleep: The server's sleep function, so waiting doesn't block
+                      other requests under eventlet
+        """
+        while not self.finished.is_set():
+            sleep(min(0.1, self.seconds))
+
+    def run(self):
+        own_ident = threading.get_ident()
+        self.started_at = time.time()
+        start = time.perf_counter()
+        deadline = start + self.seconds
+        next_sample = start
+        thread_names = {}
+        # Thread ident -> (leaf frame, its last instruction, stack key) of the
+        # previous sample. A thread still at the same instruction of the same
+        # frame has the same stack, so idle threads aren't walked again.
+        last_stacks = {}
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if now < next_sample:
+                    time.sleep(next_sample - now)
+                    continue
+                # Skip samples missed while the GIL was busy rather than bursting to catch up
+                next_sample = max(next_sample + self.interval, now)
+
+                frames = sys._current_frames()
+                if frames.keys() - thread_names.keys():
+                    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident == own_ident:
+                        continue
+                    last = last_stacks.get(ident)
+                    if last is not None and last[0] is frame and last[1] == frame.f_lasti:
+                        key = last[2]
+                    else:
+                        key = (thread_names.get(ident, str(ident)),) + self._walk(frame)
+                        last_stacks[ident] = (frame, frame.f_lasti, key)
+                    self.stacks[key] += 1
+                self.samples += 1
+                del frames
+        finally:
+            last_stacks.clear()
+            self.elapsed = time.perf_counter() - start
+            self.finished.set()
+
+    def _walk(self, frame):
+        """Frame labels of a stack, outermost first"""
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                self.labels[code] = label
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return tuple(labels)
+
+    def collapsed(self):
+        """The profile in collapsed-stack format, one line per distinct stack, most sampled first"""
+        return [
+            f"{';'.join(frame.replace(';', ':') for frame in stack)} {count}"
+            for stack, count in self.stacks.most_common()
+        ]
+
+    def top_functions(self, limit=30):
+        """Functions by samples in which they were running (self) or on the stack (total)"""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [
+            {'function': frame, 'self': own[frame], 'total': count}
+            for frame, count in total.most_common(limit)
+        ]
+
+    def summary(self):
+        return {
+            'started_at': self.started_at,
+            'seconds': round(self.elapsed, 3),
+            'interval': self.interval,
+            'samples': self.samples,
+            'threads': sorted({stack[0] for stack in self.stacks})
+        }
@@ -0,0 +1,129 @@
+"""
+Server-side cannonball flight and hit resolution.
+
+Each world instance has one ProjectileSystem holding its cannonballs in
+flight as NumPy arrays. A fire event only says where a player aims; the
+server launches the ball from the player's boat at CANNON_SPEED on the arc
+that lands on that point (clamped to CANNON_RANGE), and every tick all balls
+are integrated together under gravity. Each tick is split into substeps no
+longer than a hit radius, so fast balls can't pass through a target between
+two samples.
+
+After each substep the balls are matched to the nearest target (surfaced
+monster or boat) through monsters.nearest_within's grid. So a substep costs
+a few vectorized passes over the balls in flight rather than balls * targets,
+and capacity caps how many balls a tick can ever integrate.
+"""
+import math
+import numpy as np
+from monsters import nearest_within
+
+CANNON_SPEED = 180.0   # units/second (3 per frame at 60 fps)
+CANNON_RANGE = 100.0   # units; aims further away are shortened to this
+GRAVITY = 60.0         # units/second^2
+LAUNCH_HEIGHT = 2.0    # deck height the balls leave from
+HIT_RADIUS = 8.0       # horizontal distance from a target's centre that counts as a hit
+HIT_HEIGHT = 8.0       # vertical distance from a target's centre that counts as a hit
+
+
+class ProjectileSystem:
+    """Cannonballs in flight in one world instance, as arrays indexed by slot"""
+
+    def __init__(self, capacity=512):
+        """
+        :param capacity: Balls in flight at once; fire() refuses more
+        """
+        self.capacity = capacity
+        self.active = np.zeros(capacity, dtype=bool)
+        self.position = np.zeros((capacity, 3))
+        self.velocity = np.zeros((capacity, 3))
+        self.age = np.zeros(capacity)
+        self.lifetime = np.zeros(capacity)
+        self.owners = [None] * capacity  # slot -> player ID of the shooter
+        self.stats = {'fired': 0, 'refused': 0, 'hits': 0, 'misses': 0}
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    def fire(self, owner, x, z, aim_x, aim_z):
+        """
+        Launch a ball from a boat at (x, z) on the arc that lands on (aim_x, aim_z)
+
+        :return: False if the system is full
+        """
+        free = np.flatnonzero(~self.active)
+        if len(free) == 0:
+            self.stats['refused'] += 1
+            return False
+        slot = free[0]
+        dx, dz = aim_x - x, aim_z - z
+        distance = math.hypot(dx, dz)
+        if distance < 1e-6:
+            dx, dz, distance = 1.0, 0.0, 1.0
+        reach = min(distance, CANNON_RANGE)
+        # Elevation that lands a ball fired at CANNON_SPEED reach units away
+        pitch = 0.5 * math.asin(min(1.0, GRAVITY * reach / CANNON_SPEED ** 2))
+        horizontal = CANNON_SPEED * math.cos(pitch)
+        self.position[slot] = (x, LAUNCH_HEIGHT, z)
+        self.velocity[slot] = (dx / distance * horizontal, CANNON_SPEED * math.sin(pitch), dz / distance * horizontal)
+        self.age[slot] = 0.0
+        # Long enough to fall back past the water from deck height
+        self.lifetime[slot] = reach / horizontal + 1.0
+        self.owners[slot] = owner
+        self.active[slot] = True
+        self.stats['fired'] += 1
+        return True
+
+    def step(self, dt, target_positions, target_keys, owner_keys=None):
+        """
+        Advance every ball by dt seconds and resolve hits
+
+        :param target_positions: (x, y, z) of each target
+        :param target_keys: Key of each target, returned with its hits
+        :param owner_keys: Key of each player's own boat (player ID -> target key), never hit by their own balls
+        :return: List of (owner, target key, x, y, z) for each ball that hit something
+        """
+        slots = np.flatnonzero(self.active)
+        if len(slots) == 0:
+            return []
+        targets = np.asarray(target_positions, dtype=float).reshape(-1, 3)
+        owner_keys = owner_keys or {}
+        hits = []
+        substeps = max(1, math.ceil(CANNON_SPEED * dt / HIT_RADIUS))
+        h = dt / substeps
+        for _ in range(substeps):
+            if len(slots) == 0:
+                break
+            position = self.position[slots]
+            velocity = self.velocity[slots]
+            position += velocity * h
+            velocity[:, 1] -= GRAVITY * h
+            self.position[slots] = position
+            self.velocity[slots] = velocity
+            self.age[slots] += h
+
+            done = np.zeros(len(slots), dtype=bool)
+            if len(targets):
+                nearest, _ = nearest_within(position[:, [0, 2]], targets[:, [0, 2]], HIT_RADIUS)
+                for row in np.flatnonzero(nearest >= 0).tolist():
+                    target = nearest[row]
+                    owner = self.owners[slots[row]]
+                    if abs(position[row, 1] - targets[target, 1]) > HIT_HEIGHT:
+                        continue
+                    if owner_keys.get(owner) == target_keys[target]:
+                        continue
+                    done[row] = True
+                    hits.append((owner, target_keys[target], *position[row].tolist()))
+            # Balls that fell into the sea or flew out of range are misses
+            missed = ~done & ((position[:, 1] < -HIT_HEIGHT) | (self.age[slots] > self.lifetime[slots]))
+            self.stats['hits'] += int(done.sum())
+            self.stats['misses'] += int(missed.sum())
+            finished = slots[done | missed]
+            self.active[finished] = False
+            for slot in finished.tolist():
+                self.owners[slot] = None
+            slots = slots[~(done | missed)]
+        return hits
+
+    def metrics(self):
+        return {**self.stats, 'in_flight': len(self)}
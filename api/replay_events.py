@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Replay recorded Socket.IO traffic against a server and compare builds.
+
+1. Record production traffic by starting the server with
+   SOCKET_RECORD_PATH=prod.jsonl.gz
+2. Start the build under test with REPLAY_AUTH_SECRET=<secret> (so recorded
+   players can join) and SOCKET_RECORD_PATH=candidate.jsonl.gz (so its handler
+   latencies are recorded), then replay:
+
+       python replay_events.py replay prod.jsonl.gz --url http://localhost:5000 \\
+           --secret <secret> --speed 4 --report candidate_report.json
+
+3. Compare handler latency and outbound message counts between two runs:
+
+       python replay_events.py compare baseline.jsonl.gz candidate.jsonl.gz \\
+           --reports baseline_report.json candidate_report.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter, defaultdict
+import socketio
+from event_recorder import read_recording
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(events):
+    """Per-event handler latency distribution for a recording"""
+    latencies = defaultdict(list)
+    for _, _, event, handler_ms, _ in events:
+        latencies[event].append(handler_ms)
+
+    summary = {}
+    for event, values in latencies.items():
+        values.sort()
+        summary[event] = {
+            'count': len(values),
+            'p50': percentile(values, 0.50),
+            'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99),
+            'max': values[-1]
+        }
+    return summary
+
+
+class ReplayClient:
+    """One Socket.IO client standing in for a recorded socket"""
+
+    def __init__(self, url, received, lock):
+        self.url = url
+        self.client = socketio.Client(reconnection=False)
+        self.connected = False
+
+        @self.client.on('*')
+        def count_event(event, *args):
+            with lock:
+                received[event] += 1
+
+    def ensure_connected(self):
+        if not self.connected:
+            self.client.connect(self.url, transports=['websocket'])
+            self.connected = True
+
+    def emit(self, event, payload):
+        self.ensure_connected()
+        if payload is None:
+            self.client.emit(event)
+        else:
+            self.client.emit(event, payload)
+
+    def disconnect(self):
+        if self.connected:
+            self.client.disconnect()
+            self.connected = False
+
+
+def prepare_payload(event, payload, secret):
+    """Swap the scrubbed credentials for a replay token"""
+    if event == 'player_join' and isinstance(payload, dict) and payload.get('player_id'):
+        payload = dict(payload)
+        payload['firebaseToken'] = f"replay:{secret}:{payload['player_id']}"
+    return payload
+
+
+def run_replay(args):
+    header, events = read_recording(args.recording)
+    if not events:
+        print("Recording is empty")
+        return 1
+
+    received = Counter()
+    sent = Counter()
+    errors = Counter()
+    lock = threading.Lock()
+    clients = {}
+
+    print(f"Replaying {len(events)} events from {len({e[1] for e in events})} sockets "
+          f"at {args.speed}x against {args.url}")
+
+    start = time.time()
+    max_lag = 0.0
+    for offset, sid, event, _, payload in events:
+        # Sleep until this event is due at the requested speed
+        due = start + offset / args.speed
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            max_lag = max(max_lag, -delay)
+
+        client = clients.get(sid)
+        if client is None:
+            client = clients[sid] = ReplayClient(args.url, received, lock)
+        try:
+            client.emit(event, prepare_payload(event, payload, args.secret))
+            sent[event] += 1
+        except Exception as e:
+            errors[type(e).__name__] += 1
+
+    # Give the server time to deliver the last broadcasts
+    time.sleep(args.drain)
+    for client in clients.values():
+        client.disconnect()
+
+    duration = time.time() - start
+    report = {
+        'recording': args.recording,
+        'url': args.url,
+        'speed': args.speed,
+        'duration': round(duration, 2),
+        'clients': len(clients),
+        'max_schedule_lag': round(max_lag, 4),
+        'sent': dict(sent),
+        'received': dict(received),
+        'errors': dict(errors)
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def format_change(before, after):
+    if not before:
+        return 'n/a'
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def run_compare(args):
+    _, baseline_events = read_recording(args.baseline)
+    _, candidate_events = read_recording(args.candidate)
+    baseline = latency_summary(baseline_events)
+    candidate = latency_summary(candidate_events)
+
+    print(f"{'event':<24}{'count':>14}{'p50 ms':>20}{'p95 ms':>20}{'p99 ms':>20}")
+    for event in sorted(set(baseline) | set(candidate)):
+        b = baseline.get(event, {'count': 0, 'p50': 0, 'p95': 0, 'p99': 0})
+        c = candidate.get(event, {'count': 0, 'p50': 0, 'p95': 0, 'p99': 0})
+        cells = [f"{b['count']}/{c['count']}"]
+        for key in ('p50', 'p95', 'p99'):
+            cells.append(f"{b[key]:.2f}/{c[key]:.2f} ({format_change(b[key], c[key])})")
+        print(f"{event:<24}{cells[0]:>14}{cells[1]:>20}{cells[2]:>20}{cells[3]:>20}")
+
+    if args.reports:
+        with open(args.reports[0]) as f:
+            baseline_report = json.load(f)
+        with open(args.reports[1]) as f:
+            candidate_report = json.load(f)
+        print(f"\n{'outbound event':<24}{'baseline':>12}{'candidate':>12}{'change':>10}")
+        b_received = baseline_report.get('received', {})
+        c_received = candidate_report.get('received', {})
+        for event in sorted(set(b_received) | set(c_received)):
+            b = b_received.get(event, 0)
+            c = c_received.get(event, 0)
+            print(f"{event:<24}{b:>12}{c:>12}{format_change(b, c):>10}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay and compare recorded socket traffic')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = subparsers.add_parser('replay', help='Replay a recording against a server')
+    replay_parser.add_argument('recording', help='Recording file (.jsonl or .jsonl.gz)')
+    replay_parser.add_argument('--url', default='http://localhost:5000', help='Server URL')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='Replay speed multiplier')
+    replay_parser.add_argument('--secret', default=os.environ.get('REPLAY_AUTH_SECRET', ''),
+                               help="Server's REPLAY_AUTH_SECRET")
+    replay_parser.add_argument('--drain', type=float, default=2.0,
+                               help='Seconds to wait for broadcasts after the last event')
+    replay_parser.add_argument('--report', help='Write the replay report to this JSON file')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two server-side recordings')
+    compare_parser.add_argument('baseline', help='Recording made by the baseline build')
+    compare_parser.add_argument('candidate', help='Recording made by the candidate build')
+    compare_parser.add_argument('--reports', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                                help='Replay reports to compare outbound message counts')
+
+    args = parser.parse_args()
+    if args.command == 'replay':
+        return run_replay(args)
+    return run_compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Declarative payload schemas for inbound socket events.
+
+Each event's schema is a dict of field name -> Field, compiled once (at
+handler registration) into a validator that checks types, coerces numeric
+strings, applies ranges/lengths/precompiled patterns and fills defaults.
+A validator returns (payload, None) with only the declared fields, or
+(None, reason) where reason names the first failed check, e.g.
+'missing:player_id' or 'range:limit'.
+"""
+import re
+
+MISSING = object()
+
+# Kinds of value a Field accepts
+STR, INT, NUMBER, BOOL, OBJECT, LIST = 'str', 'int', 'number', 'bool', 'object', 'list'
+
+
+class Field:
+    """One field of an event payload"""
+
+    def __init__(self, kind, required=False, default=MISSING, min=None, max=None,
+                 min_length=None, max_length=None, pattern=None, choices=None, fields=None, items=None):
+        """
+        :param kind: STR, INT, NUMBER, BOOL, OBJECT or LIST
+        :param required: Reject payloads without this field (None counts as absent)
+        :param default: Value used when the field is absent and not required
+        :param min, max: Inclusive bounds for INT and NUMBER
+        :param min_length, max_length: Length bounds for STR (after stripping whitespace) or LIST
+        :param pattern: Regex a STR must match from its start
+        :param choices: Allowed values
+        :param fields: Nested schema for an OBJECT (any dict is accepted without one)
+        :param items: Field every LIST element must satisfy (any list is accepted without one)
+        """
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.min = min
+        self.max = max
+        self.min_length = min_length
+        self.max_length = max_length
+        self.pattern = re.compile(pattern) if pattern else None
+        self.choices = frozenset(choices) if choices else None
+        self.fields = fields
+        self.items = items
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return MISSING
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return MISSING
+    return MISSING
+
+
+def _int(value):
+    if isinstance(value, bool):
+        return MISSING
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return MISSING
+    return MISSING
+
+
+def _compile_field(name, field):
+    """Build check(value) -> (value, reason) for one field, specialized to its kind"""
+    low, high = field.min, field.max
+    min_length, max_length = field.min_length, field.max_length
+    pattern, choices = field.pattern, field.choices
+
+    if field.kind == STR:
+        def check_kind(value):
+            if not isinstance(value, str):
+                return None, f"type:{name}"
+            value = value.strip()
+            if (min_length is not None and len(value) < min_length) or \
+                    (max_length is not None and len(value) > max_length):
+                return None, f"length:{name}"
+            if pattern is not None and not pattern.match(value):
+                return None, f"format:{name}"
+            return value, None
+    elif field.kind in (INT, NUMBER):
+        convert = _int if field.kind == INT else _number
+
+        def check_kind(value):
+            value = convert(value)
+            if value is MISSING or value != value:  # Reject NaN too
+                return None, f"type:{name}"
+            if (low is not None and value < low) or (high is not None and value > high):
+                return None, f"range:{name}"
+            return value, None
+    elif field.kind == BOOL:
+        def check_kind(value):
+            if not isinstance(value, bool):
+                return None, f"type:{name}"
+            return value, None
+    elif field.kind == OBJECT:
+        nested = compile_schema(field.fields) if field.fields else None
+
+        def check_kind(value):
+            if not isinstance(value, dict):
+                return None, f"type:{name}"
+            if nested is not None:
+                value, reason = nested(value)
+                if reason:
+                    return None, f"{name}.{reason}"
+            return value, None
+    elif field.kind == LIST:
+        check_item = _compile_field(f"{name}[]", field.items) if field.items else None
+
+        def check_kind(value):
+            if not isinstance(value, list):
+                return None, f"type:{name}"
+            if (min_length is not None and len(value) < min_length) or \
+                    (max_length is not None and len(value) > max_length):
+                return None, f"length:{name}"
+            if check_item is None:
+                return value, None
+            cleaned = []
+            for item in value:
+                item, reason = check_item(item)
+                if reason:
+                    return None, reason
+                cleaned.append(item)
+            return cleaned, None
+    else:
+        raise ValueError(f"Unknown field kind {field.kind!r} for {name}")
+
+    if choices is None:
+        return check_kind
+
+    def check(value):
+        value, reason = check_kind(value)
+        if reason is None and value not in choices:
+            return None, f"choice:{name}"
+        return value, reason
+
+    return check
+
+
+def compile_schema(schema):
+    """
+    Compile a schema into validate(payload) -> (payload, None) or (None, reason)
+    """
+    checks = [(name, field.required, field.default, _compile_field(name, field))
+              for name, field in schema.items()]
+
+    def validate(payload):
+        if not isinstance(payload, dict):
+            return None, 'not_an_object'
+        clean = {}
+        for name, required, default, check in checks:
+            value = payload.get(name)
+            if value is None:
+                if required:
+                    return None, f"missing:{name}"
+                if default is not MISSING:
+                    clean[name] = default() if callable(default) else default
+                continue
+            value, reason = check(value)
+            if reason:
+                return None, reason
+            clean[name] = value
+        return clean, None
+
+    return validate
+
+
+# Shared field definitions
+PLAYER_ID = Field(STR, required=True, max_length=128, pattern=r'firebase_[\w-]+$')
+COORDINATE = Field(NUMBER, required=True, min=-1e7, max=1e7)
+HEIGHT = Field(NUMBER, default=0, min=-1e7, max=1e7)
+COLOR = Field(OBJECT, fields={
+    'r': Field(NUMBER, required=True, min=0, max=1),
+    'g': Field(NUMBER, required=True, min=0, max=1),
+    'b': Field(NUMBER, required=True, min=0, max=1)
+})
+POSITION = Field(OBJECT, fields={
+    'x': COORDINATE,
+    'y': HEIGHT,
+    'z': COORDINATE
+})
+# Heading in radians; clients let it wind up past ±pi as the boat turns, so only
+# keep it finite and far from where float precision would matter
+ROTATION = Field(NUMBER, min=-1e6, max=1e6)
+MODE = Field(STR, max_length=32)
+# Chat channels a message can be sent to
+MESSAGE_TYPES = ('global',)
+
+PLAYER_JOIN = {
+    # Token and ID are checked by the handler so it can answer auth_required
+    'firebaseToken': Field(STR, max_length=8192),
+    'player_id': Field(STR, max_length=128),
+    'name': Field(STR, max_length=50),
+    'color': COLOR,
+    'position': POSITION,
+    'rotation': ROTATION,
+    'mode': MODE,
+    # Preferred world instance, e.g. to rejoin friends; ignored if full or unknown
+    'world': Field(STR, max_length=64)
+}
+
+UPDATE_POSITION = {
+    'player_id': PLAYER_ID,
+    'x': COORDINATE,
+    'y': HEIGHT,
+    'z': COORDINATE,
+    'rotation': ROTATION,
+    'mode': MODE,
+    # Counter incremented by the client; the max is JavaScript's largest safe integer
+    'seq': Field(INT, min=0, max=2 ** 53 - 1)
+}
+
+PLAYER_ACTION = {
+    'player_id': PLAYER_ID,
+    'action': Field(STR, max_length=32),
+    'type': Field(STR, max_length=32)
+}
+
+LAND_FISH = {
+    'success': Field(BOOL, required=True)
+}
+
+FIRE_CANNONS = {
+    'shots': Field(LIST, required=True, min_length=1, max_length=8, items=Field(OBJECT, fields={
+        'x': COORDINATE,
+        'z': COORDINATE
+    }))
+}
+
+GET_PLAYER_STATS = {
+    'player_id': PLAYER_ID
+}
+
+GET_LEADERBOARD = {
+    'player_id': Field(STR, max_length=128),
+    'window': Field(STR, default='all', choices=('all', 'day', 'week')),
+    'limit': Field(INT, default=10, min=1, max=100)
+}
+
+SEND_MESSAGE = {
+    'player_id': PLAYER_ID,
+    'content': Field(STR, required=True, min_length=1, max_length=500),
+    'player_name': Field(STR, max_length=50),
+    'type': Field(STR, default='global', choices=MESSAGE_TYPES)
+}
+
+UPDATE_PLAYER_COLOR = {
+    'player_id': PLAYER_ID,
+    'color': Field(OBJECT, required=True, fields=COLOR.fields)
+}
+
+UPDATE_PLAYER_NAME = {
+    'player_id': PLAYER_ID,
+    # Sanitized and truncated to 50 characters by the handler
+    'name': Field(STR, required=True, max_length=200)
+}
+
+ADD_TO_INVENTORY = {
+    'player_id': PLAYER_ID,
+    # Fish are added by the server when they are landed
+    'item_type': Field(STR, required=True, choices=('treasure',)),
+    'item_name': Field(STR, required=True, min_length=1, max_length=100),
+    'item_data': Field(OBJECT, default=dict)
+}
+
+# Islands are generated around where players sail, so reports far outside the
+# area players can reach, or far off sea level, are rejected
+ISLAND_COORDINATE = Field(NUMBER, required=True, min=-1e6, max=1e6)
+ISLAND_HEIGHT = Field(NUMBER, default=0, min=-1e3, max=1e3)
+# Stored island position, also checked for islands imported by an admin
+ISLAND_POSITION = {
+    'x': ISLAND_COORDINATE,
+    'y': ISLAND_HEIGHT,
+    'z': ISLAND_COORDINATE
+}
+
+ISLAND = {
+    'id': Field(STR, required=True, max_length=128, pattern=r'[\w.-]+$'),
+    'x': ISLAND_COORDINATE,
+    'y': ISLAND_HEIGHT,
+    'z': ISLAND_COORDINATE,
+    'radius': Field(NUMBER, default=50, min=0, max=1e5),
+    'type': Field(STR, default='default', max_length=32, pattern=r'\w+$')
+}
+
+REGISTER_ISLAND = {
+    **ISLAND,
+    'player_id': Field(STR, max_length=128)
+}
+
+REGISTER_ISLANDS = {
+    'player_id': Field(STR, max_length=128),
+    'islands': Field(LIST, required=True, max_length=1000, items=Field(OBJECT, fields=ISLAND))
+}
+
+GET_INVENTORY = {
+    'player_id': PLAYER_ID,
+    # Version of the inventory the client already has, for an unchanged/delta reply
+    'version': Field(INT, min=0)
+}
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Seed the global stats counters from the players collection.
+
+The sharded counters behind /api/stats only count increments made since
+they were introduced. This pages through every player by document ID, sums
+fishCount, monsterKills and money into the global totals and replaces the
+shards with them (held in shard 0) in one batch.
+
+Increments made while the scan runs may be counted twice or not at all, so
+run it while the game is quiet. Re-running it re-derives the totals from the
+players, so it is safe to repeat.
+
+Usage:
+    python seed_global_stats.py --dry-run
+    python seed_global_stats.py --page-size 500
+"""
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+import firebase_admin
+from firebase_admin import credentials, firestore
+import firestore_models
+from firestore_models import GlobalStats, Player
+
+# Load environment variables from .env file (if present)
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = 500
+
+
+def init_db():
+    """Initialize Firebase the same way app.py does"""
+    cred = credentials.Certificate(os.environ.get('FIREBASE_CREDENTIALS', 'firebasekey.json'))
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+    firestore_models.init_firestore(db)
+    return db
+
+
+def add_player(totals, data):
+    """Add one player's counters to the global totals"""
+    for field, name in GlobalStats.COUNTERS.items():
+        value = data.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            totals[name] += value
+
+
+def run(args):
+    db = init_db()
+    # Only the counter fields are read
+    collection = db.collection(Player.collection_name).select(list(GlobalStats.COUNTERS))
+    totals = {name: 0 for name in GlobalStats.COUNTERS.values()}
+    scanned = 0
+    last_doc = None
+
+    while True:
+        query = collection.order_by('__name__').limit(args.page_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        page = list(query.stream())
+        for snapshot in page:
+            add_player(totals, snapshot.to_dict() or {})
+        scanned += len(page)
+        print(f"Scanned {scanned} players", flush=True)
+
+        if len(page) < args.page_size:
+            break
+        last_doc = page[-1]
+
+    print(f"Current totals: {GlobalStats.get_totals()}")
+    print(f"Totals from {scanned} players: {totals}")
+    if not args.dry_run:
+        GlobalStats.reset(totals)
+        print("Global stats seeded")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the global stats counters from the players collection')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='Players read per page')
+    parser.add_argument('--dry-run', action='store_true', help='Report the totals without writing')
+    args = parser.parse_args()
+    args.page_size = max(1, args.page_size)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
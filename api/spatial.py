@@ -0,0 +1,58 @@
+"""
+Uniform grid over the sea plane (x, z) for "who is near this point" queries.
+
+Entries are bucketed into square cells of cell_size units, so a radius query
+only looks at the cells overlapping the query circle instead of every entry.
+Pick cell_size close to the most common query radius.
+"""
+import math
+from collections import defaultdict
+
+
+class SpatialGrid:
+    """Maps entry IDs to grid cells by their x/z position"""
+
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = defaultdict(set)  # (cx, cz) -> entry IDs
+        self.where = {}                # entry ID -> (cx, cz)
+
+    def cell_of(self, x, z):
+        return (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+
+    def move(self, entry_id, x, z):
+        """Insert an entry or move it to its new position"""
+        cell = self.cell_of(x, z)
+        old_cell = self.where.get(entry_id)
+        if old_cell == cell:
+            return
+        if old_cell is not None:
+            self._discard(entry_id, old_cell)
+        self.cells[cell].add(entry_id)
+        self.where[entry_id] = cell
+
+    def remove(self, entry_id):
+        cell = self.where.pop(entry_id, None)
+        if cell is not None:
+            self._discard(entry_id, cell)
+
+    def _discard(self, entry_id, cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(entry_id)
+            if not members:
+                del self.cells[cell]
+
+    def nearby(self, x, z, radius):
+        """IDs in the cells overlapping a circle (callers check exact distance)"""
+        reach = math.ceil(radius / self.cell_size)
+        cx, cz = self.cell_of(x, z)
+        for dx in range(-reach, reach + 1):
+            for dz in range(-reach, reach + 1):
+                members = self.cells.get((cx + dx, cz + dz))
+                if members:
+                    # Copy so concurrent moves can't break the iteration
+                    yield from tuple(members)
+
+    def __len__(self):
+        return len(self.where)
@@ -0,0 +1,234 @@
+"""
+Bounded worker pool for blocking storage (Firestore) calls.
+
+Socket.IO handlers submit storage work here instead of calling Firestore
+inline, and emit their responses from a completion callback. A slow Firestore
+call then only ties up a pool worker, never the handler that relays movement.
+
+The pool is bounded: at most max_workers calls run at once and at most
+max_queue more wait for a worker. Submissions beyond that are rejected
+immediately with StorageSaturated, and calls that waited in the queue longer
+than the timeout are dropped with StorageTimeout instead of running late.
+
+Completion callbacks emit and change the game caches, so they must run where
+the server's handlers run. Under eventlet (which isn't monkey-patched here)
+that is the hub, not a pool thread: after queue_callbacks() completions are
+queued and run by run_pending_callbacks(), which app.py calls from a
+background task. For the same reason run(), used by REST endpoints running on
+the hub, waits for its result with the server's sleep when it is given one,
+so other requests and the game loop keep running meanwhile.
+"""
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+
+logger = logging.getLogger(__name__)
+
+
+class StorageSaturated(Exception):
+    """The pool's queue is full"""
+
+
+class StorageTimeout(Exception):
+    """A call waited in the queue longer than the pool timeout"""
+
+
+class StorageCallbacks:
+    """Callback-style call() for storage backends that implement submit()"""
+
+    # Callbacks waiting for run_pending_callbacks(), or None to run them
+    # on the thread that completed the call
+    pending_callbacks = None
+
+    def queue_callbacks(self):
+        """Queue completion callbacks for run_pending_callbacks() instead of running them on worker threads"""
+        self.pending_callbacks = collections.deque()
+
+    def defer(self, fn, *args):
+        """Run fn(*args) where completion callbacks run (safe from any thread)"""
+        if self.pending_callbacks is None:
+            fn(*args)
+        else:
+            self.pending_callbacks.append((fn, args))
+
+    def run_pending_callbacks(self):
+        """Run the queued callbacks (on the server's own loop); returns how many ran"""
+        if self.pending_callbacks is None:
+            return 0
+        count = 0
+        while True:
+            try:
+                fn, args = self.pending_callbacks.popleft()
+            except IndexError:
+                return count
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception(f"Error in deferred callback {getattr(fn, '__qualname__', fn)}")
+            count += 1
+
+    def call(self, fn, *args, on_result=None, on_error=None, **kwargs):
+        """
+        Submit a call and invoke a callback when it completes
+
+        :param on_result: Called with the result on success
+        :param on_error: Called with the exception on failure; errors are logged if omitted
+        :return: The call's future
+        """
+        def done(future):
+            exception = future.exception()
+            try:
+                if exception is None:
+                    if on_result is not None:
+                        on_result(future.result())
+                elif on_error is not None:
+                    on_error(exception)
+                else:
+                    logger.error(f"Storage call {fn.__qualname__} failed: {exception!r}")
+            except Exception:
+                logger.exception(f"Error in completion callback for {fn.__qualname__}")
+
+        future = self.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda completed: self.defer(done, completed))
+        return future
+
+
+class StoragePool(StorageCallbacks):
+    """Bounded executor for storage calls that returns futures"""
+
+    # Seconds between checks of a run() result when waiting with sleep
+    RUN_POLL_INTERVAL = 0.005
+
+    def __init__(self, max_workers=8, max_queue=256, timeout=5.0, sleep=None):
+        """
+        :param max_workers: Number of storage calls that run concurrently
+        :param max_queue: Number of calls allowed to wait for a worker
+        :param timeout: Seconds a call may wait in the queue before it is dropped
+        :param sleep: The server's sleep function, so run() waits without blocking
+                      other requests under eventlet; run() blocks the thread without it
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.sleep = sleep
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage')
+        self.slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self.pending = set()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'peak_in_flight': 0,
+            'total_wait_ms': 0.0,
+            'total_run_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'max_run_ms': 0.0
+        }
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) on the pool
+
+        :return: Future with the call's result. Never blocks; if the pool is
+                 saturated the future fails with StorageSaturated.
+        """
+        if self.closed or not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.stats['rejected'] += 1
+            future = Future()
+            future.set_exception(StorageSaturated(f"Storage pool saturated calling {fn.__qualname__}"))
+            return future
+
+        enqueued_at = time.monotonic()
+
+        def run():
+            started_at = time.monotonic()
+            wait_ms = (started_at - enqueued_at) * 1000
+            with self.lock:
+                self.stats['total_wait_ms'] += wait_ms
+                self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], wait_ms)
+            if wait_ms > self.timeout * 1000:
+                raise StorageTimeout(f"{fn.__qualname__} waited {wait_ms:.0f}ms for a worker")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                run_ms = (time.monotonic() - started_at) * 1000
+                with self.lock:
+                    self.stats['total_run_ms'] += run_ms
+                    self.stats['max_run_ms'] = max(self.stats['max_run_ms'], run_ms)
+
+        with self.lock:
+            self.stats['submitted'] += 1
+            future = self.executor.submit(run)
+            self.pending.add(future)
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], len(self.pending))
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        self.slots.release()
+        # run() cancels calls still queued when it gives up waiting for them
+        exception = StorageTimeout() if future.cancelled() else future.exception()
+        with self.lock:
+            self.pending.discard(future)
+            if exception is None:
+                self.stats['completed'] += 1
+            elif isinstance(exception, StorageTimeout):
+                self.stats['timed_out'] += 1
+            else:
+                self.stats['failed'] += 1
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Submit a call and block for its result (for REST endpoints and scripts)
+
+        :raises StorageSaturated: If the pool is saturated
+        :raises StorageTimeout: If the call didn't finish within twice the pool timeout
+        """
+        future = self.submit(fn, *args, **kwargs)
+        if self.sleep is None:
+            try:
+                return future.result(timeout=self.timeout * 2)
+            except FutureTimeoutError:
+                pass
+        else:
+            deadline = time.monotonic() + self.timeout * 2
+            while not future.done() and time.monotonic() < deadline:
+                self.sleep(self.RUN_POLL_INTERVAL)
+            if future.done():
+                return future.result()
+        # Drop it if it is still queued; a running call finishes in the background
+        future.cancel()
+        raise StorageTimeout(f"{fn.__qualname__} didn't finish within {self.timeout * 2:g}s")
+
+    def drain(self, timeout):
+        """Stop accepting calls and wait up to timeout seconds for pending ones"""
+        self.closed = True
+        with self.lock:
+            pending = list(self.pending)
+        done, not_done = wait(pending, timeout=timeout)
+        self.executor.shutdown(wait=False)
+        return len(done), len(not_done)
+
+    def metrics(self):
+        """Snapshot of pool counters and saturation gauges"""
+        with self.lock:
+            stats = dict(self.stats)
+            in_flight = len(self.pending)
+        finished = stats['completed'] + stats['failed'] + stats['timed_out']
+        stats.update({
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': in_flight,
+            'queued': max(0, in_flight - self.max_workers),
+            'saturation': round(in_flight / (self.max_workers + self.max_queue), 3),
+            'avg_wait_ms': round(stats['total_wait_ms'] / finished, 3) if finished else 0.0,
+            'avg_run_ms': round(stats['total_run_ms'] / finished, 3) if finished else 0.0
+        })
+        return stats
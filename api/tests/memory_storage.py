@@ -0,0 +1,30 @@
+"""
+Storage backend for protocol tests: answers the calls a join makes in memory,
+as a brand new player with no inventory, and completes every call at once.
+"""
+from concurrent.futures import Future
+
+import firestore_models
+from storage_pool import StorageCallbacks
+
+
+class InMemoryStorage(StorageCallbacks):
+    """Completes storage calls immediately with canned results"""
+
+    RESULTS = {
+        firestore_models.Player.get: None,
+        firestore_models.Inventory.find: None,
+        firestore_models.Message.get_recent_messages: []
+    }
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.calls.append(fn)
+        future = Future()
+        future.set_result(self.RESULTS.get(fn))
+        return future
+
+    def metrics(self):
+        return {}
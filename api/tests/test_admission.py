@@ -0,0 +1,90 @@
+"""
+Join admission (admission.py): capacity, FIFO order, queue limits and
+position updates. Pure Python, no requirements.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import ADMITTED, DUPLICATE, FULL, QUEUED, AdmissionController  # noqa: E402
+
+
+def test_joins_beyond_max_concurrent_queue_in_order():
+    admission = AdmissionController(max_concurrent=2, max_players=10, max_queue=10)
+
+    assert admission.request('a', {}) == (ADMITTED, None)
+    assert admission.request('b', {}) == (ADMITTED, None)
+    assert admission.request('c', {'n': 'c'}) == (QUEUED, 1)
+    assert admission.request('d', {'n': 'd'}) == (QUEUED, 2)
+    assert admission.next_admission() is None
+
+    admission.finish('a', joined=True)
+    assert admission.next_admission() == ('c', {'n': 'c'})
+    assert admission.next_admission() is None
+    admission.finish('b', joined=False)
+    assert admission.next_admission() == ('d', {'n': 'd'})
+
+    metrics = admission.metrics()
+    assert (metrics['admitted'], metrics['queued'], metrics['failed']) == (4, 2, 1)
+    assert (metrics['in_flight'], metrics['sessions'], metrics['queue_length']) == (2, 1, 0)
+
+
+def test_max_players_counts_sessions_and_running_joins():
+    admission = AdmissionController(max_concurrent=5, max_players=2, max_queue=10)
+    admission.request('a', {})
+    admission.finish('a', joined=True)
+    admission.request('b', {})
+
+    assert admission.request('c', {}) == (QUEUED, 1)
+    admission.leave('a')
+    assert admission.next_admission() == ('c', {})
+
+
+def test_new_joins_wait_behind_the_queue():
+    admission = AdmissionController(max_concurrent=1, max_players=10, max_queue=10)
+    admission.request('a', {})
+    admission.request('b', {})
+    admission.finish('a', joined=True)
+
+    # Capacity is free, but 'b' was first
+    assert admission.request('c', {}) == (QUEUED, 2)
+
+
+def test_full_queue_and_duplicates():
+    admission = AdmissionController(max_concurrent=1, max_players=10, max_queue=1)
+    admission.request('a', {})
+    admission.request('b', {'v': 1})
+
+    assert admission.request('c', {}) == (FULL, None)
+    assert admission.request('a', {}) == (DUPLICATE, None)
+    assert admission.request('b', {'v': 2}) == (DUPLICATE, 1)
+    admission.finish('a', joined=True)
+    # The queued socket keeps its place with its latest payload
+    assert admission.next_admission() == ('b', {'v': 2})
+    assert admission.metrics()['rejected_full'] == 1
+
+
+def test_position_updates_report_only_changes():
+    admission = AdmissionController(max_concurrent=1, max_players=10, max_queue=10)
+    for sid in 'abcd':
+        admission.request(sid, {})
+    assert admission.position_updates() == []
+
+    admission.leave('b')
+    assert admission.position_updates() == [('c', 1, 2), ('d', 2, 2)]
+    assert admission.position_updates() == []
+
+
+def test_configure_validates_tunables():
+    admission = AdmissionController()
+
+    assert admission.configure(max_players=3)['max_players'] == 3
+    with pytest.raises(ValueError):
+        admission.configure(max_sessions=3)
+    with pytest.raises(ValueError):
+        admission.configure(max_queue=-1)
+    with pytest.raises(ValueError):
+        admission.configure(max_concurrent=True)
@@ -0,0 +1,120 @@
+"""
+Joins through the asyncio server mode's transport (async_transport.py).
+
+Runs player_join on a real python-socketio AsyncServer with storage calls
+answered in memory, so it needs the server's requirements installed but no
+Firestore. Run from api/:
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+socketio = pytest.importorskip('socketio')
+pytest.importorskip('firebase_admin')
+pytest.importorskip('numpy')
+
+import game_protocol  # noqa: E402
+from async_transport import AsyncServerTransport  # noqa: E402
+from memory_storage import InMemoryStorage  # noqa: E402
+
+REPLAY_SECRET = 'test-secret'
+
+
+def connect_client(server):
+    """Register a Socket.IO session on the default namespace without a real connection"""
+    return server.manager.connect('eio-' + str(len(server.manager.rooms.get('/', {}))), '/')
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = socketio.AsyncServer(async_mode='asgi')
+    emitted = []
+
+    async def record_emit(event, data=None, to=None, skip_sid=None, **kwargs):
+        emitted.append((event, data, to))
+
+    monkeypatch.setattr(server, 'emit', record_emit)
+    server.emitted = emitted
+    return server
+
+
+async def settle():
+    """Let tasks and call_soon_threadsafe callbacks scheduled by the transport run"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_enter_room_on_and_off_the_loop(server):
+    async def scenario():
+        transport = AsyncServerTransport(server, asyncio.get_running_loop())
+        on_loop, off_loop = connect_client(server), connect_client(server)
+
+        transport.enter_room(on_loop, 'world:a')
+        thread = threading.Thread(target=transport.enter_room, args=(off_loop, 'world:a'))
+        thread.start()
+        thread.join()
+        await settle()
+
+        assert 'world:a' in server.rooms(on_loop)
+        assert 'world:a' in server.rooms(off_loop)
+
+    asyncio.run(scenario())
+
+
+def test_drain_waits_for_disconnects_from_other_threads(server, monkeypatch):
+    disconnected = []
+
+    async def slow_disconnect(sid):
+        await asyncio.sleep(0.01)
+        disconnected.append(sid)
+
+    monkeypatch.setattr(server, 'disconnect', slow_disconnect)
+
+    async def scenario():
+        transport = AsyncServerTransport(server, asyncio.get_running_loop())
+        sids = [connect_client(server) for _ in range(3)]
+        # As game_protocol.shutdown does, from an executor thread
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: [transport.disconnect(sid) for sid in sids])
+
+        assert await transport.drain(timeout=1) == 0
+        assert sorted(disconnected) == sorted(sids)
+
+    asyncio.run(scenario())
+
+
+def test_player_join_through_async_transport(server, monkeypatch):
+    monkeypatch.setattr(game_protocol, 'REPLAY_AUTH_SECRET', REPLAY_SECRET)
+
+    async def scenario():
+        game_protocol.init(AsyncServerTransport(server, asyncio.get_running_loop()), InMemoryStorage())
+        sid = connect_client(server)
+        in_flight_before = game_protocol.admission.metrics()['in_flight']
+
+        game_protocol.dispatch('player_join', sid, {
+            'firebaseToken': f'replay:{REPLAY_SECRET}:asgi-join',
+            'player_id': 'asgi-join',
+            'name': 'Async Sailor'
+        })
+        await settle()
+
+        try:
+            events = {event: (data, to) for event, data, to in server.emitted}
+            assert 'connection_response' in events
+            response, to = events['connection_response']
+            assert to == sid
+            assert response['name'] == 'Async Sailor'
+            assert game_protocol.world_room('firebase_asgi-join') in server.rooms(sid)
+            # The join released its admission slot
+            assert game_protocol.admission.metrics()['in_flight'] == in_flight_before
+        finally:
+            game_protocol.handle_disconnect(sid)
+
+    asyncio.run(scenario())
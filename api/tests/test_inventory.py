@@ -0,0 +1,113 @@
+"""
+Inventory stacks (firestore_models.Inventory) and the version/delta cache
+(inventory_cache.py), all in memory. Needs firebase_admin installed for the
+model module, but no Firestore.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+firestore = pytest.importorskip('firebase_admin.firestore')
+
+from firestore_models import Inventory  # noqa: E402
+from inventory_cache import InventoryCache  # noqa: E402
+
+
+def legacy_inventory():
+    """A document in the old layout: one array entry per item"""
+    return {
+        'player_id': 'firebase_a',
+        'created_at': 100,
+        'fish': [
+            {'name': 'Cod', 'caught_at': 5, 'data': {'weight': 2, 'count': 9}},
+            {'name': 'Cod', 'caught_at': 3, 'data': {'weight': 4}},
+            {'name': 'Pearl Fish', 'caught_at': 7, 'data': {'unique': True}}
+        ],
+        'treasures': [{'name': 'Coin', 'data': {}}],
+        'stacks': {'fish': {'Cod': {'count': 1, 'first_at': 10, 'last_at': 10, 'data': {'color': 1}}}}
+    }
+
+
+def test_compact_folds_legacy_arrays_into_stacks():
+    stored = legacy_inventory()
+    inventory = Inventory.compact(stored)
+
+    cod = inventory['stacks']['fish']['Cod']
+    assert cod == {'count': 3, 'first_at': 3, 'last_at': 10, 'data': {'color': 1, 'weight': 4}}
+    # Legacy entries without a timestamp fall back to the document's creation
+    assert inventory['stacks']['treasures']['Coin']['first_at'] == 100
+    assert inventory['unique'] == [{'type': 'fish', 'name': 'Pearl Fish', 'at': 7, 'data': {'unique': True}}]
+    assert 'fish' not in inventory and inventory['format'] == Inventory.FORMAT
+    # The stored document is left alone
+    assert stored['stacks']['fish']['Cod']['count'] == 1
+    assert Inventory.compact(None) is None
+
+
+def test_new_items_stack_by_name_unless_unique():
+    field, item = Inventory.new_item('fish', 'Cod', {'count': 4, 'weight': 1})
+    assert field == 'fish' and item['data'] == {'weight': 1} and not item['unique']
+
+    field, item = Inventory.new_item('treasure', 'Crown', {'unique': True, 'count': 1})
+    assert field == 'treasures' and item['unique'] and item['data']['count'] == 1
+
+
+def test_cache_answers_unchanged_delta_or_full():
+    cache = InventoryCache(max_changes=3)
+    cache.load('firebase_a', None)
+
+    assert cache.since('firebase_a', 0) == (0, 'unchanged', None)
+    cache.add('firebase_a', *Inventory.new_item('fish', 'Cod'))
+    cache.add('firebase_a', *Inventory.new_item('fish', 'Cod'))
+    cache.add('firebase_a', *Inventory.new_item('treasure', 'Crown', {'unique': True}))
+
+    version, kind, delta = cache.since('firebase_a', 1)
+    assert (version, kind) == (3, 'delta')
+    assert delta['stacks']['fish']['Cod']['count'] == 2
+    assert [entry['name'] for entry in delta['unique']] == ['Crown']
+
+    cache.add('firebase_a', *Inventory.new_item('fish', 'Eel'))
+    cache.add('firebase_a', *Inventory.new_item('fish', 'Eel'))
+    # Version 1 has fallen out of the change log; so has anything from the future
+    assert cache.since('firebase_a', 1)[1] == 'full'
+    assert cache.since('firebase_a', 9)[1] == 'full'
+    assert cache.since('firebase_a', None)[1] == 'full'
+    assert cache.since('firebase_b', 0) is None
+
+
+def test_cache_limits_unique_items():
+    cache = InventoryCache()
+    cache.load('firebase_a', None)
+    field, crown = Inventory.new_item('treasure', 'Crown', {'unique': True})
+
+    assert cache.add('firebase_a', field, crown, max_unique=1) == (1, {'unique': [
+        {'type': 'treasures', 'name': 'Crown', 'at': crown['at'], 'data': {'unique': True}}]})
+    assert cache.add('firebase_a', field, crown, max_unique=1) == (1, None)
+
+
+def test_removal_takes_legacy_items_out_of_their_array():
+    stored = legacy_inventory()
+    del stored['stacks']
+
+    change, removed = Inventory.removal(stored, 'fish', 'Cod')
+    assert removed == {'weight': 2, 'count': 9}
+    assert change == {'fish': stored['fish'][1:]}
+    # Unique legacy entries aren't stacked, so they aren't removed by name
+    assert Inventory.removal(stored, 'fish', 'Pearl Fish') == (None, None)
+
+
+def test_removal_decrements_stacks_and_never_goes_below_zero():
+    path = firestore.FieldPath('stacks', 'fish', 'Cod').to_api_repr()
+
+    def removal(count):
+        stored = {'stacks': {'fish': {'Cod': {'count': count, 'data': {'w': 1}}}}}
+        return Inventory.removal(stored, 'fish', 'Cod')
+
+    assert removal(3) == ({path + '.count': 2}, {'w': 1})
+    assert removal(1) == ({path: firestore.DELETE_FIELD}, {'w': 1})
+    assert removal(0) == (None, None)
+    assert removal(-1) == (None, None)
+    assert Inventory.removal(None, 'fish', 'Cod') == (None, None)
+
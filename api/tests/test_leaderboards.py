@@ -0,0 +1,117 @@
+"""
+RankIndex and WindowedLeaderboard (leaderboards.py), checked against
+brute-force rankings. Pure Python, no requirements.
+"""
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboards import RankIndex, WindowedLeaderboard, bucket_key  # noqa: E402
+
+
+class SmallBlockRankIndex(RankIndex):
+    """Tiny blocks, so a few hundred players exercise block splits and removals"""
+    BLOCK_SIZE = 4
+
+
+def expected_order(scores):
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def expected_rank(scores, player_id):
+    return 1 + sum(1 for score in scores.values() if score > scores[player_id])
+
+
+def test_rank_position_and_slice_match_brute_force():
+    rng = random.Random(7)
+    index = SmallBlockRankIndex()
+    scores = {}
+    for step in range(2000):
+        player_id = f"p{rng.randrange(300)}"
+        if scores and rng.random() < 0.1:
+            removed = rng.choice(sorted(scores))
+            index.remove(removed)
+            del scores[removed]
+        else:
+            # Few distinct scores, so ties are common
+            scores[player_id] = rng.randrange(50)
+            index.update(player_id, scores[player_id])
+
+    order = expected_order(scores)
+    assert len(index) == len(scores)
+    assert index.slice(0, len(order)) == order
+    assert index.slice(10, 7) == order[10:17]
+    for position, (player_id, _) in enumerate(order):
+        assert index.position(player_id) == position
+        assert index.rank(player_id) == expected_rank(scores, player_id)
+
+
+def test_ties_share_a_rank():
+    index = RankIndex()
+    for player_id, score in (('a', 5), ('b', 9), ('c', 5), ('d', 1)):
+        index.update(player_id, score)
+
+    assert [index.rank(player_id) for player_id in 'abcd'] == [2, 1, 2, 4]
+
+
+def test_unknown_players_and_out_of_range_slices():
+    index = RankIndex()
+    index.update('a', 3)
+
+    assert index.rank('missing') is None
+    assert index.position('missing') is None
+    assert index.slice(5, 10) == []
+    assert index.slice(0, 0) == []
+    index.remove('missing')
+    index.remove('a')
+    assert len(index) == 0 and index.slice(0, 10) == []
+
+
+def timestamp(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def test_bucket_keys():
+    assert bucket_key('day', timestamp(2024, 6, 1, 23, 59)) == '2024-06-01'
+    assert bucket_key('week', timestamp(2024, 6, 1)) == '2024-W22'
+    # ISO weeks: 30 December 2024 is in week 1 of 2025
+    assert bucket_key('week', timestamp(2024, 12, 30)) == '2025-W01'
+
+
+def test_window_rolls_over_to_a_fresh_bucket():
+    board = WindowedLeaderboard('day')
+    day_one, day_two = timestamp(2024, 6, 1, 12), timestamp(2024, 6, 2, 0, 1)
+    board.add('a', 'fishCount', 3, now=day_one)
+    board.add('b', 'fishCount', 5, now=day_one)
+    board.add('a', 'fishCount', 4, now=day_one)
+
+    assert board.top('fishCount', now=day_one) == [('a', 7), ('b', 5)]
+    assert board.top('fishCount', now=day_two) == []
+    assert board.bucket == '2024-06-02'
+
+
+def test_window_trims_to_max_entries():
+    board = WindowedLeaderboard('week', max_entries=10)
+    now = timestamp(2024, 6, 1)
+    for score in range(12):
+        board.add(f"p{score}", 'money', score, now=now)
+
+    scores = board.scores['money']
+    assert len(scores) == 10
+    assert 'p0' not in scores and 'p1' not in scores
+
+
+def test_snapshot_restores_only_into_the_same_bucket():
+    board = WindowedLeaderboard('day')
+    board.add('a', 'monsterKills', 2)
+    snapshot = board.snapshot()
+    assert not board.dirty
+
+    restored = WindowedLeaderboard('day')
+    assert restored.restore(snapshot)
+    assert restored.top('monsterKills') == [('a', 2)]
+
+    assert not WindowedLeaderboard('day').restore({**snapshot, 'bucket': '2000-01-01'})
@@ -0,0 +1,72 @@
+"""
+Alias-method loot tables (loot.py): sampling follows the weights, and the
+shipped loot_tables.json compiles. Pure Python, no requirements.
+"""
+import math
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from loot import AliasSampler, LootEngine, LootTable  # noqa: E402
+
+DRAWS = 100000
+
+
+def frequencies(sampler, draws=DRAWS, seed=1):
+    rng = random.Random(seed)
+    counts = Counter(sampler.sample(rng) for _ in range(draws))
+    return [counts[i] / draws for i in range(len(sampler.probability))]
+
+
+@pytest.mark.parametrize('weights', [[1, 1, 1, 1], [70, 20, 9, 1], [0.5, 0, 3.5], [5]])
+def test_sampler_follows_the_weights(weights):
+    total = sum(weights)
+    observed = frequencies(AliasSampler(weights))
+
+    for weight, frequency in zip(weights, observed):
+        expected = weight / total
+        # Five standard deviations of a binomial proportion
+        assert abs(frequency - expected) <= 5 * math.sqrt(expected * (1 - expected) / DRAWS) + 1e-9
+
+
+@pytest.mark.parametrize('weights', [[], [0, 0], [1, -1]])
+def test_sampler_rejects_unusable_weights(weights):
+    with pytest.raises(ValueError):
+        AliasSampler(weights)
+
+
+def test_table_catches():
+    table = LootTable({'id': 'reef', 'coin_multiplier': 1.5, 'fish': [
+        {'name': 'Common', 'weight': 3, 'value': 10},
+        {'name': 'Rare', 'weight': 1, 'value': 0}
+    ]})
+
+    common, rare = table.catches
+    assert (common['coins'], common['rarity'], common['biome']) == (15, 0.75, 'reef')
+    # Every catch is worth at least a coin
+    assert rare['coins'] == 1
+    assert table.draw(random.Random(3))['name'] in ('Common', 'Rare')
+
+    with pytest.raises(ValueError):
+        LootTable({'id': 'empty', 'fish': []})
+
+
+def test_shipped_tables_draw_from_the_biome_at_a_position():
+    engine = LootEngine.load(os.path.join(API_DIR, 'loot_tables.json'), rng=random.Random(5))
+    biomes = {table.id for table in engine.tables}
+
+    size = engine.chunk_size
+    for chunk_x, chunk_z in ((0, 0), (2, -2), (-80, 1)):
+        x, z = chunk_x * size + 1, chunk_z * size + 1
+        table = engine.table_at(x, z)
+        assert table.id in biomes
+        # Anywhere in the same chunk is the same biome
+        assert engine.table_at(x + size - 2, z + size / 2) is table
+        assert engine.draw(x, z)['biome'] == table.id
+    assert engine.metrics() == {'draws': 3, 'biomes': len(engine.tables)}
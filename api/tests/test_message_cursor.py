@@ -0,0 +1,32 @@
+"""
+Chat history cursors (firestore_models.Message.parse_cursor/format_cursor),
+as sent in X-Next-Cursor and accepted as ?before=. Needs firebase_admin
+installed for the model module, but no Firestore.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('firebase_admin')
+
+from firestore_models import Message  # noqa: E402
+
+
+@pytest.mark.parametrize('cursor, parsed', [
+    ('1700000000.5_abc_def', (1700000000.5, 'abc_def')),
+    ('12_x', (12.0, 'x')),
+    ('nan_abc', None),
+    ('inf_abc', None),
+    ('12_', None),
+    ('12_a/b', None),
+    ('abc', None),
+    ('x_abc', None),
+    (None, None)
+])
+def test_message_cursors(cursor, parsed):
+    assert Message.parse_cursor(cursor) == parsed
+    if parsed:
+        assert Message.parse_cursor(Message.format_cursor(parsed)) == parsed
@@ -0,0 +1,123 @@
+"""
+update_position handling in game_protocol: stale and duplicate sequence
+numbers and updates from sockets that don't own the player are dropped.
+
+Joins a player through player_join with storage answered in memory, so it
+needs the server's requirements installed but no Firestore.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('firebase_admin')
+pytest.importorskip('numpy')
+
+import game_protocol  # noqa: E402
+from memory_storage import InMemoryStorage  # noqa: E402
+
+REPLAY_SECRET = 'test-secret'
+PLAYER_ID = 'firebase_sequence'
+
+
+class RecordingTransport:
+    """Records what the protocol sends"""
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None, skip_sid=None):
+        self.emitted.append((event, data, to))
+
+    def disconnect(self, sid):
+        pass
+
+    def enter_room(self, sid, room):
+        pass
+
+
+def join(sid):
+    game_protocol.dispatch('player_join', sid, {
+        'firebaseToken': f'replay:{REPLAY_SECRET}:sequence',
+        'player_id': 'sequence',
+        'name': 'Sequence Sailor'
+    })
+
+
+@pytest.fixture
+def joined(monkeypatch):
+    monkeypatch.setattr(game_protocol, 'REPLAY_AUTH_SECRET', REPLAY_SECRET)
+    game_protocol.init(RecordingTransport(), InMemoryStorage())
+    sid = 'sid-sequence'
+    join(sid)
+    assert game_protocol.socket_to_user_map.get(sid) == PLAYER_ID
+    yield sid
+    game_protocol.handle_disconnect(sid)
+
+
+def move(sid, x, seq=None, player_id=PLAYER_ID):
+    data = {'player_id': player_id, 'x': x, 'y': 0, 'z': 0}
+    if seq is not None:
+        data['seq'] = seq
+    game_protocol.dispatch('update_position', sid, data)
+
+
+def position_x():
+    return game_protocol.players[PLAYER_ID]['position']['x']
+
+
+def counter(name):
+    return game_protocol.metrics[name]
+
+
+def test_stale_and_duplicate_updates_are_dropped(joined):
+    stale, duplicate = counter('position_updates_stale'), counter('position_updates_duplicate')
+
+    move(joined, 10, seq=5)
+    move(joined, 20, seq=5)
+    move(joined, 30, seq=4)
+    assert position_x() == 10
+    assert counter('position_updates_duplicate') == duplicate + 1
+    assert counter('position_updates_stale') == stale + 1
+
+    move(joined, 40, seq=6)
+    assert position_x() == 40
+    # Updates without a sequence number are always applied
+    move(joined, 50)
+    assert position_x() == 50
+
+
+def test_invalid_sequence_numbers_fail_validation(joined):
+    move(joined, 10, seq=1)
+    move(joined, 20, seq=2.5)
+    move(joined, 30, seq=float('inf'))
+    assert position_x() == 10
+
+
+def test_only_the_players_current_socket_may_move_it(joined):
+    wrong_socket = counter('position_updates_wrong_socket')
+
+    move('sid-other', 10, seq=1)
+    game_protocol.socket_to_user_map['sid-other'] = 'firebase_other'
+    try:
+        move('sid-other', 20, seq=1)
+    finally:
+        game_protocol.socket_to_user_map.pop('sid-other', None)
+    assert position_x() != 10 and position_x() != 20
+    assert counter('position_updates_wrong_socket') == wrong_socket + 2
+
+
+def test_rejoining_socket_starts_a_new_sequence(joined):
+    move(joined, 10, seq=100)
+
+    join('sid-rejoin')
+    try:
+        # The new session numbers from 1 again; the old socket can't move the boat
+        move('sid-rejoin', 20, seq=1)
+        assert position_x() == 20
+        move(joined, 30, seq=101)
+        assert position_x() == 20
+    finally:
+        game_protocol.handle_disconnect('sid-rejoin')
@@ -0,0 +1,108 @@
+"""
+Payload validation (schemas.py): field checks and the event schemas whose
+bounds the protocol relies on. Pure Python, no requirements.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schemas  # noqa: E402
+from schemas import BOOL, INT, LIST, NUMBER, OBJECT, STR, Field, compile_schema  # noqa: E402
+
+INF, NAN = float('inf'), float('nan')
+
+
+def reason(schema, payload):
+    return compile_schema(schema)(payload)[1]
+
+
+def test_strings_are_stripped_and_checked():
+    validate = compile_schema({'name': Field(STR, required=True, min_length=2, max_length=5,
+                                             pattern=r'[a-z]+$')})
+
+    assert validate({'name': '  abc '}) == ({'name': 'abc'}, None)
+    assert validate({'name': 'a'}) == (None, 'length:name')
+    assert validate({'name': 'abc1'}) == (None, 'format:name')
+    assert validate({'name': 3}) == (None, 'type:name')
+    assert validate({}) == (None, 'missing:name')
+    assert validate({'name': None}) == (None, 'missing:name')
+    assert validate('abc') == (None, 'not_an_object')
+
+
+def test_numbers_are_coerced_and_bounded():
+    validate = compile_schema({'n': Field(NUMBER, min=0, max=10)})
+
+    assert validate({'n': '2.5'}) == ({'n': 2.5}, None)
+    assert validate({'n': 11}) == (None, 'range:n')
+    assert validate({'n': True}) == (None, 'type:n')
+    assert validate({'n': NAN}) == (None, 'type:n')
+    assert validate({'n': 'nan'}) == (None, 'type:n')
+    assert validate({'n': INF}) == (None, 'range:n')
+
+
+def test_ints_reject_fractions():
+    validate = compile_schema({'i': Field(INT, default=1, min=1)})
+
+    assert validate({}) == ({'i': 1}, None)
+    assert validate({'i': 4.0}) == ({'i': 4}, None)
+    assert validate({'i': '7'}) == ({'i': 7}, None)
+    assert validate({'i': 4.5}) == (None, 'type:i')
+    assert validate({'i': INF}) == (None, 'type:i')
+    assert validate({'i': 0}) == (None, 'range:i')
+
+
+def test_choices_bools_and_callable_defaults():
+    validate = compile_schema({
+        'window': Field(STR, default='all', choices=('all', 'day')),
+        'flag': Field(BOOL),
+        'data': Field(OBJECT, default=dict)
+    })
+
+    clean, _ = validate({'flag': False})
+    assert clean == {'window': 'all', 'flag': False, 'data': {}}
+    assert validate({'window': 'year'}) == (None, 'choice:window')
+    assert validate({'flag': 'yes'}) == (None, 'type:flag')
+    # Every payload gets its own default dict
+    assert compile_schema({'data': Field(OBJECT, default=dict)})({})[0]['data'] is not clean['data']
+
+
+def test_nested_objects_and_lists_report_the_failing_path():
+    validate = compile_schema({
+        'shots': Field(LIST, max_length=2, items=Field(OBJECT, fields={'x': Field(NUMBER, required=True)}))
+    })
+
+    assert validate({'shots': [{'x': '1', 'extra': 0}]}) == ({'shots': [{'x': 1.0}]}, None)
+    assert validate({'shots': [{'x': 1}, {}]}) == (None, 'shots[].missing:x')
+    assert validate({'shots': [{'x': 1}] * 3}) == (None, 'length:shots')
+    assert validate({'shots': {'x': 1}}) == (None, 'type:shots')
+
+
+def test_position_update_bounds():
+    base = {'player_id': 'firebase_abc', 'x': 1, 'z': 2}
+
+    assert reason(schemas.UPDATE_POSITION, {**base, 'seq': 3, 'rotation': -12.5}) is None
+    assert reason(schemas.UPDATE_POSITION, {**base, 'seq': 1.5}) == 'type:seq'
+    assert reason(schemas.UPDATE_POSITION, {**base, 'seq': 2 ** 53}) == 'range:seq'
+    assert reason(schemas.UPDATE_POSITION, {**base, 'rotation': INF}) == 'range:rotation'
+    assert reason(schemas.UPDATE_POSITION, {**base, 'x': INF}) == 'range:x'
+    assert reason(schemas.UPDATE_POSITION, {**base, 'player_id': 'abc'}) == 'format:player_id'
+
+
+def test_chat_message_types_are_restricted():
+    message = {'player_id': 'firebase_abc', 'content': 'ahoy'}
+
+    assert compile_schema(schemas.SEND_MESSAGE)(message)[0]['type'] == 'global'
+    assert reason(schemas.SEND_MESSAGE, {**message, 'type': 'anything'}) == 'choice:type'
+    assert reason(schemas.SEND_MESSAGE, {**message, 'content': '   '}) == 'length:content'
+
+
+def test_island_reports_are_bounded():
+    island = {'id': 'island_1', 'x': 10, 'z': -10}
+
+    assert compile_schema(schemas.ISLAND)(island) == (
+        {**island, 'y': 0, 'radius': 50, 'type': 'default'}, None)
+    assert reason(schemas.ISLAND, {**island, 'x': 2e6}) == 'range:x'
+    assert reason(schemas.ISLAND, {**island, 'y': 5000}) == 'range:y'
+    assert reason(schemas.ISLAND, {**island, 'id': 'a/b'}) == 'format:id'
+    assert reason(schemas.REGISTER_ISLANDS, {'islands': [island] * 1001}) == 'length:islands'
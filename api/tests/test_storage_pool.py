@@ -0,0 +1,108 @@
+"""
+StoragePool saturation, timeouts and callback delivery (storage_pool.py).
+Pure Python, no requirements.
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage_pool import StoragePool, StorageSaturated, StorageTimeout  # noqa: E402
+
+
+@pytest.fixture
+def pool():
+    pools = []
+
+    def make(**kwargs):
+        pools.append(StoragePool(**kwargs))
+        return pools[-1]
+
+    yield make
+    for created in pools:
+        created.drain(timeout=1)
+
+
+def blocker():
+    """A storage call that runs until released"""
+    release = threading.Event()
+    return release, lambda: release.wait(5)
+
+
+def test_rejects_calls_beyond_workers_and_queue(pool):
+    storage = pool(max_workers=1, max_queue=1)
+    release, blocked = blocker()
+    running = storage.submit(blocked)
+    queued = storage.submit(blocked)
+
+    rejected = storage.submit(blocked)
+    assert isinstance(rejected.exception(timeout=0), StorageSaturated)
+    with pytest.raises(StorageSaturated):
+        storage.run(lambda: 1)
+
+    release.set()
+    running.result(timeout=1)
+    queued.result(timeout=1)
+    assert storage.run(lambda: 'free again') == 'free again'
+    metrics = storage.metrics()
+    assert metrics['rejected'] == 2
+    assert metrics['completed'] == 3
+
+
+def test_calls_that_waited_too_long_are_dropped(pool):
+    storage = pool(max_workers=1, max_queue=1, timeout=0.05)
+    ran = []
+    release, blocked = blocker()
+    storage.submit(blocked)
+    late = storage.submit(ran.append, 'late')
+
+    time.sleep(0.1)
+    release.set()
+    assert isinstance(late.exception(timeout=1), StorageTimeout)
+    assert ran == []
+    assert storage.metrics()['timed_out'] == 1
+
+
+@pytest.mark.parametrize('sleep', [None, time.sleep], ids=['blocking', 'with_sleep'])
+def test_run_times_out_and_cancels_queued_calls(pool, sleep):
+    storage = pool(max_workers=1, max_queue=1, timeout=0.05, sleep=sleep)
+    ran = []
+    release, blocked = blocker()
+    storage.submit(blocked)
+
+    with pytest.raises(StorageTimeout):
+        storage.run(ran.append, 'queued')
+    release.set()
+    time.sleep(0.05)
+    assert ran == []
+
+
+def test_run_waits_with_the_server_sleep(pool):
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        time.sleep(seconds)
+
+    storage = pool(max_workers=1, sleep=sleep)
+    assert storage.run(lambda: time.sleep(0.02) or 'done') == 'done'
+    assert sleeps
+
+
+def test_queued_callbacks_run_only_on_the_server_loop(pool):
+    storage = pool(max_workers=2)
+    storage.queue_callbacks()
+    results, errors = [], []
+
+    storage.call(lambda: 42, on_result=results.append).result(timeout=1)
+    storage.call(lambda: 1 / 0, on_error=errors.append).exception(timeout=1)
+    time.sleep(0.01)
+    assert results == [] and errors == []
+
+    assert storage.run_pending_callbacks() == 2
+    assert results == [42]
+    assert isinstance(errors[0], ZeroDivisionError)
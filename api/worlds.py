@@ -0,0 +1,136 @@
+"""
+World instances (shards) hosted by this server process.
+
+Every joined player is placed in one instance. Each instance has its own
+player set, spatial grids (so movement relay and proximity checks only see
+its own players) and Socket.IO room (so joins, leaves, profile updates and
+chat are only broadcast inside it). Islands are the shared procedurally
+generated map and stay global.
+
+Players go to the instance they ask for if it has room, otherwise to the
+fullest instance that still has room, so instances stay dense; a new instance
+is opened when all are full. Empty instances beyond the first are closed.
+Instance IDs are prefixed with the server ID. Instances only exist within
+this process; nothing routes players to instances hosted elsewhere.
+"""
+import threading
+import time
+from spatial import SpatialGrid
+
+
+class WorldInstance:
+    """One shard: its players, their spatial grids and its broadcast room"""
+
+    def __init__(self, instance_id, capacity, relay_cell_size, nearby_cell_size):
+        self.id = instance_id
+        self.capacity = capacity
+        self.room = f"world:{instance_id}"
+        self.player_ids = set()
+        self.relay_grid = SpatialGrid(cell_size=relay_cell_size)
+        self.player_grid = SpatialGrid(cell_size=nearby_cell_size)
+        self.created_at = time.time()
+
+    @property
+    def is_full(self):
+        return len(self.player_ids) >= self.capacity
+
+    def remove(self, player_id):
+        self.player_ids.discard(player_id)
+        self.relay_grid.remove(player_id)
+        self.player_grid.remove(player_id)
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'players': len(self.player_ids),
+            'capacity': self.capacity,
+            'created_at': self.created_at
+        }
+
+
+class WorldDirectory:
+    """The instances hosted here and which one each player is in"""
+
+    def __init__(self, server_id, capacity=100, max_instances=8,
+                 relay_cell_size=750.0, nearby_cell_size=150.0):
+        """
+        :param server_id: Prefix of this process's instance IDs
+        :param capacity: Players per instance
+        :param max_instances: Instances this process may host at once
+        :param relay_cell_size: Cell size of each instance's movement relay grid
+        :param nearby_cell_size: Cell size of each instance's proximity grid
+        """
+        self.server_id = server_id
+        self.capacity = capacity
+        self.max_instances = max_instances
+        self.relay_cell_size = relay_cell_size
+        self.nearby_cell_size = nearby_cell_size
+        self.instances = {}
+        self.player_instance = {}  # player_id -> WorldInstance
+        self.next_number = 1
+        self.lock = threading.Lock()
+        self.stats = {'opened': 0, 'closed': 0, 'rejected': 0}
+        self._open()
+
+    def _open(self):
+        instance_id = f"{self.server_id}-{self.next_number}"
+        self.next_number += 1
+        instance = WorldInstance(instance_id, self.capacity, self.relay_cell_size, self.nearby_cell_size)
+        self.instances[instance_id] = instance
+        self.stats['opened'] += 1
+        return instance
+
+    def assign(self, player_id, requested=None):
+        """
+        Place a player in an instance (keeping the one they are already in)
+
+        :param requested: Instance ID the client asked for, if any
+        :return: The WorldInstance, or None if every instance is full and no more can be opened
+        """
+        with self.lock:
+            current = self.player_instance.get(player_id)
+            if current is not None:
+                return current
+            instance = self.instances.get(requested) if requested else None
+            if instance is None or instance.is_full:
+                open_instances = [i for i in self.instances.values() if not i.is_full]
+                if open_instances:
+                    instance = max(open_instances, key=lambda i: len(i.player_ids))
+                elif len(self.instances) < self.max_instances:
+                    instance = self._open()
+                else:
+                    self.stats['rejected'] += 1
+                    return None
+            instance.player_ids.add(player_id)
+            self.player_instance[player_id] = instance
+            return instance
+
+    def of(self, player_id):
+        """The instance a player is in, or None"""
+        return self.player_instance.get(player_id)
+
+    def leave(self, player_id):
+        """Take a player out of their instance; returns the instance they were in"""
+        with self.lock:
+            instance = self.player_instance.pop(player_id, None)
+            if instance is None:
+                return None
+            instance.remove(player_id)
+            if not instance.player_ids and len(self.instances) > 1:
+                del self.instances[instance.id]
+                self.stats['closed'] += 1
+            return instance
+
+    def describe(self):
+        with self.lock:
+            return [instance.describe() for instance in self.instances.values()]
+
+    def metrics(self):
+        with self.lock:
+            return {
+                **self.stats,
+                'instances': len(self.instances),
+                'players': len(self.player_instance),
+                'capacity': self.capacity,
+                'max_instances': self.max_instances
+            }
@@ -802,6 +802,7 @@ function animate() {
 
     // Network and UI updates
     Network.updatePlayerPosition();
+    Network.extrapolateOtherPlayers();
     updateGameUI();
 
     // Update sun position relative to camera
@@ -39,6 +39,36 @@ let activeIslandsRef;
 // Callback for 'all_players' event
 let allPlayersCallback = null;
 
+// Sequence number for position updates; the server drops stale or duplicate ones
+let positionSeq = 0;
+
+// Dead reckoning: send positions every sendInterval ms (set by the server), or sooner
+// when we turn or drift from the course the server and other clients are predicting
+let sendInterval = 50;
+let positionTolerance = 2;
+const TURN_TOLERANCE = 0.1; // radians
+const MAX_EXTRAPOLATION = 1000; // ms
+let lastSentState = null;
+
+// Last inventory received from the server; its version lets the server answer
+// get_inventory with "unchanged" or just the items added since
+let cachedInventory = null;
+
+// World instance the server placed us in
+let currentWorld = undefined;
+
+// Largest batch of islands the server accepts in one register_islands message
+const ISLANDS_PER_MESSAGE = 1000;
+
+// Sea monsters and cannonballs are simulated by the server; these receive its
+// monsters_update, monster_killed and cannon_hit events
+let monstersUpdateCallback = null;
+let monsterKilledCallback = null;
+let cannonHitCallback = null;
+
+// Fish are drawn by the server: hook_fish is answered with fish_hooked
+let fishHookedCallback = null;
+
 // Register a callback for when player list is updated
 export function onAllPlayers(callback) {
     allPlayersCallback = callback;
@@ -143,6 +173,8 @@ export async function initializeNetwork(
     socket.on('connect', () => {
         console.log('Connected to game server, sending player data');
         isConnected = true;
+        positionSeq = 0; // Each session numbers its updates from scratch
+        lastSentState = null;
 
         // CRUCIAL FIX: Get the current Firebase UID value at connection time
         // This ensures we're using the most up-to-date value
@@ -156,7 +188,8 @@ export async function initializeNetwork(
             rotation: boatRef.rotation.y,
             mode: playerStateRef.mode,
             player_id: userId,      // Use module-scoped variable
-            firebaseToken: firebaseToken   // Use module-scoped variable
+            firebaseToken: firebaseToken,   // Use module-scoped variable
+            world: currentWorld     // Rejoin the same world instance after a reconnect
         });
     });
 
@@ -308,6 +341,18 @@ function setupSocketEvents() {
         console.log("setting player data ", data);
         setPlayerStateFromDb(data);
 
+        if (data.world) {
+            currentWorld = data.world;
+        }
+
+        // Position send rate advertised by the server
+        if (data.send_interval) {
+            sendInterval = data.send_interval;
+        }
+        if (data.position_tolerance) {
+            positionTolerance = data.position_tolerance;
+        }
+
         setupAllPlayersTracking();
 
 
@@ -317,8 +362,8 @@ function setupSocketEvents() {
         getPlayerInventory((inventory) => {
             console.log('Inventory:', inventory);
             if (inventory) {
-                console.log('My fish collection:', inventory.fish);
-                console.log('My treasures:', inventory.treasures);
+                console.log('My fish collection:', inventory.stacks.fish);
+                console.log('My treasures:', inventory.stacks.treasures);
 
                 // Check if player has a specific item
                 if (playerHasItem(inventory, 'fish', 'Rare Tuna')) {
@@ -374,6 +419,85 @@ function setupSocketEvents() {
         }
     });
 
+    // Movement relayed on the server tick, batched per receiver
+    socket.on('players_moved', (batch) => {
+        batch.forEach((data) => {
+            if (data.id !== playerId) {
+                updateOtherPlayerPosition(data);
+            }
+        });
+    });
+
+    // The server adapts how often we should send our position
+    socket.on('send_rate', (data) => {
+        if (data.interval) {
+            sendInterval = data.interval;
+        }
+    });
+
+    // Joins are queued while the server is busy; connection_response arrives once admitted
+    socket.on('queue_position', (data) => {
+        console.log(`Waiting to join: position ${data.position} of ${data.queue_length}`);
+    });
+
+    socket.on('server_full', (data) => {
+        console.warn('Could not join:', data.message);
+    });
+
+    socket.on('inventory_updated', (data) => {
+        if (data.inventory) {
+            cachedInventory = data.inventory;
+        } else if (cachedInventory && data.version === cachedInventory.version + 1) {
+            mergeInventoryChanges(cachedInventory, data);
+        } else {
+            // Missed an update; fetch the whole inventory next time
+            cachedInventory = null;
+        }
+    });
+
+    // Server-simulated sea monsters near us, as [id, type, state, x, y, z, vx, vy, vz, health] rows
+    socket.on('monsters_update', (data) => {
+        if (monstersUpdateCallback) {
+            monstersUpdateCallback(data.monsters);
+        }
+    });
+
+    socket.on('fish_hooked', (fish) => {
+        const callback = fishHookedCallback;
+        fishHookedCallback = null;
+        if (callback) {
+            callback(fish);
+        }
+    });
+
+    // The server landed our fish and paid for it
+    socket.on('fish_landed', (data) => {
+        playerStats.fishCount = data.fishCount;
+        playerStats.money = data.money;
+        console.log(`Landed ${data.fish.name} for ${data.coins} coins`);
+        if (window.gameUI && typeof window.gameUI.updatePlayerStats === 'function') {
+            window.gameUI.updatePlayerStats();
+        }
+    });
+
+    // A cannonball hit a monster or boat near us
+    socket.on('cannon_hit', (data) => {
+        if (cannonHitCallback) {
+            cannonHitCallback({ ...data, ownBoat: data.target === 'boat' && data.id === firebaseDocId });
+        }
+    });
+
+    // One of our cannonballs killed a monster; the server has already counted the kill
+    socket.on('monster_killed', (data) => {
+        playerStats.monsterKills = data.monsterKills;
+        if (monsterKilledCallback) {
+            monsterKilledCallback(data);
+        }
+        if (window.gameUI && typeof window.gameUI.updatePlayerStats === 'function') {
+            window.gameUI.updatePlayerStats();
+        }
+    });
+
     socket.on('player_updated', (data) => {
         if (data.id !== playerId) {
             updateOtherPlayerInfo(data);
@@ -520,14 +644,62 @@ export function updatePlayerPosition() {
 
     // Get the active object (boat or character)
     const activeObject = playerStateRef.mode === 'boat' ? boatRef : character;
+    const now = performance.now();
+    const { x, y, z } = activeObject.position;
+    const rotation = activeObject.rotation.y;
+
+    // Skip this frame while the predicted course from our last update is still accurate
+    if (lastSentState && lastSentState.mode === playerStateRef.mode) {
+        const elapsed = now - lastSentState.t;
+        const dt = Math.min(elapsed, MAX_EXTRAPOLATION) / 1000;
+        const error = Math.hypot(
+            x - (lastSentState.x + lastSentState.vx * dt),
+            y - (lastSentState.y + lastSentState.vy * dt),
+            z - (lastSentState.z + lastSentState.vz * dt)
+        );
+        const turn = Math.abs(Math.atan2(Math.sin(rotation - lastSentState.rotation), Math.cos(rotation - lastSentState.rotation)));
+        if (elapsed < sendInterval && error <= positionTolerance && turn <= TURN_TOLERANCE) {
+            return;
+        }
+    }
+
+    // Velocity since the last update, as the server will estimate it
+    let vx = 0, vy = 0, vz = 0;
+    if (lastSentState) {
+        const dt = (now - lastSentState.t) / 1000;
+        if (dt > 0) {
+            vx = (x - lastSentState.x) / dt;
+            vy = (y - lastSentState.y) / dt;
+            vz = (z - lastSentState.z) / dt;
+        }
+    }
+    lastSentState = { x, y, z, vx, vy, vz, rotation, mode: playerStateRef.mode, t: now };
 
     socket.emit('update_position', {
-        x: activeObject.position.x,
-        y: activeObject.position.y,
-        z: activeObject.position.z,
-        rotation: activeObject.rotation.y,
+        x: x,
+        y: y,
+        z: z,
+        rotation: rotation,
         mode: playerStateRef.mode,
-        player_id: firebaseDocId
+        player_id: firebaseDocId,
+        seq: ++positionSeq
+    });
+}
+
+// Move other players' boats along their last known velocity between updates
+export function extrapolateOtherPlayers() {
+    const now = performance.now();
+    otherPlayers.forEach((player) => {
+        const velocity = player.data.velocity;
+        if (!velocity || player.receivedAt === undefined) return;
+
+        const dt = Math.min(now - player.receivedAt, MAX_EXTRAPOLATION) / 1000;
+        const position = player.data.position;
+        player.mesh.position.set(
+            position.x + velocity.x * dt,
+            position.y + velocity.y * dt,
+            position.z + velocity.z * dt
+        );
     });
 }
 
@@ -565,18 +737,21 @@ export function setPlayerColor(color) {
 function registerIslands() {
     if (!isConnected || !socket) return;
 
-    // Register each island with the server
-    islandCollidersRef.forEach(collider => {
-        socket.emit('register_island', {
-            id: collider.id,
-            x: collider.center.x,
-            y: collider.center.y,
-            z: collider.center.z,
-            radius: collider.radius,
-            type: activeIslandsRef.get(collider.id)?.type || 'default',
+    // Send every island collider in a few bulk messages; the server ignores ones it already knows
+    const islands = islandCollidersRef.map(collider => ({
+        id: collider.id,
+        x: collider.center.x,
+        y: collider.center.y,
+        z: collider.center.z,
+        radius: collider.radius,
+        type: activeIslandsRef.get(collider.id)?.type || 'default'
+    }));
+    for (let i = 0; i < islands.length; i += ISLANDS_PER_MESSAGE) {
+        socket.emit('register_islands', {
+            islands: islands.slice(i, i + ISLANDS_PER_MESSAGE),
             player_id: firebaseDocId
         });
-    });
+    }
 }
 
 // Add another player to the scene
@@ -707,8 +882,10 @@ function updateOtherPlayerPosition(playerData) {
         ...player.data,
         position: playerData.position,
         rotation: playerData.rotation,
-        mode: playerData.mode
+        mode: playerData.mode,
+        velocity: playerData.velocity
     };
+    player.receivedAt = performance.now();
 }
 
 // Update another player's information (like name)
@@ -858,26 +1035,19 @@ export function getPlayerStats() {
     return { ...playerStats };
 }
 
-// Call this when a player catches a fish
-export function onFishCaught(value = 1) {
-    if (!isConnected || !socket) return;
-
-    // Update local stats
-    playerStats.fishCount += value;
-
-    console.log(`Fish caught! New count: ${playerStats.fishCount}`);
-
-    // Send the fish caught action to server
-    socket.emit('player_action', {
-        action: 'fish_caught',
-        value: value,
-        player_id: firebaseDocId
-    });
+// Ask the server which fish bit; callback(fish) runs when it answers.
+// Returns false when offline.
+export function hookFish(callback) {
+    if (!isConnected || !socket) return false;
+    fishHookedCallback = callback;
+    socket.emit('hook_fish');
+    return true;
+}
 
-    // Update UI
-    if (window.gameUI && typeof window.gameUI.updatePlayerStats === 'function') {
-        window.gameUI.updatePlayerStats();
-    }
+// Report how the fishing minigame ended
+export function landFish(success) {
+    if (!isConnected || !socket) return;
+    socket.emit('land_fish', { success });
 }
 
 // Call this when a player kills a monster
@@ -902,26 +1072,22 @@ export function onMonsterKilled(value = 1) {
     }
 }
 
-// Call this when a player earns money
-export function onMoneyEarned(value) {
-    if (!isConnected || !socket) return;
-
-    // Update local stats
-    playerStats.money += value;
+export function onMonstersUpdate(callback) {
+    monstersUpdateCallback = callback;
+}
 
-    console.log(`Money earned! New amount: ${playerStats.money}`);
+export function onServerMonsterKilled(callback) {
+    monsterKilledCallback = callback;
+}
 
-    // Send the money earned action to server
-    socket.emit('player_action', {
-        action: 'money_earned',
-        value: value,
-        player_id: firebaseDocId
-    });
+export function onCannonHit(callback) {
+    cannonHitCallback = callback;
+}
 
-    // Update UI
-    if (window.gameUI && typeof window.gameUI.updatePlayerStats === 'function') {
-        window.gameUI.updatePlayerStats();
-    }
+// Fire a volley at the given aim points ({ x, z }); the server flies the cannonballs and decides what they hit
+export function fireCannonShots(shots) {
+    if (!isConnected || !socket) return;
+    socket.emit('fire_cannons', { shots });
 }
 
 // Add this new function to initialize player stats
@@ -1080,23 +1246,53 @@ export function getPlayerInventory(callback) {
     // Set up handler for inventory data response
     socket.on('inventory_data', (inventoryData) => {
         console.log('DEBUG CLIENT: Received inventory data:', inventoryData);
+        if (inventoryData && !inventoryData.error) {
+            if (inventoryData.unchanged && cachedInventory) {
+                inventoryData = cachedInventory;
+            } else if (inventoryData.base_version !== undefined && cachedInventory &&
+                       inventoryData.base_version === cachedInventory.version) {
+                mergeInventoryChanges(cachedInventory, inventoryData);
+                inventoryData = cachedInventory;
+            } else if (!inventoryData.unchanged && inventoryData.base_version === undefined) {
+                cachedInventory = inventoryData;
+            } else {
+                // Reply doesn't match what we have; ask again for the whole inventory
+                cachedInventory = null;
+                getPlayerInventory(callback);
+                return;
+            }
+        }
         if (callback) callback(inventoryData);
     });
 
-    // Request inventory data via Socket.IO
-    socket.emit('get_inventory', {
-        player_id: firebaseDocId
-    });
+    // Request inventory data via Socket.IO, with the version we already have
+    const request = { player_id: firebaseDocId };
+    if (cachedInventory && cachedInventory.version !== undefined) {
+        request.version = cachedInventory.version;
+    }
+    socket.emit('get_inventory', request);
 
     return true;
 }
 
+// Apply changed stacks and new unique items to the cached inventory
+function mergeInventoryChanges(inventory, changes) {
+    for (const [field, stacks] of Object.entries(changes.stacks || {})) {
+        inventory.stacks[field] = Object.assign(inventory.stacks[field] || {}, stacks);
+    }
+    if (changes.unique) {
+        inventory.unique = (inventory.unique || []).concat(changes.unique);
+    }
+    inventory.version = changes.version;
+}
+
 // Helper function to check if player has a specific item
 export function playerHasItem(inventoryData, itemType, itemName) {
     if (!inventoryData) return false;
 
-    const itemCollection = inventoryData[itemType];
-    if (!itemCollection || !Array.isArray(itemCollection)) return false;
+    // Items are stacked by name; unique items are listed separately
+    const stack = inventoryData.stacks && inventoryData.stacks[itemType];
+    if (stack && stack[itemName] && stack[itemName].count > 0) return true;
 
-    return itemCollection.some(item => item.name === itemName);
+    return (inventoryData.unique || []).some(item => item.type === itemType && item.name === itemName);
 }
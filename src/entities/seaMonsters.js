@@ -5,6 +5,7 @@ import { flashBoatDamage } from '../entities/character.js'; // Add this import
 import { getFishInventory } from '../gameplay/fishing.js'; // Import the fish inventory
 import { createTreasureDrop, updateTreasures, initTreasureSystem } from '../gameplay/treasure.js';
 import { applyOutline, removeOutline } from '../theme/outlineStyles.js';
+import { onMonstersUpdate } from '../core/network.js';
 
 // Sea monster configuration
 const MONSTER_COUNT = 15;
@@ -40,8 +41,27 @@ const MONSTER_STATE = {
     DYING: 'dying'         // Monster is dying
 };
 
+// Server-simulated monsters: rows of monsters_update carry type and state as indexes into these
+const SERVER_MONSTER_TYPES = [
+    MONSTER_TYPES.YELLOW_BEAST,
+    MONSTER_TYPES.KRAKEN,
+    MONSTER_TYPES.SEA_SERPENT,
+    MONSTER_TYPES.PHANTOM_JELLYFISH
+];
+const SERVER_MONSTER_STATES = [
+    MONSTER_STATE.LURKING,
+    MONSTER_STATE.HUNTING,
+    MONSTER_STATE.SURFACING,
+    MONSTER_STATE.ATTACKING,
+    MONSTER_STATE.DIVING,
+    MONSTER_STATE.DYING
+];
+const SERVER_POSITION_CORRECTION = 0.1; // Fraction of the gap to the server's position closed per frame
+
 // Monster state
 let monsters = [];
+let serverMonsters = new Map(); // Server monster ID -> monster
+let serverAuthoritative = false; // Set once the server streams monsters; local spawning stops
 let playerBoat = null;
 let lastNightSpawn = false; // Track if we've already spawned monsters this night
 let lastTimeOfDay = ""; // Track the previous time of day
@@ -56,6 +76,9 @@ export function setupSeaMonsters(boat) {
     try {
         playerBoat = boat;
 
+        // Follow the server's monsters once it streams them
+        onMonstersUpdate(applyServerMonsters);
+
         // Initialize the treasure system with the same boat reference
         initTreasureSystem(boat);
 
@@ -135,8 +158,10 @@ export function updateSeaMonsters(deltaTime) {
             // Update state timer
             monster.stateTimer -= deltaTime;
 
-            // Update monster based on current state
-            switch (monster.state) {
+            // Server monsters follow the server, except for their local death animation
+            if (monster.serverId !== undefined && monster.state !== MONSTER_STATE.DYING) {
+                followServerMonster(monster);
+            } else switch (monster.state) {
                 case MONSTER_STATE.LURKING:
                     updateLurkingMonster(monster, deltaTime);
                     break;
@@ -1312,6 +1337,9 @@ function createElectricDischargeEffect(position) {
 
 // Respawn monsters at night until we reach the maximum count
 function respawnMonstersAtNight() {
+    // The server spawns monsters when it simulates them
+    if (serverAuthoritative) return;
+
     // Count how many monsters to spawn
     const monstersToSpawn = MONSTER_COUNT - monsters.length;
 
@@ -1332,6 +1360,85 @@ function respawnMonstersAtNight() {
     console.log(`Sea monsters have respawned (${monsters.length}/${MONSTER_COUNT})`);
 }
 
+// Apply a monsters_update from the server: create, move and remove monsters to match it
+export function applyServerMonsters(rows) {
+    if (!serverAuthoritative) {
+        // The server owns the monsters from now on; drop the locally simulated ones
+        serverAuthoritative = true;
+        monsters.filter(monster => monster.serverId === undefined).forEach(removeMonster);
+    }
+
+    const seen = new Set();
+    rows.forEach(([id, typeIndex, stateIndex, x, y, z, vx, vy, vz, health]) => {
+        seen.add(id);
+        let monster = serverMonsters.get(id);
+        if (!monster) {
+            monster = createServerMonster(id, SERVER_MONSTER_TYPES[typeIndex], x, y, z);
+        }
+        monster.health = health;
+        monster.serverPosition.set(x, y, z);
+
+        // Once dying, the local death animation takes over
+        if (monster.state === MONSTER_STATE.DYING) return;
+        monster.state = SERVER_MONSTER_STATES[stateIndex] || MONSTER_STATE.LURKING;
+        if (monster.state === MONSTER_STATE.DYING) {
+            monster.velocity.set(0, -0.2, 0);
+        } else {
+            // The server sends units per second; monsters move per frame
+            monster.velocity.set(vx / 60, vy / 60, vz / 60);
+        }
+    });
+
+    // Monsters no longer sent are out of range or gone
+    serverMonsters.forEach((monster, id) => {
+        if (seen.has(id)) return;
+        serverMonsters.delete(id);
+        // A monster we killed is removed by its death sequence
+        if (!monster.localDeath) {
+            removeMonster(monster);
+        }
+    });
+}
+
+function createServerMonster(id, monsterType, x, y, z) {
+    // Sea serpents have no working model yet; draw them as the original monster
+    const renderedType = monsterType === MONSTER_TYPES.SEA_SERPENT ? MONSTER_TYPES.YELLOW_BEAST : monsterType;
+    createMonsterByType(renderedType || MONSTER_TYPES.YELLOW_BEAST);
+    const monster = monsters[monsters.length - 1];
+    monster.serverId = id;
+    monster.monsterType = monsterType || MONSTER_TYPES.YELLOW_BEAST;
+    monster.serverPosition = new THREE.Vector3(x, y, z);
+    monster.mesh.position.set(x, y, z);
+    monster.velocity.set(0, 0, 0);
+    serverMonsters.set(id, monster);
+    return monster;
+}
+
+// Server monsters move with the streamed velocity and are eased toward the streamed position
+function followServerMonster(monster) {
+    monster.serverPosition.add(monster.velocity);
+    monster.mesh.position.lerp(monster.serverPosition, SERVER_POSITION_CORRECTION);
+
+    // Attacking monsters still rock the boat when they reach it
+    if (monster.state === MONSTER_STATE.ATTACKING) {
+        const currentTime = getTime() / 1000;
+        if (currentTime - lastHitTime > HIT_COOLDOWN &&
+            monster.mesh.position.distanceTo(playerBoat.position) < 15) {
+            flashBoatDamage();
+            lastHitTime = currentTime;
+        }
+    }
+}
+
+function removeMonster(monster) {
+    removeMonsterOutline(monster);
+    scene.remove(monster.mesh);
+    const index = monsters.indexOf(monster);
+    if (index > -1) {
+        monsters.splice(index, 1);
+    }
+}
+
 // Helper function to create a monster by type
 function createMonsterByType(monsterType, position = null) {
     switch (monsterType) {
@@ -1,7 +1,8 @@
 import * as THREE from 'three';
 import { scene, getTime } from '../core/gameState.js';
 import { gameUI } from '../ui/ui.js';
-import { onMonsterKilled, addToInventory } from '../core/network.js';
+import { onMonsterKilled, addToInventory, fireCannonShots, onServerMonsterKilled, onCannonHit } from '../core/network.js';
+import { flashBoatDamage } from '../entities/character.js';
 import { handleMonsterTreasureDrop, removeMonsterOutline } from '../entities/seaMonsters.js';
 import { initCannonTargetingSystem, updateTargeting, isMonsterEffectivelyTargeted, isMonsterTargetedWithGreenLine } from './cannonautosystem.js';
 import { playCannonSound } from '../audio/soundEffects.js';
@@ -11,6 +12,7 @@ const CANNON_RANGE = 100; // Maximum range for cannons
 const CANNON_COOLDOWN = 0.3; // Seconds between cannon shots
 const CANNON_DAMAGE = 3; // Damage per cannon hit
 const CANNON_BALL_SPEED = 3; // Speed of cannonballs
+const SHOTS_PER_VOLLEY = 3; // One per cannon; the server ignores more
 
 // Cannon state
 let boat = null;
@@ -48,6 +50,27 @@ export function initCannons(playerBoat, seaMonsters) {
     // Expose fireCannons function globally for hotkey usage
     window.fireCannons = fireCannons;
 
+    // Kills of server-simulated monsters are decided by the server
+    onServerMonsterKilled((data) => {
+        const monster = monsters.find(m => m.serverId === data.id);
+        if (monster && !monster.localDeath) {
+            defeatMonster(monster, false);
+        }
+    });
+
+    // Show server-resolved hits near us
+    onCannonHit((hit) => {
+        createHitEffect(new THREE.Vector3(hit.x, hit.y, hit.z));
+        if (hit.ownBoat) {
+            flashBoatDamage();
+        } else if (hit.target === 'monster') {
+            const monster = monsters.find(m => m.serverId === hit.id);
+            if (monster) {
+                flashMonsterRed(monster);
+            }
+        }
+    });
+
     // Initialize the targeting system with cannons
     targetingSystem = initCannonTargetingSystem(
         playerBoat,
@@ -327,8 +350,23 @@ function playFallbackCannonSound() {
 
 // Fire at monsters
 function fireAtMonsters(targets) {
-    // For each target, calculate hit probability based on distance AND targeting
-    targets.forEach(monster => {
+    // Server monsters: send where to aim, leading each target by the ball's flight time
+    const serverTargets = targets
+        .filter(monster => monster.serverId !== undefined)
+        .sort((a, b) => a.mesh.position.distanceTo(boat.position) - b.mesh.position.distanceTo(boat.position))
+        .slice(0, SHOTS_PER_VOLLEY);
+    if (serverTargets.length > 0) {
+        fireCannonShots(serverTargets.map(monster => {
+            const flightFrames = monster.mesh.position.distanceTo(boat.position) / CANNON_BALL_SPEED;
+            return {
+                x: monster.mesh.position.x + monster.velocity.x * flightFrames,
+                z: monster.mesh.position.z + monster.velocity.z * flightFrames
+            };
+        }));
+    }
+
+    // Local monsters: calculate hit probability based on distance AND targeting
+    targets.filter(monster => monster.serverId === undefined).forEach(monster => {
         const distance = monster.mesh.position.distanceTo(boat.position);
 
         // Get targeting information
@@ -361,64 +399,19 @@ function fireAtMonsters(targets) {
 
 // Hit a monster with cannon
 function hitMonster(monster, hasGreenLine = false) {
-    // Apply damage
-    if (!monster.health) monster.health = 3; // Default health if not set
-    monster.health -= CANNON_DAMAGE;
-
     // Create hit effect
     createHitEffect(monster.mesh.position);
 
     // Make monster flash red - with more intensity if it had a green targeting line
     flashMonsterRed(monster, hasGreenLine);
 
+    // Apply damage
+    if (!monster.health) monster.health = 3; // Default health if not set
+    monster.health -= CANNON_DAMAGE;
+
     // Check if monster is defeated
     if (monster.health <= 0) {
-        // Remove the outline first before death animation
-        removeMonsterOutline(monster);
-
-        // Create treasure drop before monster disappears
-        handleMonsterTreasureDrop(monster);
-
-        // Add treasure to player's inventory
-        const treasureType = monster.type || 'common'; // Use monster type if available
-        const treasureValue = monster.value || 5; // Default value if not specified
-        const treasureColor = monster.color || 0xFFD700; // Default gold color
-
-        // Add to player's inventory using the network system
-        addToInventory({
-            item_type: 'treasure',
-            item_name: `${treasureType.charAt(0).toUpperCase() + treasureType.slice(1)} Treasure`,
-            item_data: {
-                value: treasureValue,
-                color: treasureColor,
-                description: `Treasure from defeated ${treasureType} sea monster`
-            }
-        });
-
-        // Monster is defeated, make it dive and eventually remove it
-        monster.state = 'dying';
-        monster.stateTimer = 3; // Time for death animation
-        monster.velocity.y = -0.2; // Start sinking
-
-        // Create a more dramatic death effect
-        createMonsterDeathEffect(monster.mesh.position);
-
-        onMonsterKilled(1);
-
-        // Play death sound
-        playMonsterDeathSound();
-
-        // Schedule removal after animation
-        setTimeout(() => {
-            if (monster.mesh && monster.mesh.parent) {
-                scene.remove(monster.mesh);
-                // Remove from monsters array
-                const index = monsters.indexOf(monster);
-                if (index > -1) {
-                    monsters.splice(index, 1);
-                }
-            }
-        }, 3000);
+        defeatMonster(monster, true);
     } else {
         // Monster is hit but not defeated, make it move away temporarily
         const directionFromBoat = new THREE.Vector3()
@@ -430,6 +423,61 @@ function hitMonster(monster, hasGreenLine = false) {
     }
 }
 
+// Play a defeated monster's death sequence and drop its treasure
+// (reportKill is false for server monsters, whose kill the server already counted)
+function defeatMonster(monster, reportKill) {
+    monster.localDeath = true;
+
+    // Remove the outline first before death animation
+    removeMonsterOutline(monster);
+
+    // Create treasure drop before monster disappears
+    handleMonsterTreasureDrop(monster);
+
+    // Add treasure to player's inventory
+    const treasureType = monster.type || 'common'; // Use monster type if available
+    const treasureValue = monster.value || 5; // Default value if not specified
+    const treasureColor = monster.color || 0xFFD700; // Default gold color
+
+    // Add to player's inventory using the network system
+    addToInventory({
+        item_type: 'treasure',
+        item_name: `${treasureType.charAt(0).toUpperCase() + treasureType.slice(1)} Treasure`,
+        item_data: {
+            value: treasureValue,
+            color: treasureColor,
+            description: `Treasure from defeated ${treasureType} sea monster`
+        }
+    });
+
+    // Monster is defeated, make it dive and eventually remove it
+    monster.state = 'dying';
+    monster.stateTimer = 3; // Time for death animation
+    monster.velocity.y = -0.2; // Start sinking
+
+    // Create a more dramatic death effect
+    createMonsterDeathEffect(monster.mesh.position);
+
+    if (reportKill) {
+        onMonsterKilled(1);
+    }
+
+    // Play death sound
+    playMonsterDeathSound();
+
+    // Schedule removal after animation
+    setTimeout(() => {
+        if (monster.mesh && monster.mesh.parent) {
+            scene.remove(monster.mesh);
+            // Remove from monsters array
+            const index = monsters.indexOf(monster);
+            if (index > -1) {
+                monsters.splice(index, 1);
+            }
+        }
+    }, 3000);
+}
+
 // Update the flashMonsterRed function to properly restore colors
 function flashMonsterRed(monster, hadGreenLine = false) {
     // Ensure monster has the damage flash property to track state
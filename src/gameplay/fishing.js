@@ -1,7 +1,7 @@
 import * as THREE from 'three';
 import { scene, camera } from '../core/gameState.js';
 import { gameUI } from '../ui/ui.js';
-import { onFishCaught, onMoneyEarned, addToInventory } from '../core/network.js';
+import { hookFish, landFish } from '../core/network.js';
 
 // Fishing system configuration
 const FISHING_CAST_DISTANCE = 15;
@@ -11,6 +11,7 @@ const FISH_BITE_MIN_TIME = 3;
 const FISH_BITE_MAX_TIME = 10;
 const MINIGAME_DURATION = 5; // seconds
 const MINIGAME_SPEED = 150; // pixels per second
+const HOOK_TIMEOUT = 2000; // ms to wait for the server to say which fish bit
 
 // Fish types with their rarity and value
 const FISH_TYPES = [
@@ -40,6 +41,7 @@ let fishInventory = {};
 let bobberAnimationInterval = null;
 let fishEscapeTimeout = null;
 let minigameTimeout = null;
+let hookTimeout = null;
 
 // Additional state variables for enhanced minigame
 let currentHookedFish = null;
@@ -251,7 +253,26 @@ function startMinigame() {
 
     minigameActive = true;
 
-    // Find which fish was caught based on rarity
+    // The server draws the fish from its loot tables; roll locally only when offline
+    if (hookFish(beginMinigame)) {
+        hookTimeout = setTimeout(() => {
+            hookTimeout = null;
+            minigameActive = false;
+            gameUI.elements.fishing.status.textContent = 'The fish got away!';
+            gameUI.elements.fishing.status.style.color = 'rgba(255, 100, 100, 1)';
+            setTimeout(() => {
+                if (isFishing) {
+                    resetFishingState();
+                }
+            }, 2000);
+        }, HOOK_TIMEOUT);
+    } else {
+        beginMinigame(rollLocalFish());
+    }
+}
+
+// Pick a fish by rarity, for offline play
+function rollLocalFish() {
     const rand = Math.random();
     let cumulativeRarity = 0;
     let hookedFish = FISH_TYPES[0]; // Default to most common fish
@@ -264,6 +285,19 @@ function startMinigame() {
         }
     }
 
+    return hookedFish;
+}
+
+// Run the minigame for the fish on the line
+function beginMinigame(hookedFish) {
+    if (hookTimeout) {
+        clearTimeout(hookTimeout);
+        hookTimeout = null;
+    } else if (!minigameActive) {
+        // The server answered after we gave up
+        return;
+    }
+
     // Store the current hooked fish
     currentHookedFish = hookedFish;
 
@@ -809,18 +843,15 @@ function stopEnhancedMinigame(success) {
     // Hide minigame UI
     gameUI.elements.fishing.minigame.container.style.display = 'none';
 
+    // The server awards the fish, its coins and the stats for a success
+    landFish(success);
+
     // Update inventory if fish was caught successfully
     if (success && currentHookedFish) {
         // Increment total fish caught
         fishCaught++;
         updateFishCounter();
 
-        // Call network function to update global stats
-        onFishCaught(1);
-
-        // Update money earned based on fish value
-        onMoneyEarned(currentHookedFish.value);
-
         // Add fish to inventory
         if (!fishInventory[currentHookedFish.name]) {
             fishInventory[currentHookedFish.name] = {
@@ -836,21 +867,6 @@ function stopEnhancedMinigame(success) {
         // Increment count of this specific fish
         fishInventory[currentHookedFish.name].count++;
 
-        // Add to network inventory if available
-        if (typeof addToInventory === 'function') {
-            addToInventory({
-                item_type: 'fish',
-                item_name: currentHookedFish.name,
-                item_data: {
-                    count: 1,
-                    value: currentHookedFish.value,
-                    rarity: currentHookedFish.rarity,
-                    color: currentHookedFish.color,
-                    difficulty: currentHookedFish.difficulty
-                }
-            });
-        }
-
         // Update UI
         if (gameUI && gameUI.updateInventory) {
             gameUI.updateInventory(fishInventory);
@@ -588,20 +588,12 @@ class InventoryUI {
                     if (inventoryData) {
                         console.log("Received inventory data:", inventoryData);
 
-                        // Update fish inventory display
-                        if (inventoryData.fish) {
-                            this.updateInventory(inventoryData.fish);
-                        }
-
-                        // Update treasure inventory display
-                        if (inventoryData.treasures) {
-                            this.updateTreasureInventory(inventoryData.treasures);
-                        }
+                        // Update fish and treasure inventory displays
+                        this.updateInventory(this.inventoryItems(inventoryData, 'fish', 1, 0x6699CC));
+                        this.updateTreasureInventory(this.inventoryItems(inventoryData, 'treasures', 5, 0xFFD700));
 
                         // Future: Handle cargo inventory if implemented
-                        // if (inventoryData.cargo) {
-                        //     this.updateCargoInventory(inventoryData.cargo);
-                        // }
+                        // this.updateCargoInventory(this.inventoryItems(inventoryData, 'cargo'));
                     } else {
                         console.warn("Failed to load inventory data");
                     }
@@ -641,6 +633,34 @@ class InventoryUI {
         // This will be overridden by the main UI class
     }
 
+    // Collect one inventory field's items for display: each stack (items
+    // stacked by name with a count) and each unique item (listed one by one)
+    inventoryItems(inventoryData, field, defaultValue = 1, defaultColor = 0xCCCCCC) {
+        const items = {};
+        const toItem = (name, count, data = {}) => ({
+            name,
+            count,
+            value: data.value !== undefined ? data.value : defaultValue,
+            color: data.color !== undefined ? data.color : defaultColor,
+            description: data.description || ''
+        });
+
+        const stacks = (inventoryData.stacks && inventoryData.stacks[field]) || {};
+        for (const [name, stack] of Object.entries(stacks)) {
+            if (stack.count > 0) {
+                items[name] = toItem(name, stack.count, stack.data);
+            }
+        }
+
+        (inventoryData.unique || []).forEach((item, index) => {
+            if (item.type === field) {
+                // Keyed by position so unique items with the same name stay separate
+                items[`unique:${index}`] = toItem(item.name || 'Unknown Item', 1, item.data);
+            }
+        });
+        return items;
+    }
+
     // Update fish inventory display
     updateInventory(fishInventory) {
         const fishContent = this.elements.fishContent;
@@ -649,9 +669,8 @@ class InventoryUI {
         // Clear existing content
         fishContent.innerHTML = '';
 
-        // Check for proper data format
-        if (!fishInventory || (Array.isArray(fishInventory) && fishInventory.length === 0) ||
-            (typeof fishInventory === 'object' && Object.keys(fishInventory).length === 0)) {
+        // fishInventory comes from inventoryItems(): key -> { name, count, value, color }
+        if (!fishInventory || Object.keys(fishInventory).length === 0) {
             const emptyMessage = document.createElement('div');
             emptyMessage.textContent = 'No fish caught yet. Try fishing!';
             emptyMessage.style.textAlign = 'center';
@@ -661,30 +680,6 @@ class InventoryUI {
             return;
         }
 
-        // Process the fish data into a standardized format
-        // This handles both array format from server and object format
-        let processedFish = {};
-
-        if (Array.isArray(fishInventory)) {
-            // Server format: array of fish objects
-            fishInventory.forEach(fish => {
-                const fishName = fish.name || 'Unknown Fish';
-                if (!processedFish[fishName]) {
-                    processedFish[fishName] = {
-                        name: fishName,
-                        count: 1,
-                        value: fish.data?.value || 1,
-                        color: fish.data?.color || 0x6699CC
-                    };
-                } else {
-                    processedFish[fishName].count += 1;
-                }
-            });
-        } else {
-            // Handle existing object format
-            processedFish = fishInventory;
-        }
-
         // Define fish tiers
         const tiers = [
             { name: "Legendary", color: "#FFD700", fishes: [] },  // Gold
@@ -694,11 +689,11 @@ class InventoryUI {
         ];
 
         // Sort fish into tiers
-        for (const [fishName, fishData] of Object.entries(processedFish)) {
+        for (const [fishKey, fishData] of Object.entries(fishInventory)) {
             // Ensure count and value have defaults
             const safeData = {
                 ...fishData,
-                name: fishName,
+                name: fishData.name || fishKey,
                 count: fishData.count !== undefined ? fishData.count : 1,
                 value: fishData.value !== undefined ? fishData.value : 1
             };
@@ -794,9 +789,8 @@ class InventoryUI {
         // Clear existing content
         treasureContent.innerHTML = '';
 
-        // Check for proper data format
-        if (!treasureInventory || (Array.isArray(treasureInventory) && treasureInventory.length === 0) ||
-            (typeof treasureInventory === 'object' && Object.keys(treasureInventory).length === 0)) {
+        // treasureInventory comes from inventoryItems(): key -> { name, count, value, color, description }
+        if (!treasureInventory || Object.keys(treasureInventory).length === 0) {
             const emptyMessage = document.createElement('div');
             emptyMessage.textContent = 'No treasures found yet. Defeat sea monsters to collect treasures!';
             emptyMessage.style.textAlign = 'center';
@@ -806,30 +800,6 @@ class InventoryUI {
             return;
         }
 
-        // Process the treasure data into a standardized format
-        let processedTreasures = {};
-
-        if (Array.isArray(treasureInventory)) {
-            // Server format: array of treasure objects
-            treasureInventory.forEach(treasure => {
-                const treasureName = treasure.name || 'Unknown Treasure';
-                if (!processedTreasures[treasureName]) {
-                    processedTreasures[treasureName] = {
-                        name: treasureName,
-                        count: 1,
-                        value: treasure.data?.value || 5,
-                        color: treasure.data?.color || 0xFFD700,
-                        description: treasure.data?.description || ''
-                    };
-                } else {
-                    processedTreasures[treasureName].count += 1;
-                }
-            });
-        } else {
-            // Handle existing object format
-            processedTreasures = treasureInventory;
-        }
-
         // Create treasure grid
         const treasureGrid = document.createElement('div');
         treasureGrid.style.display = 'grid';
@@ -838,7 +808,8 @@ class InventoryUI {
         treasureGrid.style.padding = '10px';
 
         // Add each treasure to the grid
-        for (const [treasureName, treasureData] of Object.entries(processedTreasures)) {
+        for (const [treasureKey, treasureData] of Object.entries(treasureInventory)) {
+            const treasureName = treasureData.name || treasureKey;
             const treasureCard = document.createElement('div');
             treasureCard.style.backgroundColor = 'rgba(50, 70, 110, 0.7)';
             treasureCard.style.borderRadius = '5px';